@@ -0,0 +1,436 @@
+"""
+基于矩阵分解（交替最小二乘 ALS）的推荐系统实现
+把评分矩阵分解为 用户因子(U×d) 与 电影因子(M×d)，模型大小为 O((U+M)·d)；
+在线推荐只需一次 d 维用户向量与电影因子矩阵的乘法
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from data_loader import RatingMatrix
+from local_cache import LocalArrayCache
+from matrix_codec import encode_array, decode_array
+from recommender import DEFAULT_CACHE_DIR, _setting
+from redis_pool import redis_available
+from serving import ServingMixin
+
+# 用户/电影偏置的正则化强度（显式评分模式）
+_BIAS_REGULARIZATION = 10.0
+# 批量求解时每批的最大行数
+_SOLVE_BATCH = 1024
+
+
+def _solve_side(ratings, fixed, regularization, implicit, alpha):
+    """
+    固定一侧因子，求解另一侧每一行的因子（ALS的半步）
+
+    各行按评分数排序后分批，把一批行的因子补零对齐成 (B, L, d) 的三维数组，
+    正规方程 AᵀA 由批量矩阵乘法（BLAS）一次算出，再用批量 np.linalg.solve 求解
+
+    参数:
+        ratings (csr_matrix): 待求解一侧为行的评分（显式模式为去除偏置后的残差）
+        fixed (ndarray): 另一侧的因子矩阵 (n_fixed × d)
+        regularization (float): L2正则化系数
+        implicit (bool): 是否为隐式反馈模式（评分视为置信度）
+        alpha (float): 隐式反馈的置信度系数 c = 1 + alpha·r
+
+    返回:
+        ndarray: 求解得到的因子矩阵 (n_rows × d)
+    """
+    n_rows, d = ratings.shape[0], fixed.shape[1]
+    solved = np.zeros((n_rows, d), dtype=np.float64)
+    eye = np.eye(d)
+    # 隐式模式下所有行共享 YᵀY（一次BLAS矩阵乘法）
+    gram = fixed.T @ fixed if implicit else None
+
+    counts = np.diff(ratings.indptr)
+    order = np.argsort(counts, kind='stable')
+    start = 0
+    while start < n_rows:
+        # 每批补零后的元素数不超过 _SOLVE_BATCH 行 × 平均长度，避免长行拖大整批
+        width = max(int(counts[order[start]]), 1)
+        end = start + 1
+        while end < n_rows and end - start < _SOLVE_BATCH and \
+                (end - start + 1) * max(int(counts[order[end]]), 1) <= _SOLVE_BATCH * width * 2:
+            end += 1
+        rows = order[start:end]
+        width = max(int(counts[rows[-1]]), 1)
+
+        # 补零对齐: factors (B, L, d)，values (B, L)
+        lengths = counts[rows]
+        offsets = np.arange(width)
+        valid = offsets[None, :] < lengths[:, None]
+        positions = np.where(valid, ratings.indptr[rows][:, None] + offsets[None, :], 0)
+        factors = fixed[ratings.indices[positions]]
+        factors[~valid] = 0.0
+        values = ratings.data[positions]
+        values[~valid] = 0.0
+
+        if implicit:
+            # A = YᵀY + Yᵀ(C-I)Y + λI,  b = YᵀC·1
+            confidence = alpha * values
+            lhs = gram + np.matmul(factors.transpose(0, 2, 1) * confidence[:, None, :], factors) \
+                + regularization * eye
+            rhs = np.matmul(factors.transpose(0, 2, 1), ((1.0 + confidence) * valid)[..., None])
+        else:
+            # A = YᵀY + λ·n·I（按评分数缩放正则项）,  b = Yᵀr
+            lhs = np.matmul(factors.transpose(0, 2, 1), factors) \
+                + (regularization * np.maximum(lengths, 1))[:, None, None] * eye
+            rhs = np.matmul(factors.transpose(0, 2, 1), values[..., None])
+        solved[rows] = np.linalg.solve(lhs, rhs)[..., 0]
+        start = end
+    return solved
+
+
+class ALSRecommender(ServingMixin):
+    def __init__(self, user_movie_ratings, movie_info, factors=None, regularization=0.05, iterations=None,
+                 implicit=False, alpha=40.0, seed=42, cache_dir=DEFAULT_CACHE_DIR, redis_client=None):
+        """
+        初始化矩阵分解推荐系统
+
+        显式传入的参数优先；为None的参数读取对应的环境变量（括号中），未设置时使用默认值
+
+        参数:
+            user_movie_ratings (DataFrame | RatingMatrix): 用户-电影评分矩阵（行:用户, 列:电影）
+            movie_info (DataFrame): 电影元数据信息
+            factors (int): 隐因子维数 d（ALS_FACTORS，默认64）
+            regularization (float): L2正则化系数
+            iterations (int): ALS交替迭代次数（ALS_ITERATIONS，默认10）
+            implicit (bool): 隐式反馈模式（评分作为置信度，预测值为0~1的偏好分）
+            alpha (float): 隐式反馈置信度系数
+            seed (int): 因子初始化随机种子
+            cache_dir (str): 本地模型缓存目录（None表示不使用本地缓存；
+                使用默认目录时可由 SIMILARITY_CACHE_DIR 替换）
+            redis_client: Redis客户端（提供时模型同时持久化到Redis，见 redis_pool.get_redis_client）
+
+        属性:
+            user_factors / item_factors: 用户与电影因子（float32）
+            user_bias / item_bias / global_mean: 显式评分模式下的基线偏置
+        """
+        if not isinstance(user_movie_ratings, RatingMatrix):
+            user_movie_ratings = RatingMatrix.from_dataframe(user_movie_ratings)
+        self.user_movie_ratings = user_movie_ratings
+        self.movie_info = movie_info
+        self.factors = int(_setting(factors, 'ALS_FACTORS', 64))
+        self.regularization = regularization
+        self.iterations = int(_setting(iterations, 'ALS_ITERATIONS', 10))
+        self.implicit = implicit
+        self.alpha = alpha
+        self.seed = seed
+        self.redis_client = redis_client
+        self.cache_key = "als_model"
+
+        self.user_factors = None
+        self.item_factors = None
+        self.user_bias = None
+        self.item_bias = None
+        self.global_mean = 0.0
+        self.rating_range = (0.0, 0.0)  # 训练数据的评分范围，显式模式下预测评分截断到此范围
+        self._fingerprint = None
+        # 评分变更、fold-in与模型数组的发布在同一把锁下进行（训练本身在锁外）
+        self._model_lock = threading.RLock()
+        self._pending_users = set()  # 模型就绪前或训练期间评分发生变化的用户（模型发布时补做fold-in）
+        self._fitting = 0  # 进行中的训练（或缓存加载）次数
+
+        self.local_cache = None
+        if cache_dir == DEFAULT_CACHE_DIR:
+            cache_dir = os.getenv('SIMILARITY_CACHE_DIR', cache_dir)
+        if cache_dir:
+            try:
+                self.local_cache = LocalArrayCache(cache_dir)
+            except OSError as e:
+                print(f"警告: 无法创建本地缓存目录 {cache_dir}: {e}")
+
+    def _model_name(self):
+        """模型缓存名（评分数据指纹 + 训练参数）"""
+        if self._fingerprint is None:
+            self._fingerprint = self.user_movie_ratings.fingerprint()
+        mode = 'implicit' if self.implicit else 'explicit'
+        return f"als_{mode}_d{self.factors}_it{self.iterations}_{self._fingerprint}"
+
+    def _model_arrays(self):
+        """需要持久化的模型数组（全局均值与评分范围合并为一个小数组保存）"""
+        return {
+            'users': self.user_factors,
+            'items': self.item_factors,
+            'user_bias': self.user_bias,
+            'item_bias': self.item_bias,
+            'stats': np.array([self.global_mean, *self.rating_range]),
+        }
+
+    def _set_model_arrays(self, arrays):
+        """
+        在锁内一次性发布全部模型数组，并对等待中的用户补做fold-in
+
+        fold-in不会看到新旧混合的模型；训练期间评分发生变化的用户在发布的同时补做，不会遗漏
+        """
+        global_mean, *rating_range = (float(value) for value in arrays['stats'])
+        with self._model_lock:
+            self.user_factors = arrays['users']
+            self.item_factors = arrays['items']
+            self.user_bias = arrays['user_bias']
+            self.item_bias = arrays['item_bias']
+            self.global_mean, self.rating_range = global_mean, tuple(rating_range)
+            pending, self._pending_users = self._pending_users, set()
+            for user_idx in pending:
+                self._fold_in_user(user_idx)
+
+    def save_model(self, path):
+        """把模型保存为 .npz 文件"""
+        np.savez(path, **self._model_arrays())
+
+    def load_model(self, path):
+        """从 save_model 保存的 .npz 文件加载模型"""
+        with np.load(path) as data:
+            self._set_model_arrays({name: data[name] for name in data.files})
+
+    def _load_cached_model(self, name):
+        """
+        依次尝试本地缓存和Redis中指定名称的模型
+
+        返回:
+            dict or None: 模型数组（未命中时返回None）
+        """
+        fields = list(self._model_arrays())
+
+        if self.local_cache is not None:
+            arrays = {field: self.local_cache.load(f"{name}_{field}") for field in fields}
+            if all(array is not None for array in arrays.values()):
+                print("[本地缓存] 从内存映射文件加载ALS模型")
+                return arrays
+
+        if redis_available(self.redis_client):
+            try:
+                payloads = self.redis_client.mget([f"{self.cache_key}:{name}:{field}" for field in fields])
+            except Exception as e:
+                print(f"[Redis] 缓存加载失败: {e}, 将重新训练")
+                return None
+            if all(payloads):
+                print("[Redis] 从缓存加载ALS模型")
+                arrays = {field: decode_array(data) for field, data in zip(fields, payloads)}
+                return self._write_local_model(name, arrays) or arrays
+        return None
+
+    def _write_local_model(self, name, arrays):
+        """
+        把模型写入本地缓存，返回文件的只读内存映射（同机的worker进程共享同一份页缓存）
+
+        返回:
+            dict or None: 内存映射的模型数组（未启用本地缓存或写入失败时返回None）
+        """
+        if self.local_cache is None:
+            return None
+        try:
+            for field, array in arrays.items():
+                self.local_cache.save(f"{name}_{field}", array)
+            # 删除同参数下旧指纹的模型文件
+            prefix = name.rsplit('_', 1)[0] + '_'
+            self.local_cache.remove(prefix, keep=[f"{name}_{field}" for field in arrays])
+        except OSError as e:
+            print(f"[本地缓存] 写入失败: {e}")
+            return None
+        mapped = {field: self.local_cache.load(f"{name}_{field}") for field in arrays}
+        return mapped if all(array is not None for array in mapped.values()) else None
+
+    def _save_cached_model(self, name, arrays):
+        """把模型以指定名称（训练所用评分的指纹）写入本地缓存和Redis"""
+        mapped = self._write_local_model(name, arrays)
+        if mapped is not None:
+            with self._model_lock:
+                if self._model_name() == name:  # 否则训练后评分已变化，内存中的模型比文件新
+                    self._set_model_arrays(mapped)
+        if redis_available(self.redis_client):
+            try:
+                pipeline = self.redis_client.pipeline()
+                for field, array in arrays.items():
+                    pipeline.setex(f"{self.cache_key}:{name}:{field}", 86400, encode_array(array))
+                pipeline.execute()
+                print("[Redis] ALS模型已缓存")
+            except Exception as e:
+                print(f"[Redis] 缓存存储失败: {e}")
+
+    def fit(self, force_recompute=False):
+        """
+        训练ALS模型（优先加载缓存）
+
+        显式评分模式: 评分 ≈ 全局均值 + 用户偏置 + 电影偏置 + 用户因子·电影因子；
+        隐式反馈模式: 偏好(是否评分) 以 1 + alpha·评分 为置信度加权拟合
+
+        训练在锁外进行，期间的评分变更在模型发布时补做fold-in；模型以训练所用评分的指纹缓存
+        """
+        with self._model_lock:
+            self._fitting += 1
+            matrix = self.user_movie_ratings.matrix
+            name = self._model_name()
+        arrays = trained = None
+        try:
+            arrays = None if force_recompute else self._load_cached_model(name)
+            if arrays is None:
+                arrays = trained = self._train(matrix)
+        finally:
+            with self._model_lock:
+                self._fitting -= 1
+                if arrays is not None:
+                    self._set_model_arrays(arrays)
+        if trained is not None:
+            self._save_cached_model(name, trained)
+
+    def _train(self, matrix):
+        """
+        在评分矩阵快照上训练模型
+
+        返回:
+            dict: 模型数组（格式同 _model_arrays）
+        """
+        n_users, n_movies = matrix.shape
+        rng = np.random.default_rng(self.seed)
+        user_factors = rng.normal(0, 0.01, (n_users, self.factors))
+        item_factors = rng.normal(0, 0.01, (n_movies, self.factors))
+        rows = np.repeat(np.arange(n_users), np.diff(matrix.indptr))
+
+        user_bias, item_bias, global_mean = np.zeros(n_users), np.zeros(n_movies), 0.0
+        targets = matrix.copy()
+        if not self.implicit and matrix.nnz:
+            global_mean, user_bias, item_bias = self._fit_biases(matrix, rows)
+            targets.data = matrix.data - global_mean - user_bias[rows] - item_bias[matrix.indices]
+        targets_t = targets.T.tocsr()
+
+        print(f"训练ALS模型 (d={self.factors}, 迭代{self.iterations}次)...")
+        for iteration in range(self.iterations):
+            user_factors = _solve_side(targets, item_factors, self.regularization, self.implicit, self.alpha)
+            item_factors = _solve_side(targets_t, user_factors, self.regularization, self.implicit, self.alpha)
+            if not self.implicit:
+                residual = targets.data - np.einsum('ij,ij->i', user_factors[rows], item_factors[matrix.indices])
+                print(f"  迭代 {iteration + 1}/{self.iterations}: 训练RMSE {np.sqrt(np.mean(residual ** 2)):.4f}")
+
+        rating_range = (matrix.data.min(), matrix.data.max()) if matrix.nnz else (0.0, 0.0)
+        arrays = {
+            'users': user_factors.astype(np.float32),
+            'items': item_factors.astype(np.float32),
+            'user_bias': user_bias.astype(np.float32),
+            'item_bias': item_bias.astype(np.float32),
+            'stats': np.array([global_mean, *rating_range], dtype=np.float64),
+        }
+        return arrays
+
+    def _fit_biases(self, matrix, rows, n_passes=5):
+        """交替估计正则化的用户/电影偏置"""
+        global_mean = matrix.data.mean()
+        user_counts = np.bincount(rows, minlength=matrix.shape[0])
+        item_counts = np.bincount(matrix.indices, minlength=matrix.shape[1])
+        user_bias, item_bias = np.zeros(matrix.shape[0]), np.zeros(matrix.shape[1])
+        for _ in range(n_passes):
+            residual = matrix.data - global_mean - item_bias[matrix.indices]
+            user_bias = np.bincount(rows, residual, len(user_bias)) / (user_counts + _BIAS_REGULARIZATION)
+            residual = matrix.data - global_mean - user_bias[rows]
+            item_bias = np.bincount(matrix.indices, residual, len(item_bias)) / (item_counts + _BIAS_REGULARIZATION)
+        return global_mean, user_bias, item_bias
+
+    def _ensure_model(self):
+        """确保模型已训练或加载"""
+        if self.user_factors is None:
+            self.fit()
+
+    def warm_up(self):
+        """预热: 训练（或加载）模型（训练期间评分发生变化的用户在模型发布时补做fold-in）"""
+        self._ensure_model()
+        super().warm_up()
+
+    def apply_rating(self, user_id, movie_id, rating):
+        """
+        写入（新增或修改）一条评分，并只重新求解该用户的因子（fold-in），
+        电影因子保持不变，下次重新训练时更新
+        """
+        with self._model_lock:
+            user_idx, _ = self.user_movie_ratings.set_rating(user_id, movie_id, rating)
+            self._fold_in_user(user_idx)
+
+    def remove_rating(self, user_id, movie_id):
+        """删除一条评分并重新求解该用户的因子"""
+        with self._model_lock:
+            user_idx = self.user_movie_ratings.remove_rating(user_id, movie_id)
+            if user_idx is not None:
+                self._fold_in_user(user_idx)
+
+    def _fold_in_user(self, user_idx):
+        """
+        在电影因子固定的情况下重新求解某个用户的因子（新用户/新电影追加零向量）
+
+        调用方持有_model_lock，且评分写入与本方法在同一次加锁内完成
+        """
+        self._fingerprint = None
+        if self._fitting or self.user_factors is None:
+            # 正在训练的模型不一定包含这次变更，发布时再补做
+            self._pending_users.add(user_idx)
+            if self.user_factors is None:
+                return
+        n_users, n_movies = self.user_movie_ratings.shape
+        if n_movies > len(self.item_factors):
+            extra = n_movies - len(self.item_factors)
+            self.item_factors = np.vstack([self.item_factors, np.zeros((extra, self.factors), np.float32)])
+            self.item_bias = np.append(self.item_bias, np.zeros(extra, np.float32))
+        if n_users > len(self.user_factors):
+            extra = n_users - len(self.user_factors)
+            self.user_factors = np.vstack([self.user_factors, np.zeros((extra, self.factors), np.float32)])
+            self.user_bias = np.append(self.user_bias, np.zeros(extra, np.float32))
+        elif not self.user_factors.flags.writeable:
+            self.user_factors, self.user_bias = np.array(self.user_factors), np.array(self.user_bias)
+
+        cols, values = self.user_movie_ratings.user_row(user_idx)
+        row = self.user_movie_ratings.matrix[user_idx]
+        item_factors = self.item_factors.astype(np.float64)
+        if not self.implicit:
+            residual = values - self.global_mean - self.item_bias[cols]
+            bias = residual.sum() / (len(values) + _BIAS_REGULARIZATION)
+            row.data = residual - bias
+            self.user_bias[user_idx] = bias
+        self.user_factors[user_idx] = _solve_side(row, item_factors, self.regularization, self.implicit,
+                                                  self.alpha)[0]
+
+    def predict_user(self, user_idx):
+        """某用户对所有电影的预测评分（一次 M×d 矩阵与 d 维向量的乘法）"""
+        scores = self.item_factors @ self.user_factors[user_idx]
+        if self.implicit:
+            return scores
+        scores += self.item_bias
+        scores += self.global_mean + self.user_bias[user_idx]
+        return scores
+
+    def recommend_items(self, user_id, k=None, n=10, min_similarity=None):
+        """
+        生成个性化电影推荐（与 UserCFRecommender.recommend_items 返回格式一致）
+
+        参数:
+            user_id: 目标用户ID
+            k, min_similarity: 仅为接口兼容保留，矩阵分解模型不使用
+            n: 返回的推荐电影数量（默认10）
+
+        返回:
+            list: 推荐电影列表，按预测评分排序（隐式反馈模式下为偏好分）
+        """
+        self._ensure_model()
+
+        try:
+            ratings = self.user_movie_ratings
+            user_idx = ratings.user_loc(user_id)
+            rated_cols = ratings.user_row(user_idx)[0]
+            if len(rated_cols) == 0:
+                return self._get_fallback_recommendations(n)
+
+            scores = self.predict_user(user_idx)
+            scores[rated_cols] = -np.inf
+            top_cols, top_scores = self._top_n(np.arange(len(scores)), scores, n)
+            unrated = np.isfinite(top_scores)
+            top_cols, top_scores = top_cols[unrated], top_scores[unrated].astype(np.float64)
+            if not self.implicit:
+                top_scores = np.clip(top_scores, *self.rating_range)
+            return self._format_recommendations(top_cols, top_scores)
+
+        except KeyError:
+            print(f"错误: 用户ID {user_id} 不存在，返回热门电影")
+            return self._get_fallback_recommendations(n)
+        except Exception as e:
+            print(f"推荐过程中出错: {e}")
+            return self._get_fallback_recommendations(n)
@@ -0,0 +1,168 @@
+"""
+近似最近邻用户索引（IVF: 倒排文件 + 球面k-means）
+在单位化的中心化评分向量上聚类，每个用户只与其最接近的nprobe个簇中的用户比较，
+向量内积即皮尔逊相似度；nprobe越大召回率越高、速度越慢
+
+构建代价: 分配与搜索各为 O(N·√N·nprobe) 次稀疏向量内积（簇数默认为√N，每个用户与nprobe个簇的成员比较），
+比精确构建的 O(N²) 少一个 √N/nprobe 的因子，但仍是超线性的
+"""
+
+import numpy as np
+import scipy.sparse as sp
+
+# k-means 训练时每个簇的最大采样点数（与簇数相乘得到采样规模）
+_TRAIN_POINTS_PER_LIST = 64
+# 搜索时单个相似度块的最大元素数（簇大小不均衡时按查询分批）
+_MAX_BLOCK_CELLS = 4_000_000
+
+
+def normalize_rows(centered, norms):
+    """把中心化评分矩阵的每行缩放为单位向量（零向量保持为零）"""
+    scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return sp.diags(scale) @ centered
+
+
+class IVFIndex:
+    def __init__(self, n_lists=None, nprobe=8, n_iter=10, seed=42):
+        """
+        初始化IVF索引
+
+        参数:
+            n_lists (int): 簇（倒排列表）数量（None表示取 sqrt(用户数)）
+            nprobe (int): 每个用户搜索的簇数（召回率与速度的权衡参数）
+            n_iter (int): k-means迭代次数
+            seed (int): 随机种子
+        """
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids = None
+        self.list_offsets = None
+        self.list_members = None
+
+    def fit(self, vectors):
+        """
+        在采样的用户上训练球面k-means，再把全部用户分配到最近的簇
+
+        参数:
+            vectors (csr_matrix): 单位化的用户向量（见 normalize_rows）
+
+        返回:
+            IVFIndex: self
+        """
+        n_users = vectors.shape[0]
+        n_lists = self.n_lists or int(np.sqrt(n_users))
+        n_lists = max(1, min(n_lists, n_users))
+        rng = np.random.default_rng(self.seed)
+
+        sample_size = min(n_users, n_lists * _TRAIN_POINTS_PER_LIST)
+        sample = vectors[rng.choice(n_users, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].toarray()
+
+        for _ in range(self.n_iter):
+            assign = np.asarray((sample @ centroids.T).argmax(axis=1)).ravel()
+            membership = sp.csr_matrix((np.ones(sample_size), (assign, np.arange(sample_size))),
+                                       shape=(n_lists, sample_size))
+            sums = np.asarray((membership @ sample).todense())
+            lengths = np.linalg.norm(sums, axis=1)
+            # 空簇重新随机选一个样本作为中心
+            empty = lengths == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)].toarray()
+                lengths[empty] = np.maximum(np.linalg.norm(sums[empty], axis=1), 1.0)
+            centroids = sums / lengths[:, None]
+
+        self.centroids = centroids
+        assign = self._probe(vectors, 1)[:, 0]
+        self.list_members = np.argsort(assign, kind='stable').astype(np.int32)
+        self.list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=n_lists))))
+        return self
+
+    def _probe(self, vectors, nprobe, block_rows=4096):
+        """每个向量最接近的nprobe个簇（分块计算，避免生成完整的 N × 簇数 矩阵）"""
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.empty((vectors.shape[0], nprobe), dtype=np.int32)
+        for start in range(0, vectors.shape[0], block_rows):
+            scores = np.asarray(vectors[start:start + block_rows] @ self.centroids.T)
+            if nprobe < scores.shape[1]:
+                probes[start:start + block_rows] = np.argpartition(-scores, nprobe - 1, axis=1)[:, :nprobe]
+            else:
+                probes[start:start + block_rows] = np.arange(nprobe)
+        return probes
+
+    def search_all(self, vectors, k):
+        """
+        为索引中的每个用户查找近似TopK邻居（结果格式与 build_neighbor_index 一致）
+
+        逐簇处理: 取出所有探测该簇的用户与簇内成员计算相似度块，并与这些用户当前的候选合并；
+        相似度是对称的，同一个块转置后也用于更新簇内成员的候选（召回率明显提高，计算量不变）。
+        同一对用户最多被计算两次，因此候选缓冲区保留2k个，最后去重后取前k个
+
+        返回:
+            ids (ndarray[int32]): 形状 (N, k)，按相似度降序；候选不足k个时以 -1 补位
+            sims (ndarray[float32]): 对应相似度（补位处为 -inf，低于任何阈值，调用方按相似度过滤即可）
+        """
+        n_users = vectors.shape[0]
+        k = min(k, n_users - 1)
+        if k <= 0:
+            return np.zeros((n_users, 0), dtype=np.int32), np.zeros((n_users, 0), dtype=np.float32)
+        buffer = min(2 * k, n_users - 1)
+        best_ids = np.full((n_users, buffer), -1, dtype=np.int32)
+        best_sims = np.full((n_users, buffer), -np.inf, dtype=np.float32)
+
+        probes = self._probe(vectors, self.nprobe)
+        query_order = np.argsort(probes.ravel(), kind='stable')
+        query_offsets = np.concatenate(([0], np.cumsum(np.bincount(probes.ravel(), minlength=len(self.centroids)))))
+        n_probe = probes.shape[1]
+
+        for c in range(len(self.centroids)):
+            members = self.list_members[self.list_offsets[c]:self.list_offsets[c + 1]]
+            list_queries = query_order[query_offsets[c]:query_offsets[c + 1]] // n_probe
+            if len(members) == 0 or len(list_queries) == 0:
+                continue
+            members_t = vectors[members].T.tocsr()
+            step = max(1, _MAX_BLOCK_CELLS // len(members))
+            for start in range(0, len(list_queries), step):
+                queries = list_queries[start:start + step]
+                block = (vectors[queries] @ members_t).toarray().astype(np.float32)
+                block[queries[:, None] == members[None, :]] = -np.inf  # 排除自身
+
+                _merge_candidates(best_ids, best_sims, queries, members, block)
+                _merge_candidates(best_ids, best_sims, members, queries, block.T)
+
+        # 去重: 按用户位置排序后，与前一项相同的候选作废
+        order = np.argsort(best_ids, axis=1, kind='stable')
+        best_ids = np.take_along_axis(best_ids, order, axis=1)
+        best_sims = np.take_along_axis(best_sims, order, axis=1)
+        best_sims[:, 1:][best_ids[:, 1:] == best_ids[:, :-1]] = -np.inf
+        best_ids[~np.isfinite(best_sims)] = -1
+
+        top = np.argpartition(-best_sims, k - 1, axis=1)[:, :k] if k < buffer else np.arange(buffer)[None, :]
+        top_sims = np.take_along_axis(best_sims, top, axis=1)
+        order = np.argsort(-top_sims, axis=1, kind='stable')
+        ids = np.take_along_axis(np.take_along_axis(best_ids, top, axis=1), order, axis=1)
+        sims = np.take_along_axis(top_sims, order, axis=1)
+        return ids, sims
+
+
+def _merge_candidates(best_ids, best_sims, rows, cols, block):
+    """把相似度块 (rows × cols) 合并进这些行的候选缓冲区，保留相似度最高的部分"""
+    buffer = best_ids.shape[1]
+    cand_ids = np.hstack([best_ids[rows], np.broadcast_to(cols, block.shape)])
+    cand_sims = np.hstack([best_sims[rows], block])
+    top = np.argpartition(-cand_sims, buffer - 1, axis=1)[:, :buffer]
+    best_ids[rows] = np.take_along_axis(cand_ids, top, axis=1)
+    best_sims[rows] = np.take_along_axis(cand_sims, top, axis=1)
+
+
+def build_approximate_neighbor_index(centered, norms, k, nprobe=8, n_lists=None):
+    """
+    用IVF索引近似构建每个用户的TopK邻居表
+
+    返回:
+        ids (ndarray[int32]), sims (ndarray[float32]): 与 build_neighbor_index 格式相同
+    """
+    vectors = normalize_rows(centered, norms).tocsr()
+    index = IVFIndex(n_lists=n_lists, nprobe=nprobe).fit(vectors)
+    return index.search_all(vectors, k)
@@ -6,11 +6,17 @@ Flask电影推荐系统应用
 from flask import Flask, render_template, request, redirect, url_for
 from data_loader import load_data, preprocess_data
 from recommender import UserCFRecommender
+from item_recommender import ItemCFRecommender
+from als_recommender import ALSRecommender
+from result_cache import RecommendationCache, compute_data_version
+from redis_pool import get_redis_client
 from utils import get_movie_details, get_user_rated_movies, get_top_rated_movies, save_comments, load_comments, \
     save_feedback, load_feedback
 import pandas as pd
 from datetime import datetime
 import os  # 添加这行
+import threading
+import time
 from flask import session
 from flask import jsonify
 # 初始化Flask应用
@@ -21,6 +27,30 @@ app.secret_key = 'your_secret_key_here'
 movies, ratings = None, None  # 存储电影和评分数据
 movie_ratings, user_movie_ratings, movie_info = None, None, None  # 预处理后的数据
 recommender, top_movies = None, None  # 推荐系统和热门电影
+item_recommender = None  # 基于物品的推荐系统（提供相似电影）
+result_cache = RecommendationCache()  # 推荐结果缓存（Redis层在初始化数据时接入进程内共享的客户端）
+# 模型预热状态（后台线程构建/加载相似度或模型，就绪前推荐接口返回热门电影）
+# 状态取值: loading / ready / failed（失败后由后续请求重新发起预热）
+model_status = {'recommender': 'loading', 'similar_movies': 'loading', 'error': None, 'started_at': None,
+                'ready_at': None, 'failed_at': None}
+warm_up_thread = None
+warm_up_lock = threading.RLock()
+
+
+def create_recommender(user_movie_ratings, movie_info):
+    """
+    按配置创建推荐引擎（环境变量 RECOMMENDER_ENGINE）
+    user_cf: 基于用户的协同过滤（默认）; item_cf: 基于物品的协同过滤; als: 矩阵分解
+    """
+    engine = os.getenv('RECOMMENDER_ENGINE', 'user_cf').lower()
+    if engine == 'item_cf':
+        return ItemCFRecommender(user_movie_ratings, movie_info, neighbor_k=50)
+    if engine == 'als':
+        return ALSRecommender(user_movie_ratings, movie_info, redis_client=get_redis_client())
+    if engine != 'user_cf':
+        print(f"警告: 未知的推荐引擎 {engine}，使用 user_cf")
+    # 基于用户的协同过滤只保留每个用户的Top50邻居
+    return UserCFRecommender(user_movie_ratings, movie_info, neighbor_k=50)
 
 
 def initialize_data():
@@ -28,7 +58,7 @@ def initialize_data():
     初始化加载并预处理所有数据
     包括加载CSV文件、预处理数据集和初始化推荐系统
     """
-    global movies, ratings, movie_ratings, user_movie_ratings, movie_info, recommender, top_movies
+    global movies, ratings, movie_ratings, user_movie_ratings, movie_info, recommender, top_movies, item_recommender
 
     # 加载原始数据
     movies, ratings = load_data()
@@ -36,22 +66,216 @@ def initialize_data():
     # 确保数据加载成功
     if movies is not None and ratings is not None:
         # 预处理数据
-        movie_ratings, user_movie_ratings, movie_info = preprocess_data(movies, ratings)
+        movie_ratings, user_movie_ratings, movie_info = preprocess_data(movies, ratings, sparse=True)
+        # 评分矩阵发布为本地内存映射文件，同一台机器上的worker进程共享一份物理内存
+        user_movie_ratings = user_movie_ratings.share(os.getenv('SIMILARITY_CACHE_DIR', 'data/cache'))
 
-        # 初始化基于用户的协同过滤推荐系统
-        recommender = UserCFRecommender(user_movie_ratings, movie_info)
+        # 初始化推荐系统（引擎由 RECOMMENDER_ENGINE 配置）
+        recommender = create_recommender(user_movie_ratings, movie_info)
+
+        # 相似电影表（与用户推荐共用同一评分矩阵，首次查询相似电影时构建）
+        if isinstance(recommender, ItemCFRecommender):
+            item_recommender = recommender
+        else:
+            item_recommender = ItemCFRecommender(user_movie_ratings, movie_info, neighbor_k=50)
+
+        # 推荐结果缓存：数据重新加载（如电影增删改）后切换到新的数据版本
+        result_cache.redis_client = get_redis_client()
+        result_cache.set_data_version(compute_data_version(user_movie_ratings, movie_info, type(recommender).__name__))
 
         # 获取热门电影（基于平均评分）
         top_movies = get_top_rated_movies(movies, ratings)
+
+        # 相似度/模型在后台线程中构建或加载，不阻塞启动和请求
+        start_warm_up(recommender, item_recommender)
     else:
         # 数据加载失败处理
         print("无法加载数据，请确保已运行scraper.py爬取数据")
 
 
-# 首次启动时初始化数据
+def start_warm_up(model, item_model, keys=('recommender', 'similar_movies')):
+    """
+    启动后台预热线程（数据重新加载后再次调用，旧线程完成时不会覆盖新模型的状态）
+
+    参数:
+        keys: 需要预热的部分（失败后重试时只重新预热失败的部分，已就绪的部分继续服务）
+    """
+    global warm_up_thread
+    with warm_up_lock:
+        model_status.update({key: 'loading' for key in keys}, error=None, failed_at=None)
+        if 'recommender' in keys:
+            model_status.update(started_at=time.time(), ready_at=None)
+        warm_up_thread = threading.Thread(target=warm_up_models, args=(model, item_model, keys),
+                                          name='model-warm-up', daemon=True)
+        warm_up_thread.start()
+
+
+def warm_up_models(model, item_model, keys=('recommender', 'similar_movies')):
+    """
+    后台预热: 先构建推荐引擎，再构建相似电影表（两者是同一对象时第二次预热不会重复构建）
+
+    失败时按指数退避重试（WARM_UP_RETRIES次，首次间隔WARM_UP_RETRY_BACKOFF秒），仍失败时状态记为failed
+    """
+    retries = int(os.getenv('WARM_UP_RETRIES', 2))
+    backoff = float(os.getenv('WARM_UP_RETRY_BACKOFF', 5))
+    targets = {'recommender': model, 'similar_movies': item_model}
+    for key in keys:
+        for attempt in range(retries + 1):
+            try:
+                targets[key].warm_up()
+                state, error = 'ready', None
+                break
+            except Exception as e:
+                state, error = 'failed', str(e)
+                if attempt == retries or model is not recommender:
+                    print(f"模型预热失败({key}): {e}")
+                    break
+                delay = backoff * 2 ** attempt
+                print(f"模型预热失败({key}): {e}，{delay:g}秒后重试")
+                time.sleep(delay)
+        if model is not recommender:
+            return  # 数据已重新加载，这批模型已被替换
+        model_status[key] = state
+        if error:
+            model_status.update(error=error, failed_at=time.time())
+        if key == 'recommender' and state == 'ready':
+            model_status['ready_at'] = time.time()
+            print(f"推荐模型预热完成，用时 {model_status['ready_at'] - model_status['started_at']:.1f}s")
+
+
+def retry_failed_warm_up():
+    """
+    预热失败后重新发起预热（只重试失败的部分）
+
+    距上次失败超过WARM_UP_RETRY_INTERVAL秒且没有正在进行的预热时才发起，
+    避免每个请求都触发一次昂贵的构建；Redis等依赖恢复后模型自动就绪
+    """
+    interval = float(os.getenv('WARM_UP_RETRY_INTERVAL', 60))
+    with warm_up_lock:
+        failed = tuple(key for key in ('recommender', 'similar_movies') if model_status[key] == 'failed')
+        if not failed or recommender is None:
+            return
+        if time.time() - (model_status['failed_at'] or 0) < interval:
+            return
+        if warm_up_thread is not None and warm_up_thread.is_alive():
+            return
+        print(f"重新预热上次失败的模型: {', '.join(failed)}")
+        start_warm_up(recommender, item_recommender, failed)
+
+
+def model_ready():
+    """推荐引擎是否已完成预热"""
+    return recommender is not None and model_status['recommender'] == 'ready'
+
+
+def wait_for_warm_up(timeout=None):
+    """
+    等待后台预热（推荐引擎与相似电影表）完成
+
+    预加载模式下主进程在fork worker之前调用，模型只在主进程中构建一次，各worker继承同一份内存
+
+    返回:
+        bool: 是否在超时前完成
+    """
+    if warm_up_thread is not None:
+        warm_up_thread.join(timeout)
+    return warm_up_thread is None or not warm_up_thread.is_alive()
+
+
+def after_fork():
+    """
+    预加载模式下worker进程fork后调用
+
+    后台预热线程不会随fork复制到子进程：预热已完成时直接使用继承自主进程的模型，
+    否则（等待超时或预热失败）在worker中重新初始化，避免使用主进程中构建到一半的模型
+    """
+    if movies is not None and (model_status['recommender'] != 'ready'
+                               or model_status['similar_movies'] != 'ready'):
+        initialize_data()
+
+
+def apply_rating_change(updated_ratings, user_id, movie_id, rating=None):
+    """
+    评分变更后的轻量刷新
+    只替换评分数据和热门电影，推荐系统以增量方式应用这条评分（rating为None表示删除），
+    不重建评分矩阵和相似度矩阵
+    """
+    global ratings, movie_ratings, top_movies
+
+    if recommender is None:
+        initialize_data()
+        return
+
+    ratings = updated_ratings.reset_index(drop=True)
+    ratings['rating_date'] = pd.to_datetime(ratings['timestamp'], unit='s')
+    movie_ratings = pd.merge(ratings, movies, on='movie_id')
+    top_movies = get_top_rated_movies(movies, ratings)
+
+    # 评分变化前后受影响的用户都需要失效推荐结果缓存（邻居关系可能随之改变）
+    affected = set(recommender.dependent_users(user_id))
+    # 应用期间切换评分版本：其他worker按旧评分算出的结果（以及本进程正在计算中的结果）不会被写回
+    with result_cache.rating_change(user_id, movie_id, rating):
+        if rating is None:
+            recommender.remove_rating(user_id, movie_id)
+        else:
+            recommender.apply_rating(user_id, movie_id, rating)
+    affected.update(recommender.dependent_users(user_id))
+    result_cache.invalidate_users(affected)
+
+
+def get_recommendations(user_id, **params):
+    """
+    获取用户的推荐结果（优先使用推荐结果缓存）
+    params为传给 recommend_items 的 k/n/min_similarity，未指定的使用推荐引擎的默认值；
+    模型预热完成前返回热门电影（不写入缓存）
+    """
+    if not model_ready():
+        retry_failed_warm_up()
+        return recommender.fallback_for_user(user_id, params.get('n', 10))
+    return result_cache.get_or_compute(
+        user_id, lambda: recommender.recommend_items(user_id, **params),
+        params.get('k'), params.get('n'), params.get('min_similarity'))
+
+
+# 首次启动时初始化数据（只加载服务所需的数据，相似度/模型在后台预热）
 initialize_data()
 
 
+# ======================== 健康检查路由 ========================
+
+@app.route('/healthz')
+def healthz():
+    """存活检查：进程能处理请求即返回200"""
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/readyz')
+def readyz():
+    """
+    就绪检查：数据已加载且推荐模型预热完成时返回200，否则返回503
+    （未就绪期间推荐接口仍可用，返回热门电影）
+    """
+    ready = movies is not None and model_ready()
+    body = {
+        'ready': ready,
+        'data_loaded': movies is not None,
+        'recommender': model_status['recommender'],
+        'similar_movies': model_status['similar_movies'],
+    }
+    if model_status['error']:
+        body['error'] = model_status['error']
+    if model_status['started_at'] is not None:
+        finished = model_status['ready_at'] or time.time()
+        body['warm_up_seconds'] = round(finished - model_status['started_at'], 1)
+    return jsonify(body), 200 if ready else 503
+
+
+@app.route('/cache_stats')
+def cache_stats():
+    """缓存计数：推荐结果缓存的命中/未命中，共享Redis客户端的命中/未命中/超时/熔断跳过次数及熔断器状态"""
+    return jsonify({'result_cache': result_cache.get_stats(), 'redis': get_redis_client().get_stats()})
+
+
 # ======================== 前台用户路由 ========================
 from flask import session
 
@@ -169,7 +393,7 @@ def recommend():
     rated_movies = get_user_rated_movies(user_id, ratings, movies)
 
     # 生成推荐电影列表
-    recommendations = recommender.recommend_items(user_id)
+    recommendations = get_recommendations(user_id)
 
     return render_template('recommendations.html',
                            user_id=user_id,
@@ -182,7 +406,7 @@ def recommend_user():
 
     user_id = session.get('user_id')
     rated_movies = get_user_rated_movies(user_id, ratings, movies)
-    recommendations = recommender.recommend_items(user_id)
+    recommendations = get_recommendations(user_id)
     return render_template(
         'recommendations.html',
         user_id=user_id,
@@ -192,6 +416,31 @@ def recommend_user():
     )
 
 
+@app.route('/similar_movies/<int:movie_id>')
+def similar_movies(movie_id):
+    """相似电影接口（JSON），n参数指定返回数量"""
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'msg': '请先登录'}), 401
+    if item_recommender is None:
+        return jsonify({'success': False, 'msg': '数据加载失败'}), 503
+    if model_status['similar_movies'] != 'ready':
+        retry_failed_warm_up()
+        return jsonify({'success': False, 'msg': '相似电影表正在构建，请稍后再试'}), 503
+
+    n = request.args.get('n', 10, type=int)
+    results = item_recommender.similar_items(movie_id, n=n)
+    return jsonify({
+        'success': True,
+        'movie_id': movie_id,
+        'similar_movies': [{
+            'movie_id': int(item['movie_id']),
+            'title': item.get('title'),
+            'year': item.get('year'),
+            'imdb_rating': item.get('imdb_rating'),
+            'similarity': item['similarity']
+        } for item in results]
+    })
+
 
 # ======================== 后台管理路由 ========================
 
@@ -399,10 +648,15 @@ def admin_movie_detail(movie_id):
                     'primaryProfession'
                 ]].fillna('未知').to_dict('records')
 
+        # 基于物品协同过滤的相似电影
+        similar_movies = item_recommender.similar_items(movie_id) \
+            if item_recommender and model_status['similar_movies'] == 'ready' else []
+
         return render_template('admin_movie_detail.html',
                                movie=movie,
                                rating_dist=rating_dist,
-                               people_info=people_info)
+                               people_info=people_info,
+                               similar_movies=similar_movies)
 
     except IndexError:
         return render_template('error.html', message="找不到指定的电影")
@@ -595,15 +849,16 @@ def admin_add_rating():
                 'timestamp': int(datetime.now().timestamp())
             }
 
-            # 添加到DataFrame
+            # 添加到DataFrame（同一用户对同一电影的已有评分被覆盖）
             new_row = pd.DataFrame([new_rating])
-            updated_ratings = pd.concat([ratings, new_row], ignore_index=True)
+            existing = (ratings['user_id'] == new_rating['user_id']) & (ratings['movie_id'] == new_rating['movie_id'])
+            updated_ratings = pd.concat([ratings[~existing], new_row], ignore_index=True)
 
             # 保存到CSV
             updated_ratings.to_csv('data/ratings.csv', index=False)
 
-            # 重新加载数据
-            initialize_data()
+            # 增量更新数据和推荐系统
+            apply_rating_change(updated_ratings, new_rating['user_id'], new_rating['movie_id'], new_rating['rating'])
 
             # 重定向到用户详情页
             return redirect(url_for('admin_user_detail', user_id=new_rating['user_id']))
@@ -633,8 +888,8 @@ def admin_delete_rating():
         # 保存到CSV
         updated_ratings.to_csv('data/ratings.csv', index=False)
 
-        # 重新加载数据
-        initialize_data()
+        # 增量更新数据和推荐系统
+        apply_rating_change(updated_ratings, user_id, movie_id)
 
         # 重定向回用户详情页
         return redirect(url_for('admin_user_detail', user_id=user_id))
@@ -955,7 +1210,6 @@ from flask import request, jsonify
 
 import re
 import pandas as pd
-import requests
 from flask import request, jsonify
 from utils import load_comments
 
@@ -1118,6 +1372,7 @@ def chatbot_ask():
         "max_tokens": 256
     }
     try:
+        import requests  # 只有聊天接口使用，首次调用时才导入
         resp = requests.post(DEEPSEEK_API_URL, headers=headers, json=payload, timeout=20)
         resp.raise_for_status()
         result = resp.json()
@@ -1188,14 +1443,18 @@ def user_profile():
         days_active=days_active,
         best_movie=best_movie
     )
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
 import pandas as pd
-import jieba
 import os
 
 @app.route('/comments_wordcloud')
 def comments_wordcloud():
+    # 词云依赖（wordcloud/matplotlib/jieba）导入耗时长、占用内存大，只在首次生成词云时导入
+    import jieba
+    import matplotlib
+    matplotlib.use('Agg')  # 服务端无界面绘图
+    import matplotlib.pyplot as plt
+    from wordcloud import WordCloud
+
     comments = pd.read_csv('data/comments.csv')
     text = ' '.join(str(x) for x in comments['content'] if pd.notnull(x))
     text = ' '.join(jieba.cut(text))  # 中文分词
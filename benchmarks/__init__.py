@@ -0,0 +1,4 @@
+"""
+推荐系统性能基准测试
+在项目根目录下以模块方式运行，例如: python -m benchmarks.cache_format
+"""
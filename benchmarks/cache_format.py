@@ -0,0 +1,102 @@
+"""
+相似度缓存格式基准测试
+比较旧版 JSON + zlib 格式与二进制格式（各压缩编码）在分块缓存路径上的
+写入耗时、加载耗时和占用空间
+
+运行: python -m benchmarks.cache_format --users 4000 --movies 11809
+"""
+
+import argparse
+import json
+import time
+import zlib
+
+import numpy as np
+
+from benchmarks.fake_redis import FakeRedis
+from benchmarks.synthetic import make_dataset
+from data_loader import preprocess_data
+from matrix_codec import available_codecs, decode_array, encode_array
+from recommender import UserCFRecommender
+
+
+def legacy_serialize(matrix):
+    """旧版序列化格式（matrix.tolist() → JSON → zlib）"""
+    return zlib.compress(json.dumps(matrix.tolist()).encode('utf-8'))
+
+
+def legacy_deserialize(data):
+    """旧版反序列化格式"""
+    return np.array(json.loads(zlib.decompress(data).decode('utf-8')))
+
+
+def store_chunks(recommender, matrix):
+    """按recommender的分块大小把矩阵写入Redis（与计算时的流式写入一致）"""
+    chunk_size = recommender.chunk_size
+    checksums = [recommender._store_matrix_chunk(i, matrix[start:start + chunk_size])
+                 for i, start in enumerate(range(0, len(matrix), chunk_size))]
+    recommender._store_matrix_meta(matrix.shape, chunk_size, checksums, matrix.dtype)
+
+
+def run_format(recommender, matrix, name, serialize, deserialize, repeat):
+    """测量一种缓存格式的写入/加载耗时"""
+    recommender.redis_client = FakeRedis()
+    recommender._serialize_matrix = serialize
+    recommender._deserialize_matrix = deserialize
+
+    store_times, load_times = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        store_chunks(recommender, matrix)
+        store_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        loaded = recommender._load_matrix_chunks()
+        load_times.append(time.perf_counter() - start)
+
+    assert np.allclose(loaded, matrix), f"{name} 格式加载结果不一致"
+    return {
+        'format': name,
+        'store_s': min(store_times),
+        'load_s': min(load_times),
+        'size_mb': recommender.redis_client.memory_usage() / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="相似度缓存格式基准测试（分块路径）")
+    parser.add_argument('--users', type=int, default=4000)
+    parser.add_argument('--movies', type=int, default=11809)
+    parser.add_argument('--density', type=float, default=0.0064)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--skip-legacy', action='store_true', help="跳过旧版JSON格式（大数据量时很慢）")
+    args = parser.parse_args()
+
+    movies, ratings = make_dataset(args.users, args.movies, args.density)
+    _, user_movie_ratings, movie_info = preprocess_data(movies, ratings, sparse=True)
+
+    recommender = UserCFRecommender(user_movie_ratings, movie_info, cache_dir=None)
+    recommender.redis_client = None
+    recommender.calculate_similarity()
+    matrix = np.asarray(recommender.user_similarity)
+    recommender.chunk_size = args.chunk_size
+    print(f"相似度矩阵: {matrix.shape}, {matrix.nbytes / 1024 / 1024:.1f} MB")
+
+    results = []
+    if not args.skip_legacy:
+        results.append(run_format(recommender, matrix, 'json+zlib (旧版)',
+                                  legacy_serialize, legacy_deserialize, args.repeat))
+    for codec in available_codecs():
+        results.append(run_format(recommender, matrix, f'binary+{codec}',
+                                  lambda m, c=codec: encode_array(m, c),
+                                  decode_array,
+                                  args.repeat))
+
+    print(f"{'格式':<20}{'写入(s)':>10}{'加载(s)':>10}{'大小(MB)':>10}")
+    for row in results:
+        print(f"{row['format']:<20}{row['store_s']:>10.3f}{row['load_s']:>10.3f}{row['size_mb']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
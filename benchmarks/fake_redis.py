@@ -0,0 +1,99 @@
+"""
+进程内的简易Redis替身
+只实现推荐系统缓存用到的命令，用于在没有Redis服务的机器上测量缓存路径
+"""
+
+import fnmatch
+
+
+class FakeRedis:
+    """以字典保存键值的Redis替身（忽略TTL）"""
+
+    def __init__(self):
+        self.store = {}
+
+    def ping(self):
+        return True
+
+    def get(self, name):
+        return self.store.get(name)
+
+    def mget(self, keys, *args):
+        if isinstance(keys, (str, bytes)):
+            keys = [keys]
+        return [self.store.get(key) for key in [*keys, *args]]
+
+    def set(self, name, value, ex=None, px=None, nx=False):
+        if nx and name in self.store:
+            return None
+        self.store[name] = value if isinstance(value, bytes) else str(value).encode('utf-8')
+        return True
+
+    def setex(self, name, time, value):
+        return self.set(name, value)
+
+    def exists(self, *names):
+        return sum(name in self.store for name in names)
+
+    def delete(self, *names):
+        return sum(self.store.pop(name, None) is not None for name in names)
+
+    def keys(self, pattern='*'):
+        return [key.encode('utf-8') for key in self.store if fnmatch.fnmatchcase(key, pattern)]
+
+    def lock(self, name, timeout=None, blocking=True):
+        return FakeLock(self, name)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def memory_usage(self):
+        """所有值占用的字节数"""
+        return sum(len(value) for value in self.store.values())
+
+    def close(self):
+        pass
+
+
+class FakePipeline:
+    """缓存命令并在execute时依次执行"""
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((method, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        results = [method(*args, **kwargs) for method, args, kwargs in self.commands]
+        self.commands = []
+        return results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.commands = []
+
+
+class FakeLock:
+    """基于 SET NX 的简易锁（忽略租约，只用于单进程内的基准测试）"""
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def acquire(self):
+        return bool(self.client.set(self.name, b'1', nx=True))
+
+    def reacquire(self):
+        return True
+
+    def release(self):
+        self.client.delete(self.name)
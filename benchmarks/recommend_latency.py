@@ -0,0 +1,80 @@
+"""
+单用户推荐延迟基准测试
+逐次调用 recommend_items，统计每次调用的 p50/p99 延迟（协同过滤路径与热门后备路径分开统计）
+
+运行: python -m benchmarks.recommend_latency --users 4000 --movies 11809 --calls 2000
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_dataset
+from data_loader import preprocess_data
+from recommender import UserCFRecommender
+
+
+def measure(recommender, user_ids, k, n, min_similarity):
+    """逐个用户调用 recommend_items，返回每次调用的耗时（毫秒）"""
+    latencies = np.empty(len(user_ids))
+    # 后备路径会打印警告，计时期间屏蔽输出
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i, user_id in enumerate(user_ids):
+            start = time.perf_counter()
+            recommender.recommend_items(user_id, k=k, n=n, min_similarity=min_similarity)
+            latencies[i] = (time.perf_counter() - start) * 1000
+    return latencies
+
+
+def summarize(name, latencies):
+    return {
+        'path': name,
+        'calls': len(latencies),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'mean_ms': float(latencies.mean()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="单用户推荐延迟基准测试")
+    parser.add_argument('--users', type=int, default=4000)
+    parser.add_argument('--movies', type=int, default=11809)
+    parser.add_argument('--density', type=float, default=0.0064)
+    parser.add_argument('--neighbor-k', type=int, default=50, help="TopK邻居表大小（0表示完整相似度矩阵）")
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--n', type=int, default=10)
+    parser.add_argument('--min-similarity', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    movies, ratings = make_dataset(args.users, args.movies, args.density)
+    _, user_movie_ratings, movie_info = preprocess_data(movies, ratings, sparse=True)
+
+    recommender = UserCFRecommender(user_movie_ratings, movie_info, neighbor_k=args.neighbor_k or None,
+                                    cache_dir=None)
+    recommender.redis_client = None
+    recommender.calculate_similarity()
+
+    rng = np.random.default_rng(args.seed)
+    user_ids = rng.choice(user_movie_ratings.user_ids, args.calls)
+    # 预热（首次调用会构建惰性结构）
+    measure(recommender, user_ids[:10], args.k, args.n, args.min_similarity)
+
+    results = [
+        summarize('协同过滤', measure(recommender, user_ids, args.k, args.n, args.min_similarity)),
+        # 相似度阈值大于1时所有用户都走热门电影后备路径
+        summarize('热门后备', measure(recommender, user_ids, args.k, args.n, 1.1)),
+    ]
+
+    print(f"{'路径':<10}{'调用次数':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'平均(ms)':>10}")
+    for row in results:
+        print(f"{row['path']:<10}{row['calls']:>10}{row['p50_ms']:>10.3f}{row['p99_ms']:>10.3f}{row['mean_ms']:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+相似度存储精度验证报告
+以float64为基准，比较 float32 / float16 / int8 存储下的内存与缓存大小、
+相似度误差、TopK邻居集合重合度以及推荐预测评分的差异
+
+运行: python -m benchmarks.similarity_precision --users 4000 --sample-users 500
+"""
+
+import argparse
+import contextlib
+import io
+
+import numpy as np
+
+from benchmarks.synthetic import make_dataset
+from data_loader import preprocess_data
+from matrix_codec import encode_array
+from recommender import UserCFRecommender
+from similarity import SIMILARITY_DTYPES, dequantize_similarity
+
+
+def neighbor_overlap(reference, candidate, k):
+    """每个用户TopK邻居集合的平均重合比例（按存储值排序，排除自身）"""
+    n_users = len(reference)
+    overlaps = []
+    for row in range(n_users):
+        ref_row = np.asarray(reference[row], dtype=np.float64).copy()
+        cand_row = dequantize_similarity(candidate[row]).copy()
+        ref_row[row] = cand_row[row] = -np.inf
+        ref_top = np.argpartition(-ref_row, k - 1)[:k]
+        cand_top = np.argpartition(-cand_row, k - 1)[:k]
+        overlaps.append(len(np.intersect1d(ref_top, cand_top)) / k)
+    return float(np.mean(overlaps))
+
+
+def prediction_diff(reference, candidate, user_ids, n):
+    """同一批用户的推荐结果: 平均TopN重合比例，以及共同推荐电影的预测评分最大/平均偏差"""
+    overlaps, diffs = [], []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for user_id in user_ids:
+            ref = {rec['movie_id']: rec['predicted_rating'] for rec in reference.recommend_items(user_id, n=n)}
+            cand = {rec['movie_id']: rec['predicted_rating'] for rec in candidate.recommend_items(user_id, n=n)}
+            common = ref.keys() & cand.keys()
+            overlaps.append(len(common) / max(len(ref), 1))
+            diffs.extend(abs(ref[movie_id] - cand[movie_id]) for movie_id in common)
+    diffs = np.array(diffs) if diffs else np.zeros(1)
+    return float(np.mean(overlaps)), float(diffs.max()), float(diffs.mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="相似度存储精度验证报告")
+    parser.add_argument('--users', type=int, default=4000)
+    parser.add_argument('--movies', type=int, default=11809)
+    parser.add_argument('--density', type=float, default=0.0064)
+    parser.add_argument('--k', type=int, nargs='+', default=[5, 50], help="比较的邻居数")
+    parser.add_argument('--n', type=int, default=10, help="推荐数量")
+    parser.add_argument('--sample-users', type=int, default=500, help="比较推荐结果的用户数")
+    parser.add_argument('--codec', default=None, help="缓存压缩编码（默认自动选择）")
+    args = parser.parse_args()
+
+    movies, ratings = make_dataset(args.users, args.movies, args.density)
+    _, user_movie_ratings, movie_info = preprocess_data(movies, ratings, sparse=True)
+    rng = np.random.default_rng(0)
+    sample_users = rng.choice(user_movie_ratings.user_ids, min(args.sample_users, args.users), replace=False)
+
+    recommenders = {}
+    for precision in SIMILARITY_DTYPES:
+        recommender = UserCFRecommender(user_movie_ratings, movie_info, cache_dir=None,
+                                        similarity_precision=precision)
+        recommender.redis_client = None
+        with contextlib.redirect_stdout(io.StringIO()):
+            recommender.calculate_similarity()
+        recommenders[precision] = recommender
+
+    reference = recommenders['float64']
+    header = f"{'精度':<10}{'内存(MB)':>10}{'缓存(MB)':>10}{'最大误差':>10}"
+    header += ''.join(f"{f'Top{k}重合':>10}" for k in args.k)
+    header += f"{'推荐重合':>10}{'评分最大差':>11}{'评分平均差':>11}"
+    print(header)
+    for precision, recommender in recommenders.items():
+        matrix = recommender.user_similarity
+        error = np.abs(dequantize_similarity(matrix) - reference.user_similarity).max()
+        cache_mb = len(encode_array(matrix, args.codec)) / 1024 / 1024
+        overlaps = [neighbor_overlap(reference.user_similarity, matrix, k) for k in args.k]
+        rec_overlap, max_diff, mean_diff = prediction_diff(reference, recommender, sample_users, args.n)
+
+        row = f"{precision:<10}{matrix.nbytes / 1024 / 1024:>10.1f}{cache_mb:>10.1f}{error:>10.4f}"
+        row += ''.join(f"{overlap:>10.4f}" for overlap in overlaps)
+        row += f"{rec_overlap:>10.4f}{max_diff:>11.4f}{mean_diff:>11.4f}"
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
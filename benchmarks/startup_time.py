@@ -0,0 +1,115 @@
+"""
+应用冷启动时间报告
+在新的Python进程中以 -X importtime 导入应用模块，汇总各顶层包的累计导入耗时、
+模块导入总耗时（含 initialize_data 等模块级代码）与进程峰值内存，并与启动预算比较
+
+运行: python -m benchmarks.startup_time --budget-ms 1500
+      python -m benchmarks.startup_time --module recommender --top 15 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import time
+
+_IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+# 不应出现在启动路径上的重型依赖（只在个别接口中按需导入）
+DEFERRED_PACKAGES = ('sklearn', 'matplotlib', 'wordcloud', 'jieba', 'requests')
+
+
+def run_import(module, cwd):
+    """
+    在子进程中导入模块，返回 (-X importtime 输出, 导入耗时秒数, 进程总耗时秒数, 子进程峰值RSS(MB))
+
+    子进程以 os._exit 退出，不等待后台预热线程
+    """
+    code = (f"import time; _start = time.perf_counter(); import {module}; "
+            f"print('__elapsed__', time.perf_counter() - _start, flush=True); "
+            f"import os; os._exit(0)")
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=cwd,
+                          capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{proc.stderr[-2000:]}")
+    elapsed = next((float(line.split()[1]) for line in proc.stdout.splitlines()
+                    if line.startswith('__elapsed__')), wall)
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    peak_mb = peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    return proc.stderr, elapsed, wall, peak_mb
+
+
+def parse_importtime(output):
+    """
+    解析 -X importtime 输出
+
+    返回:
+        list: (模块名, 自身耗时ms, 累计耗时ms, 嵌套层级)，按导入完成顺序
+    """
+    rows = []
+    for line in output.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us) / 1000, int(cumulative_us) / 1000, len(indent) // 2))
+    return rows
+
+
+def top_level_packages(rows):
+    """按顶层包汇总: 被直接导入的（层级最小的）模块的累计耗时之和"""
+    totals = {}
+    for name, _, cumulative_ms, level in rows:
+        if level == 1:
+            package = name.split('.')[0]
+            totals[package] = totals.get(package, 0.0) + cumulative_ms
+    return sorted(totals.items(), key=lambda item: -item[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="应用冷启动时间报告")
+    parser.add_argument('--module', default='app', help="导入的模块（默认 app，会执行模块级的数据初始化）")
+    parser.add_argument('--top', type=int, default=20, help="显示耗时最多的顶层包数量")
+    parser.add_argument('--budget-ms', type=float, default=None, help="启动预算（毫秒），超出时返回码为1")
+    parser.add_argument('--output', default=None, help="结果JSON文件路径")
+    args = parser.parse_args()
+
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output, elapsed, wall, peak_mb = run_import(args.module, cwd)
+    rows = parse_importtime(output)
+    packages = top_level_packages(rows)
+    loaded = {name.split('.')[0] for name, *_ in rows}
+    deferred_loaded = [name for name in DEFERRED_PACKAGES if name in loaded]
+
+    print(f"导入 {args.module}: {elapsed * 1000:.0f} ms（进程总耗时 {wall * 1000:.0f} ms，峰值内存 {peak_mb:.1f} MB）")
+    print(f"\n{'顶层包':<28}{'累计导入(ms)':>14}")
+    for package, cumulative_ms in packages[:args.top]:
+        print(f"{package:<28}{cumulative_ms:>14.1f}")
+    if deferred_loaded:
+        print(f"\n警告: 以下按需导入的依赖出现在启动路径上: {', '.join(deferred_loaded)}")
+
+    over_budget = args.budget_ms is not None and elapsed * 1000 > args.budget_ms
+    if args.budget_ms is not None:
+        print(f"\n启动预算 {args.budget_ms:.0f} ms: {'超出' if over_budget else '满足'}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'module': args.module,
+                'import_ms': elapsed * 1000,
+                'process_ms': wall * 1000,
+                'peak_rss_mb': peak_mb,
+                'budget_ms': args.budget_ms,
+                'packages': [{'package': package, 'cumulative_ms': ms} for package, ms in packages],
+                'deferred_loaded': deferred_loaded,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+    sys.exit(1 if over_budget or deferred_loaded else 0)
+
+
+if __name__ == '__main__':
+    main()
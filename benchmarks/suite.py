@@ -0,0 +1,267 @@
+"""
+推荐系统基准测试套件
+在合成数据集（用户数 × 电影数 × 评分密度）上依次测量:
+  preprocess_data、calculate_similarity（冷启动计算）、Redis缓存写入/加载（进程内FakeRedis）、
+  本地内存映射缓存加载、recommend_items 的 p50/p99 延迟，并记录每个阶段结束时的峰值RSS
+  （进程级峰值，只增不减；比较不同规模的内存占用时应分别运行）。
+结果写入JSON文件，可与之前的运行结果对比（--compare）。
+
+每个阶段是 BENCHMARKS 中的一个独立函数，也可以只运行其中几项（--only）；
+同样的阶段也以 pytest-benchmark 测试的形式提供（benchmarks/test_suite.py），供CI运行与对比。
+
+运行: python -m benchmarks.suite --users 2000 4000 --output bench.json
+      python -m benchmarks.suite --users 4000 --compare bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import scipy
+
+from benchmarks.fake_redis import FakeRedis
+from benchmarks.recommend_latency import measure
+from benchmarks.synthetic import make_dataset
+from data_loader import preprocess_data
+from recommender import UserCFRecommender
+
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def timed(func, repeat=1, setup=None):
+    """
+    运行func repeat次，返回 (最短耗时秒数, 最后一次的返回值)；运行期间屏蔽打印输出
+
+    setup不为None时每次先（不计时）调用 setup()，其返回值作为func的参数
+    """
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            args = (setup(),) if setup is not None else ()
+            start = time.perf_counter()
+            result = func(*args)
+            best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+class BenchContext:
+    """各基准阶段共享的状态（数据集、预处理结果及已构建的推荐器）"""
+
+    def __init__(self, args, n_users):
+        self.args = args
+        self.n_users = n_users
+        self.movies, self.ratings = make_dataset(n_users, args.movies, args.density, seed=args.seed)
+        self.user_movie_ratings = None
+        self.movie_info = None
+        self.recommender = None
+        self.cache_dir = tempfile.mkdtemp(prefix='bench_cache_')
+
+    def make_recommender(self, redis_client=None, cache_dir=None):
+        """创建推荐器（构造时的Redis连接测试不计入任何阶段的耗时）"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            recommender = UserCFRecommender(
+                self.user_movie_ratings, self.movie_info, neighbor_k=self.args.neighbor_k or None,
+                cache_dir=cache_dir, similarity_precision=self.args.precision, n_jobs=self.args.n_jobs)
+        recommender.redis_client = redis_client
+        return recommender
+
+    def ensure_data(self):
+        if self.user_movie_ratings is None:
+            _, self.user_movie_ratings, self.movie_info = preprocess_data(self.movies, self.ratings, sparse=True)
+
+    def ensure_recommender(self):
+        self.ensure_data()
+        if self.recommender is None:
+            self.recommender = self.make_recommender()
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.recommender.calculate_similarity()
+
+
+def _load(reader):
+    """从缓存加载相似度（reader只配置了待测的缓存层）"""
+    reader.calculate_similarity()
+    return reader
+
+
+def bench_preprocess(ctx):
+    """DataFrame -> 稀疏评分矩阵及电影信息"""
+    seconds, (_, ctx.user_movie_ratings, ctx.movie_info) = timed(
+        lambda: preprocess_data(ctx.movies, ctx.ratings, sparse=True), ctx.args.repeat)
+    return {'seconds': seconds, 'nnz': int(ctx.user_movie_ratings.nnz)}
+
+
+def bench_calculate_similarity(ctx):
+    """无任何缓存时的完整相似度（或TopK邻居表）计算"""
+    ctx.ensure_data()
+
+    def build(recommender):
+        recommender.calculate_similarity()
+        return recommender
+
+    seconds, ctx.recommender = timed(build, ctx.args.repeat, setup=ctx.make_recommender)
+    return {'seconds': seconds, 'users_per_s': ctx.n_users / seconds}
+
+
+def _store_to_redis(writer):
+    """把writer中已有的相似度写入Redis（与计算过程中的分块写入格式相同）"""
+    if writer.neighbor_k:
+        writer._store_neighbor_index()
+    else:
+        matrix, chunk = writer.user_similarity, writer.chunk_size
+        checksums = [writer._store_matrix_chunk(i, matrix[start:start + chunk])
+                     for i, start in enumerate(range(0, len(matrix), chunk))]
+        writer._store_matrix_meta(matrix.shape, chunk, checksums, matrix.dtype)
+
+
+def bench_redis_cache(ctx):
+    """相似度写入Redis（序列化 + 存储）与从Redis冷加载（读取 + 校验 + 反序列化）"""
+    ctx.ensure_recommender()
+    client = FakeRedis()
+    writer = ctx.make_recommender(redis_client=client)
+    writer.user_similarity = ctx.recommender.user_similarity
+    writer.neighbor_ids, writer.neighbor_sims = ctx.recommender.neighbor_ids, ctx.recommender.neighbor_sims
+
+    store_seconds, _ = timed(lambda: _store_to_redis(writer), ctx.args.repeat)
+    load_seconds, reader = timed(_load, ctx.args.repeat, setup=lambda: ctx.make_recommender(redis_client=client))
+    loaded = reader.neighbor_ids if reader.neighbor_k else reader.user_similarity
+    expected = ctx.recommender.neighbor_ids if reader.neighbor_k else ctx.recommender.user_similarity
+    assert np.array_equal(loaded, expected), "Redis加载结果与计算结果不一致"
+    return {'store_seconds': store_seconds, 'load_seconds': load_seconds,
+            'bytes': int(client.memory_usage())}
+
+
+def bench_local_cache(ctx):
+    """本地内存映射缓存的写入与加载"""
+    ctx.ensure_recommender()
+    writer = ctx.make_recommender(cache_dir=ctx.cache_dir)
+    writer.user_similarity = ctx.recommender.user_similarity
+    writer.neighbor_ids, writer.neighbor_sims = ctx.recommender.neighbor_ids, ctx.recommender.neighbor_sims
+    store_seconds, _ = timed(writer._save_local_cache, ctx.args.repeat)
+
+    load_seconds, _ = timed(_load, ctx.args.repeat, setup=lambda: ctx.make_recommender(cache_dir=ctx.cache_dir))
+    return {'store_seconds': store_seconds, 'load_seconds': load_seconds}
+
+
+def bench_recommend(ctx):
+    """recommend_items 的单次调用延迟（协同过滤路径）"""
+    ctx.ensure_recommender()
+    args = ctx.args
+    rng = np.random.default_rng(args.seed)
+    user_ids = rng.choice(ctx.user_movie_ratings.user_ids, args.calls)
+    measure(ctx.recommender, user_ids[:10], args.k, args.n, args.min_similarity)  # 预热
+    latencies = measure(ctx.recommender, user_ids, args.k, args.n, args.min_similarity)
+    return {
+        'calls': len(latencies),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'mean_ms': float(latencies.mean()),
+    }
+
+
+# 基准阶段（按顺序执行；后面的阶段复用前面阶段的结果，单独运行时会自动补齐依赖）
+BENCHMARKS = {
+    'preprocess_data': bench_preprocess,
+    'calculate_similarity': bench_calculate_similarity,
+    'redis_cache': bench_redis_cache,
+    'local_cache': bench_local_cache,
+    'recommend_items': bench_recommend,
+}
+
+
+def environment_info():
+    """运行环境信息（写入结果文件，便于对比不同机器或版本的结果）"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def print_comparison(results, baseline_path):
+    """与之前的结果文件逐项对比耗时类指标（比值 <1 表示变快）"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(row['users'], row['benchmark']): row for row in json.load(f)['results']}
+    print(f"\n与 {baseline_path} 对比:")
+    print(f"{'用户数':>8}  {'阶段':<22}{'指标':<16}{'之前':>12}{'现在':>12}{'比值':>8}")
+    for row in results:
+        before = baseline.get((row['users'], row['benchmark']))
+        if before is None:
+            continue
+        for key, value in row.items():
+            if (key.endswith('seconds') or key.endswith('_ms') or key == 'peak_rss_mb') and before.get(key):
+                print(f"{row['users']:>8}  {row['benchmark']:<22}{key:<16}"
+                      f"{before[key]:>12.4f}{value:>12.4f}{value / before[key]:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推荐系统基准测试套件")
+    parser.add_argument('--users', type=int, nargs='+', default=[4000], help="用户数（可给出多个规模）")
+    parser.add_argument('--movies', type=int, default=11809)
+    parser.add_argument('--density', type=float, default=0.0064)
+    parser.add_argument('--neighbor-k', type=int, default=50, help="TopK邻居表大小（0表示完整相似度矩阵）")
+    parser.add_argument('--precision', default='float64', help="完整相似度矩阵的存储精度")
+    parser.add_argument('--n-jobs', type=int, default=1, help="相似度构建的并行进程数")
+    parser.add_argument('--calls', type=int, default=2000, help="推荐延迟测试的调用次数")
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--n', type=int, default=10)
+    parser.add_argument('--min-similarity', type=float, default=0.1)
+    parser.add_argument('--repeat', type=int, default=1, help="耗时类阶段重复次数（取最短）")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help="只运行指定阶段")
+    parser.add_argument('--output', default=None, help="结果JSON文件路径")
+    parser.add_argument('--compare', default=None, help="与之前的结果JSON文件对比")
+    args = parser.parse_args()
+
+    names = args.only or list(BENCHMARKS)
+    results = []
+    print(f"{'用户数':>8}  {'阶段':<22}{'结果':<60}{'峰值RSS(MB)':>12}")
+    for n_users in args.users:
+        ctx = BenchContext(args, n_users)
+        for name in names:
+            row = {'users': n_users, 'benchmark': name, **BENCHMARKS[name](ctx), 'peak_rss_mb': peak_rss_mb()}
+            results.append(row)
+            summary = ', '.join(f"{key}={value:.4g}" if isinstance(value, float) else f"{key}={value}"
+                                for key, value in row.items() if key not in ('users', 'benchmark', 'peak_rss_mb'))
+            print(f"{n_users:>8}  {name:<22}{summary:<60}{row['peak_rss_mb']:>12.1f}")
+        shutil.rmtree(ctx.cache_dir, ignore_errors=True)
+
+    report = {
+        'environment': environment_info(),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+合成数据集生成
+按指定的用户数 × 电影数 × 评分密度生成与 data_loader.load_data 输出结构一致的数据
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def make_dataset(n_users=4000, n_movies=11809, density=0.0064, seed=42):
+    """
+    生成合成的电影和评分数据
+
+    参数:
+        n_users (int): 用户数
+        n_movies (int): 电影数
+        density (float): 评分密度（已评分项占用户×电影的比例）
+        seed (int): 随机种子
+
+    返回:
+        movies (DataFrame): 电影数据（含duration_min）
+        ratings (DataFrame): 评分数据（含rating_date）
+    """
+    rng = np.random.default_rng(seed)
+
+    movie_ids = np.arange(1, n_movies + 1)
+    imdb_rating = rng.uniform(5.0, 9.5, n_movies).round(1)
+    duration_min = rng.integers(80, 180, n_movies)
+    movies = pd.DataFrame({
+        'movie_id': movie_ids,
+        'title': [f"Movie {i}" for i in movie_ids],
+        'year': rng.integers(1950, 2024, n_movies),
+        'duration': [f"{m // 60}h {m % 60}m" for m in duration_min],
+        'genre': rng.choice(['Drama', 'Comedy', 'Action', 'Drama, Romance', 'Crime, Thriller'], n_movies),
+        'imdb_rating': imdb_rating,
+        'position': movie_ids,
+        'duration_min': duration_min,
+    })
+
+    # 随机抽取 (用户, 电影) 对并去重，得到目标数量的评分
+    # 电影按长尾分布被评分（热门电影被更多用户评分，与真实数据相近）
+    n_ratings = max(1, int(n_users * n_movies * density))
+    popularity = 1.0 / np.arange(1, n_movies + 1) ** 0.9
+    users = rng.integers(0, n_users, int(n_ratings * 1.3) + 16)
+    items = rng.choice(n_movies, len(users), p=popularity / popularity.sum())
+    pairs = np.unique(users.astype(np.int64) * n_movies + items)
+    pairs = rng.permutation(pairs)[:n_ratings]
+    users, items = pairs // n_movies, pairs % n_movies
+
+    user_bias = rng.normal(0, 0.5, n_users)
+    values = np.clip(imdb_rating[items] + user_bias[users] + rng.normal(0, 0.7, len(pairs)),
+                     1.0, 10.0).round(1)
+    timestamps = 1_600_000_000 + rng.integers(0, 3 * 31536000, len(pairs))
+
+    ratings = pd.DataFrame({
+        'user_id': users + 1,
+        'movie_id': movie_ids[items],
+        'rating': values,
+        'timestamp': timestamps,
+    })
+    ratings['rating_date'] = pd.to_datetime(ratings['timestamp'], unit='s')
+    return movies, ratings
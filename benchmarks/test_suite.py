@@ -0,0 +1,101 @@
+"""
+基准测试套件的 pytest-benchmark 版本
+与 benchmarks.suite 测量相同的阶段（各阶段同时校验结果正确），由pytest收集，便于在CI中运行并与
+已保存的结果对比；未安装 pytest-benchmark 时整个模块跳过。数据规模由环境变量 BENCH_USERS /
+BENCH_MOVIES 调整（默认较小，保证CI中的运行时间）。
+
+运行: python -m pytest benchmarks/test_suite.py --benchmark-autosave
+      python -m pytest benchmarks/test_suite.py --benchmark-compare --benchmark-compare-fail=mean:20%
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from benchmarks.fake_redis import FakeRedis  # noqa: E402
+from benchmarks.suite import BenchContext, _load, _store_to_redis  # noqa: E402
+from data_loader import preprocess_data  # noqa: E402
+
+
+def bench_args():
+    """与 benchmarks.suite 命令行参数含义相同的配置"""
+    return argparse.Namespace(
+        movies=int(os.getenv('BENCH_MOVIES', 2000)), density=0.0064, neighbor_k=50, precision='float64',
+        n_jobs=1, calls=200, k=5, n=10, min_similarity=0.1, repeat=1, seed=42)
+
+
+@pytest.fixture(scope='module')
+def ctx():
+    """共享的数据集与已构建的推荐器（构建本身由 test_calculate_similarity 计时）"""
+    context = BenchContext(bench_args(), int(os.getenv('BENCH_USERS', 1000)))
+    context.ensure_recommender()
+    yield context
+    shutil.rmtree(context.cache_dir, ignore_errors=True)
+
+
+def _copy_similarity(ctx, **kwargs):
+    """创建只配置了指定缓存层的推荐器，并放入已构建的相似度"""
+    recommender = ctx.make_recommender(**kwargs)
+    recommender.user_similarity = ctx.recommender.user_similarity
+    recommender.neighbor_ids, recommender.neighbor_sims = ctx.recommender.neighbor_ids, ctx.recommender.neighbor_sims
+    return recommender
+
+
+def _quiet(func):
+    """屏蔽被测函数的打印输出"""
+    def run(*args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return func(*args)
+    return run
+
+
+def test_preprocess_data(benchmark, ctx):
+    _, user_movie_ratings, _ = benchmark(preprocess_data, ctx.movies, ctx.ratings, sparse=True)
+    assert user_movie_ratings.nnz == ctx.user_movie_ratings.nnz
+
+
+def test_calculate_similarity(benchmark, ctx):
+    recommender = benchmark.pedantic(_quiet(_load), setup=lambda: ((ctx.make_recommender(),), {}), rounds=3)
+    np.testing.assert_array_equal(recommender.neighbor_ids, ctx.recommender.neighbor_ids)
+
+
+def test_redis_store(benchmark, ctx):
+    writer = _copy_similarity(ctx, redis_client=FakeRedis())
+    benchmark(_store_to_redis, writer)
+
+
+def test_redis_load(benchmark, ctx):
+    client = FakeRedis()
+    _store_to_redis(_copy_similarity(ctx, redis_client=client))
+    reader = benchmark.pedantic(_quiet(_load), rounds=5,
+                                setup=lambda: ((ctx.make_recommender(redis_client=client),), {}))
+    np.testing.assert_array_equal(reader.neighbor_ids, ctx.recommender.neighbor_ids)
+
+
+def test_local_cache_store(benchmark, ctx):
+    writer = _copy_similarity(ctx, cache_dir=ctx.cache_dir)
+    benchmark(_quiet(writer._save_local_cache))
+
+
+def test_local_cache_load(benchmark, ctx):
+    _quiet(_copy_similarity(ctx, cache_dir=ctx.cache_dir)._save_local_cache)()
+    reader = benchmark.pedantic(_quiet(_load), rounds=5,
+                                setup=lambda: ((ctx.make_recommender(cache_dir=ctx.cache_dir),), {}))
+    np.testing.assert_array_equal(reader.neighbor_ids, ctx.recommender.neighbor_ids)
+
+
+def test_recommend_items(benchmark, ctx):
+    args = ctx.args
+    rng = np.random.default_rng(args.seed)
+    user_ids = itertools.cycle(rng.choice(ctx.user_movie_ratings.user_ids, args.calls).tolist())
+    recommend = _quiet(lambda: ctx.recommender.recommend_items(next(user_ids), args.k, args.n, args.min_similarity))
+    recommendations = benchmark(recommend)
+    assert len(recommendations) <= args.n
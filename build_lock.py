@@ -0,0 +1,184 @@
+"""
+构建锁模块（防止缓存击穿）
+缓存未命中时多个worker进程只由一个进程执行昂贵的构建并发布结果，其他进程等待后直接加载：
+Redis可用时使用带租约的Redis锁（持有期间后台续约，进程崩溃后租约到期自动释放），
+否则使用本地缓存目录中的文件锁（同一台机器上的worker之间互斥，进程退出时由系统释放）。
+持锁期间fork出的子进程放弃继承来的锁（锁仍属于父进程，由父进程续约和释放）
+"""
+
+import os
+import threading
+import time
+import weakref
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# 本进程当前持有的构建锁
+_held = weakref.WeakSet()
+
+
+class RedisLease:
+    def __init__(self, redis_client, key, lease=60):
+        """
+        带租约的Redis锁（SET NX PX，释放时校验持有者，基于 redis-py 的 Lock）
+
+        参数:
+            redis_client: Redis客户端
+            key (str): 锁的键名
+            lease (float): 租约时长（秒），持有期间每 lease/3 秒续约一次
+        """
+        self.redis_client = redis_client
+        self.key = key
+        self.lease = lease
+        self._lock = None
+        self._stop = threading.Event()
+
+    def acquire(self):
+        """尝试获取锁（不阻塞），成功时启动续约线程"""
+        self._lock = self.redis_client.lock(self.key, timeout=self.lease, blocking=False)
+        if not self._lock.acquire():
+            return False
+        self._stop.clear()
+        _held.add(self)
+        threading.Thread(target=self._renew, name='build-lease', daemon=True).start()
+        return True
+
+    def _renew(self):
+        while not self._stop.wait(self.lease / 3):
+            try:
+                self._lock.reacquire()
+            except Exception as e:
+                print(f"[Redis] 构建锁续约失败: {e}")
+                return
+
+    def release(self):
+        _held.discard(self)
+        self._stop.set()
+        if self._lock is None:  # fork后已放弃
+            return
+        try:
+            self._lock.release()
+        except Exception as e:
+            # 租约已过期（或Redis不可用）时锁已不属于本进程，到期后自动释放
+            print(f"[Redis] 释放构建锁失败: {e}")
+
+    def _abandon(self):
+        """fork出的子进程中放弃继承的锁（续约线程只存在于父进程，子进程不续约也不释放）"""
+        self._stop = threading.Event()
+        self._lock = None
+
+
+class FileLock:
+    def __init__(self, path):
+        """
+        进程间文件锁（不阻塞地加锁，持有进程退出时由操作系统释放）
+
+        参数:
+            path (str): 锁文件路径（只用于加锁，不会被删除）
+        """
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        """尝试获取锁（不阻塞）"""
+        f = open(self.path, 'a+b')
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        _held.add(self)
+        return True
+
+    def release(self):
+        _held.discard(self)
+        if self._file is None:  # fork后已放弃
+            return
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+    def _abandon(self):
+        """
+        fork出的子进程中关闭继承的文件描述符：不能解锁（flock与父进程共用同一个打开的文件，解锁会释放父进程的锁），
+        也不能保留（否则父进程退出后锁仍被子进程占用，其他进程只能等到超时）
+        """
+        self._file.close()
+        self._file = None
+
+
+def _after_fork_in_child():
+    for lock in list(_held):
+        lock._abandon()
+    _held.clear()
+
+
+if hasattr(os, 'register_at_fork'):  # Windows没有fork
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def single_flight(lock, load, build, wait_timeout=600, poll_interval=0.5):
+    """
+    只由一个进程构建：获得锁的进程构建并发布，其他进程轮询等待结果发布后加载
+
+    获得锁后先再尝试一次加载（等锁期间可能已有其他进程发布）；
+    持锁进程崩溃时锁随租约到期（或进程退出）释放，由等待的进程接手构建；
+    等待超过wait_timeout时不再等待，自行构建
+
+    参数:
+        lock (RedisLease | FileLock | None): 构建锁（None表示不协调，直接构建）
+        load (callable): 加载已发布的结果，成功时返回True
+        build (callable): 构建并发布结果
+        wait_timeout (float): 最长等待时间（秒）
+        poll_interval (float): 等待期间检查结果是否发布的间隔（秒）
+
+    返回:
+        str: 'built'（本进程构建）或 'loaded'（加载了其他进程发布的结果）
+    """
+    if lock is None:
+        build()
+        return 'built'
+
+    deadline = time.monotonic() + wait_timeout
+    waiting = False
+    while True:
+        try:
+            acquired = lock.acquire()
+        except Exception as e:
+            print(f"获取构建锁失败: {e}，直接构建")
+            build()
+            return 'built'
+
+        if acquired:
+            try:
+                if load():
+                    return 'loaded'
+                build()
+                return 'built'
+            finally:
+                lock.release()
+
+        if not waiting:
+            print(f"其他进程正在构建（进程 {os.getpid()} 等待其发布结果，最长 {wait_timeout:g} 秒）...")
+            waiting = True
+        if load():
+            return 'loaded'
+        if time.monotonic() >= deadline:
+            print("等待构建结果超时，自行构建")
+            build()
+            return 'built'
+        time.sleep(poll_interval)
@@ -3,14 +3,429 @@
 包含加载电影和评分数据的函数以及数据预处理功能
 """
 
+import hashlib
+import json
+import os
+
+import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 from datetime import datetime
 
+from local_cache import LocalArrayCache
+
+
+def splice_csr_row(matrix, row, cols, values, n_cols=None):
+    """
+    替换CSR矩阵的某一行（row等于当前行数时在末尾追加一行）
+
+    参数:
+        matrix (csr_matrix): 原矩阵（不会被修改）
+        row (int): 行位置
+        cols (ndarray): 新行的列位置（升序）
+        values (ndarray): 新行的值
+        n_cols (int): 新矩阵的列数（None表示不变）
+
+    返回:
+        csr_matrix: 新矩阵，其余行的数据原样拷贝
+    """
+    indptr = matrix.indptr
+    if row == matrix.shape[0]:
+        indptr = np.append(indptr, indptr[-1])
+    start, end = indptr[row], indptr[row + 1]
+
+    indices = np.concatenate([matrix.indices[:start], np.asarray(cols, dtype=matrix.indices.dtype),
+                              matrix.indices[end:]])
+    data = np.concatenate([matrix.data[:start], np.asarray(values, dtype=matrix.data.dtype),
+                           matrix.data[end:]])
+    indptr = indptr.copy()
+    indptr[row + 1:] += len(cols) - (end - start)
+    shape = (len(indptr) - 1, n_cols or matrix.shape[1])
+    return sp.csr_matrix((data, indices, indptr), shape=shape)
+
+
+class RatingMatrix:
+    """
+    稀疏用户-电影评分矩阵（CSR格式）
+
+    只存储实际存在的评分，内存占用与评分数量成正比，
+    而不是用户数 × 电影数。
+
+    属性:
+        matrix (csr_matrix): 评分矩阵（行:用户位置, 列:电影位置, 值:评分）
+        user_ids (ndarray): 行位置 -> 用户ID
+        movie_ids (ndarray): 列位置 -> 电影ID
+        user_index (Index): 用户ID -> 行位置
+        movie_index (Index): 电影ID -> 列位置
+    """
+
+    def __init__(self, matrix, user_ids, movie_ids):
+        matrix = sp.csr_matrix(matrix, dtype=np.float64)
+        matrix.eliminate_zeros()  # 评分0视为未评分（与原pivot_table行为一致）
+        matrix.sort_indices()
+        # 行列索引统一使用int32，减少一半索引内存
+        matrix.indices = matrix.indices.astype(np.int32, copy=False)
+        matrix.indptr = matrix.indptr.astype(np.int32, copy=False)
+        self.matrix = matrix
+        self.user_ids = np.asarray(user_ids)
+        self.movie_ids = np.asarray(movie_ids)
+        self.user_index = pd.Index(self.user_ids)
+        self.movie_index = pd.Index(self.movie_ids)
+
+    @classmethod
+    def from_ratings(cls, ratings):
+        """
+        直接从评分记录构建稀疏矩阵（不经过稠密pivot table）
+
+        同一用户对同一电影的重复评分取平均值，与pivot_table的默认聚合一致
+        """
+        grouped = ratings.groupby(['user_id', 'movie_id'], sort=False)['rating'].mean()
+        user_ids = np.sort(grouped.index.get_level_values(0).unique().values)
+        movie_ids = np.sort(grouped.index.get_level_values(1).unique().values)
+
+        rows = pd.Index(user_ids).get_indexer(grouped.index.get_level_values(0)).astype(np.int32)
+        cols = pd.Index(movie_ids).get_indexer(grouped.index.get_level_values(1)).astype(np.int32)
+        matrix = sp.csr_matrix(
+            (grouped.values.astype(np.float64), (rows, cols)),
+            shape=(len(user_ids), len(movie_ids))
+        )
+        return cls(matrix, user_ids, movie_ids)
+
+    @classmethod
+    def from_dataframe(cls, user_movie_ratings):
+        """从稠密评分矩阵DataFrame构建（0或NaN表示未评分）"""
+        values = user_movie_ratings.fillna(0).values
+        return cls(sp.csr_matrix(values), user_movie_ratings.index.values,
+                   user_movie_ratings.columns.values)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def nnz(self):
+        return self.matrix.nnz
+
+    def fingerprint(self):
+        """
+        评分数据的内容指纹（评分值及用户/电影索引的哈希）
+
+        评分数据（即ratings.csv的内容）不变时指纹不变，用作相似度缓存的键
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for array in (self.matrix.indptr, self.matrix.indices, self.matrix.data,
+                      self.user_ids, self.movie_ids):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()
+
+    def user_loc(self, user_id):
+        """用户ID转换为行位置（不存在时抛出KeyError）"""
+        return self.user_index.get_loc(user_id)
+
+    def user_row(self, user_idx):
+        """返回某用户的 (已评分电影列位置, 评分值)，均为底层数组的视图"""
+        start, end = self.matrix.indptr[user_idx], self.matrix.indptr[user_idx + 1]
+        return self.matrix.indices[start:end], self.matrix.data[start:end]
+
+    def gather_rows(self, rows):
+        """
+        一次花式索引取出多个用户的评分（不构造子矩阵）
+
+        返回:
+            cols (ndarray): 各行已评分电影列位置（按行依次拼接）
+            values (ndarray): 对应评分
+            lengths (ndarray): 每行的评分数
+        """
+        indptr = self.matrix.indptr
+        starts = indptr[rows]
+        lengths = indptr[np.asarray(rows) + 1] - starts
+        # 每个元素在底层数组中的位置 = 所在行起点 + 行内偏移
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+        return self.matrix.indices[positions], self.matrix.data[positions], lengths
+
+    def set_rating(self, user_id, movie_id, rating):
+        """
+        写入（新增或覆盖）一条评分，新用户/新电影追加到末尾
+
+        返回:
+            user_idx (int): 该用户的行位置
+            new_user (bool): 是否新增了用户行
+        """
+        new_user = user_id not in self.user_index
+        if new_user:
+            self.user_ids = np.append(self.user_ids, user_id)
+            self.user_index = pd.Index(self.user_ids)
+        if movie_id not in self.movie_index:
+            self.movie_ids = np.append(self.movie_ids, movie_id)
+            self.movie_index = pd.Index(self.movie_ids)
+
+        user_idx = self.user_loc(user_id)
+        movie_idx = self.movie_index.get_loc(movie_id)
+        cols, values = (self.user_row(user_idx) if not new_user
+                        else (np.empty(0, dtype=np.int32), np.empty(0)))
+
+        pos = np.searchsorted(cols, movie_idx)
+        if pos < len(cols) and cols[pos] == movie_idx:
+            values = values.copy()
+            values[pos] = rating
+        else:
+            cols = np.insert(cols, pos, movie_idx)
+            values = np.insert(values, pos, rating)
+
+        self.matrix = splice_csr_row(self.matrix, user_idx, cols, values, len(self.movie_ids))
+        return user_idx, new_user
+
+    def remove_rating(self, user_id, movie_id):
+        """
+        删除一条评分
+
+        返回:
+            int | None: 该用户的行位置，评分不存在时返回None
+        """
+        if user_id not in self.user_index or movie_id not in self.movie_index:
+            return None
+        user_idx = self.user_loc(user_id)
+        cols, values = self.user_row(user_idx)
+        keep = cols != self.movie_index.get_loc(movie_id)
+        if keep.all():
+            return None
+        self.matrix = splice_csr_row(self.matrix, user_idx, cols[keep], values[keep])
+        return user_idx
+
+    @classmethod
+    def _from_csr_arrays(cls, data, indices, indptr, user_ids, movie_ids):
+        """由已规范化（int32索引、行内有序、无显式0）的CSR数组直接构建，不做任何转换或拷贝"""
+        rating_matrix = cls.__new__(cls)
+        matrix = sp.csr_matrix((data, indices, indptr), shape=(len(user_ids), len(movie_ids)), copy=False)
+        matrix.has_sorted_indices = True
+        rating_matrix.matrix = matrix
+        rating_matrix.user_ids = user_ids
+        rating_matrix.movie_ids = movie_ids
+        rating_matrix.user_index = pd.Index(user_ids)
+        rating_matrix.movie_index = pd.Index(movie_ids)
+        return rating_matrix
+
+    def share(self, cache_dir):
+        """
+        把评分矩阵的数组（CSR数据与索引、用户/电影ID）发布到本地缓存目录，
+        返回以只读内存映射方式打开的同一矩阵
+
+        同一台机器上的worker进程映射同一组文件，这些数组只占一份页缓存；
+        映射的页不属于Python对象，引用计数和GC不会在fork出的进程中触发写时复制。
+        评分增量更新总是生成新的数组，不会写入映射文件
+
+        返回:
+            RatingMatrix: 共享的矩阵（无法写入缓存目录时返回自身）
+        """
+        arrays = {
+            'data': self.matrix.data,
+            'indices': self.matrix.indices,
+            'indptr': self.matrix.indptr,
+            'user_ids': self.user_ids,
+            'movie_ids': self.movie_ids,
+        }
+        name = f"ratings_{self.fingerprint()}"
+        try:
+            cache = LocalArrayCache(cache_dir)
+            shared = {field: cache.load(f"{name}_{field}") for field in arrays}
+            if any(array is None for array in shared.values()):
+                # 其他worker进程尚未发布（写入为原子替换，多个进程同时写入也不会产生半写的文件）
+                for field, array in arrays.items():
+                    cache.save(f"{name}_{field}", array)
+                cache.remove("ratings_", keep=[f"{name}_{field}" for field in arrays])
+                shared = {field: cache.load(f"{name}_{field}") for field in arrays}
+        except OSError as e:
+            print(f"[本地缓存] 评分矩阵共享失败: {e}")
+            return self
+        if any(array is None for array in shared.values()):
+            return self
+        return RatingMatrix._from_csr_arrays(**shared)
+
+    def to_dataframe(self):
+        """转换为稠密DataFrame（0表示未评分，仅用于调试或小数据集）"""
+        return pd.DataFrame(self.matrix.toarray(), index=self.user_ids, columns=self.movie_ids)
+
+
+SNAPSHOT_VERSION = 2
+
+
+def _source_key(path):
+    """CSV文件的修改时间与大小（任一变化即视为快照过期）"""
+    stat = os.stat(path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def _source_tag(source):
+    """列文件名前缀：列文件按源文件版本命名，元数据只会引用同一版本源文件生成的列"""
+    return f"{source['mtime_ns']:x}-{source['size']:x}"
+
 
-def load_data():
+def _encode_text(values):
+    """
+    文本列编码为 UTF-8 字节缓冲区 + 每行的字符偏移 + 缺失值标记（不经过pickle）
+
+    列中含有非字符串的值时抛出ValueError（该表不写快照）
+    """
+    missing = pd.isna(values)
+    strings = ['' if is_missing else value for value, is_missing in zip(values, missing)]
+    if not all(isinstance(value, str) for value in strings):
+        raise ValueError("文本列含有非字符串的值，无法写入快照")
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in strings], out=offsets[1:])
+    text = np.frombuffer(''.join(strings).encode('utf-8'), dtype=np.uint8)
+    return {'text': text, 'offsets': offsets, 'missing': missing}
+
+
+def _decode_text(text, offsets, missing):
+    """还原文本列（对象数组，缺失值为NaN，与 pd.read_csv 的结果一致）"""
+    text = text.tobytes().decode('utf-8')
+    bounds = offsets.tolist()
+    values = np.empty(len(missing), dtype=object)
+    values[:] = [text[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+    values[missing] = np.nan
+    return values
+
+
+def read_snapshot(path, snapshot_dir):
+    """
+    读取CSV对应的列式快照（所有文件都以 allow_pickle=False 读取）
+
+    返回:
+        DataFrame | None: 快照不存在、已过期或不完整时返回None
+    """
+    try:
+        with open(os.path.join(snapshot_dir, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != SNAPSHOT_VERSION or meta.get('source') != _source_key(path):
+            return None
+        columns = {}
+        for column in meta['columns']:
+            file_path = os.path.join(snapshot_dir, column['file'])
+            if column['kind'] == 'text':
+                with np.load(file_path, allow_pickle=False) as parts:
+                    values = _decode_text(parts['text'], parts['offsets'], parts['missing'])
+            else:
+                values = np.load(file_path, allow_pickle=False)
+            if len(values) != meta['rows']:
+                return None
+            columns[column['name']] = values
+    except (OSError, ValueError, KeyError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"[快照] 读取 {snapshot_dir} 失败: {e}")
+        return None
+    return pd.DataFrame(columns, columns=[column['name'] for column in meta['columns']])
+
+
+def write_snapshot(df, snapshot_dir, source):
+    """
+    把DataFrame按列写入快照目录（每列一个文件，元数据最后写入）
+
+    数值/日期列保存为原始 .npy，文本列保存为 .npz（字节缓冲区 + 偏移），都不使用pickle。
+    列文件名带有源文件版本前缀，每个文件先写临时文件再原子替换：
+    多个进程同时重建时，同一源文件版本写出的列内容相同，不同版本的列文件互不覆盖，
+    元数据引用的列总是来自同一版本；发布后删除其他版本的列文件
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    tag = _source_tag(source)
+
+    def atomic_write(filename, write):
+        tmp_path = os.path.join(snapshot_dir, f"{filename}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, os.path.join(snapshot_dir, filename))
+
+    # 先编码所有列（含有无法无pickle保存的列时不写入任何文件）
+    encoded = []
+    for i, name in enumerate(df.columns):
+        values = df[name].to_numpy()
+        if values.dtype == object:
+            encoded.append((name, 'text', f"{tag}_col{i}.npz", _encode_text(values)))
+        else:
+            encoded.append((name, 'array', f"{tag}_col{i}.npy", values))
+
+    columns = []
+    for name, kind, filename, values in encoded:
+        if kind == 'text':
+            atomic_write(filename, lambda f: np.savez(f, **values))
+        else:
+            atomic_write(filename, lambda f: np.save(f, values, allow_pickle=False))
+        columns.append({'name': name, 'kind': kind, 'file': filename})
+    meta = {'version': SNAPSHOT_VERSION, 'source': source, 'rows': len(df), 'columns': columns}
+    atomic_write('meta.json', lambda f: f.write(json.dumps(meta, ensure_ascii=False).encode('utf-8')))
+
+    for filename in os.listdir(snapshot_dir):
+        if filename.endswith(('.npy', '.npz')) and not filename.startswith(f"{tag}_"):
+            try:
+                os.remove(os.path.join(snapshot_dir, filename))
+            except FileNotFoundError:
+                pass
+
+
+def load_table(path, prepare=None, snapshot_dir=None):
+    """
+    加载CSV表（带列式快照）
+
+    CSV文件未变化时直接读取快照（只需读取各列的二进制数据），
+    否则解析CSV、调用prepare(df)处理后重新写入快照
+
+    参数:
+        path (str): CSV文件路径
+        prepare (callable): 解析后的处理函数（结果保存在快照中，快照命中时不再调用）
+        snapshot_dir (str): 快照目录（None表示不使用快照）
+
+    返回:
+        DataFrame: 处理后的数据
+    """
+    if snapshot_dir:
+        df = read_snapshot(path, snapshot_dir)
+        if df is not None:
+            return df
+
+    source = _source_key(path)  # 解析前记录，解析期间文件被修改时快照会在下次加载时重建
+    df = pd.read_csv(path)
+    if prepare is not None:
+        df = prepare(df)
+    if snapshot_dir:
+        try:
+            write_snapshot(df, snapshot_dir, source)
+        except (OSError, ValueError) as e:
+            print(f"[快照] 写入 {snapshot_dir} 失败: {e}")
+    return df
+
+
+def _parse_duration(duration):
+    """将电影时长字符串（"Xh Ym"格式）解析为分钟数"""
+    if pd.isna(duration):
+        return 0  # 缺失值处理
+
+    parts = duration.split()
+    # 提取小时部分
+    hours = int(parts[0].replace('h', '')) if 'h' in parts[0] else 0
+    # 提取分钟部分（如果有）
+    minutes = int(parts[1].replace('m', '')) if len(parts) > 1 and 'm' in parts[1] else 0
+    return hours * 60 + minutes
+
+
+def _prepare_movies(movies):
+    # 应用时长解析函数
+    movies['duration_min'] = movies['duration'].apply(_parse_duration)
+    return movies
+
+
+def _prepare_ratings(ratings):
+    # 转换时间戳为日期格式
+    ratings['rating_date'] = pd.to_datetime(ratings['timestamp'], unit='s')
+    return ratings
+
+
+def load_data(data_dir='data'):
     """
     加载并处理电影和评分数据
 
+    参数:
+        data_dir (str): 数据目录（movies.csv 与 ratings.csv 所在目录）
+
     返回:
         movies (DataFrame): 处理后的电影数据
         ratings (DataFrame): 处理后的评分数据
@@ -19,31 +434,16 @@ def load_data():
         1. 从CSV文件加载原始数据
         2. 处理电影时长格式（将"Xh Ym"转换为分钟数）
         3. 转换评分时间戳为可读日期格式
+
+    处理结果保存为列式快照（默认 data_dir/snapshot，环境变量 DATA_SNAPSHOT_DIR，设为空表示不使用），
+    CSV文件的修改时间和大小未变化时直接读取快照，跳过文本解析与上述处理
     """
+    snapshot_root = os.getenv('DATA_SNAPSHOT_DIR', os.path.join(data_dir, 'snapshot'))
     try:
-        # 加载原始数据
-        movies = pd.read_csv('data/movies.csv')
-        ratings = pd.read_csv('data/ratings.csv')
-
-        # 自定义函数：解析电影时长（"Xh Ym"格式）
-        def parse_duration(duration):
-            """将电影时长字符串解析为分钟数"""
-            if pd.isna(duration):
-                return 0  # 缺失值处理
-
-            parts = duration.split()
-            # 提取小时部分
-            hours = int(parts[0].replace('h', '')) if 'h' in parts[0] else 0
-            # 提取分钟部分（如果有）
-            minutes = int(parts[1].replace('m', '')) if len(parts) > 1 and 'm' in parts[1] else 0
-            return hours * 60 + minutes
-
-        # 应用时长解析函数
-        movies['duration_min'] = movies['duration'].apply(parse_duration)
-
-        # 转换时间戳为日期格式
-        ratings['rating_date'] = pd.to_datetime(ratings['timestamp'], unit='s')
-
+        movies = load_table(os.path.join(data_dir, 'movies.csv'), _prepare_movies,
+                            snapshot_root and os.path.join(snapshot_root, 'movies'))
+        ratings = load_table(os.path.join(data_dir, 'ratings.csv'), _prepare_ratings,
+                             snapshot_root and os.path.join(snapshot_root, 'ratings'))
         return movies, ratings
 
     except FileNotFoundError as e:
@@ -57,17 +457,18 @@ def load_data():
         return None, None
 
 
-def preprocess_data(movies, ratings):
+def preprocess_data(movies, ratings, sparse=False):
     """
     数据预处理：创建用于推荐系统的结构化数据
 
     参数:
         movies (DataFrame): 电影数据
         ratings (DataFrame): 评分数据
+        sparse (bool): 是否以CSR稀疏矩阵（RatingMatrix）返回评分矩阵
 
     返回:
         movie_ratings (DataFrame): 合并后的电影评分数据
-        user_movie_ratings (DataFrame): 用户-电影评分矩阵
+        user_movie_ratings (DataFrame | RatingMatrix): 用户-电影评分矩阵
         movie_info (DataFrame): 以电影ID为索引的电影信息
 
     处理步骤:
@@ -79,14 +480,18 @@ def preprocess_data(movies, ratings):
         # 合并电影和评分数据
         movie_ratings = pd.merge(ratings, movies, on='movie_id')
 
-        # 创建用户-电影评分矩阵（pivot table）
-        # 行: user_id, 列: movie_id, 值: rating
-        user_movie_ratings = ratings.pivot_table(
-            index='user_id',
-            columns='movie_id',
-            values='rating',
-            fill_value=0  # 用0填充缺失值（表示该用户未评分的电影）
-        )
+        if sparse:
+            # 稀疏模式：直接由评分记录构建CSR矩阵，避免稠密的用户×电影表
+            user_movie_ratings = RatingMatrix.from_ratings(ratings)
+        else:
+            # 创建用户-电影评分矩阵（pivot table）
+            # 行: user_id, 列: movie_id, 值: rating
+            user_movie_ratings = ratings.pivot_table(
+                index='user_id',
+                columns='movie_id',
+                values='rating',
+                fill_value=0  # 用0填充缺失值（表示该用户未评分的电影）
+            )
 
         # 创建以电影ID为索引的电影信息表
         movie_info = movies.set_index('movie_id')
@@ -0,0 +1,219 @@
+"""
+推荐系统离线评估
+按时间对每个用户的评分做留出划分（较早的评分训练、最近的评分测试），
+用批量接口一次性为所有测试用户计算推荐和预测评分，报告 RMSE、precision@N、recall@N 和覆盖率；
+多个时间折（每折向前平移一个测试窗口）在多个进程中并行评估
+
+运行: python evaluation.py --k 5 10 20 --min-similarity 0.0 0.1 --precision float64 int8 --folds 3 --jobs 3
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_loader import load_data, preprocess_data
+from recommender import UserCFRecommender
+
+
+def temporal_split(ratings, test_ratio=0.2, fold=0, min_train=2):
+    """
+    按时间对每个用户的评分做留出划分
+
+    每个用户的评分按时间从新到旧排列，取 max(1, round(评分数 × test_ratio)) 条作为一个测试窗口；
+    第fold折的测试集为从最新开始的第fold个窗口，训练集只包含比测试窗口更早的评分（不使用未来数据）
+
+    参数:
+        ratings (DataFrame): 评分数据（需包含 user_id, movie_id, rating, timestamp）
+        test_ratio (float): 每个用户测试窗口占其评分数的比例
+        fold (int): 折序号（0为最近的窗口）
+        min_train (int): 训练评分少于该数量的用户不参与测试
+
+    返回:
+        train (DataFrame), test (DataFrame)
+    """
+    ordered = ratings.sort_values(['user_id', 'timestamp', 'movie_id'], ascending=[True, False, False])
+    counts = ordered.groupby('user_id')['movie_id'].transform('size').to_numpy()
+    recency = ordered.groupby('user_id').cumcount().to_numpy()  # 0为该用户最新的评分
+    window = np.maximum(1, np.rint(counts * test_ratio)).astype(int)
+
+    test_mask = (recency >= fold * window) & (recency < (fold + 1) * window)
+    train_mask = recency >= (fold + 1) * window
+    # 训练评分不足的用户无法得到可靠的相似度，不参与测试
+    enough_train = (counts - (fold + 1) * window) >= min_train
+    return ordered[train_mask].reset_index(drop=True), ordered[test_mask & enough_train].reset_index(drop=True)
+
+
+def score_recommendations(recommender, test, configs, n, relevance_threshold):
+    """
+    在同一个推荐器（即同一份相似度）上评估多组在线参数
+
+    参数:
+        recommender (UserCFRecommender): 已在训练集上构建的推荐器
+        test (DataFrame): 测试评分
+        configs (list): (k, min_similarity) 组合
+        n (int): 推荐列表长度
+        relevance_threshold (float): 测试评分不低于该值的电影视为相关
+
+    返回:
+        list: 每组参数的指标字典
+    """
+    ratings = recommender.user_movie_ratings
+    n_movies = ratings.shape[1]
+    test_users = test['user_id'].unique()
+    user_pos = pd.Index(test_users)
+    relevant = test[test['rating'] >= relevance_threshold]
+    relevant_users = user_pos.get_indexer(relevant['user_id'])
+    relevant_cols = ratings.movie_index.get_indexer(relevant['movie_id'])
+    # 训练集中没有出现过的电影不可能被推荐，只计入召回率的分母
+    relevant_keys = relevant_users[relevant_cols >= 0].astype(np.int64) * n_movies + relevant_cols[relevant_cols >= 0]
+    relevant_counts = np.bincount(relevant_users, minlength=len(test_users))
+    has_relevant = relevant_counts > 0
+
+    results = []
+    for k, min_similarity in configs:
+        # 推荐列表: 一次批量计算全部测试用户（相似用户不足的用户使用后备推荐，与线上一致）
+        rec_keys, rec_cols, n_fallback = [], [], 0
+        for i, (_, user_idx, top_cols, _) in enumerate(
+                recommender._iter_batch_scores(test_users, k, n, min_similarity)):
+            if top_cols is None:
+                n_fallback += 1
+                fallback = recommender._batch_fallback(user_idx, n)
+                top_cols = ratings.movie_index.get_indexer([rec['movie_id'] for rec in fallback])
+                top_cols = top_cols[top_cols >= 0]
+            rec_cols.append(top_cols)
+            rec_keys.append(i * n_movies + np.asarray(top_cols, dtype=np.int64))
+        rec_keys = np.concatenate(rec_keys) if rec_keys else np.zeros(0, dtype=np.int64)
+
+        hit_keys = rec_keys[np.isin(rec_keys, relevant_keys)]
+        hits = np.bincount(hit_keys // n_movies, minlength=len(test_users))
+
+        # 预测评分: 所有测试评分对一次批量预测
+        predictions = recommender.predict_ratings(test['user_id'], test['movie_id'], k, min_similarity)
+        predicted = ~np.isnan(predictions)
+        errors = predictions[predicted] - test['rating'].to_numpy()[predicted]
+
+        results.append({
+            'k': k,
+            'min_similarity': min_similarity,
+            'rmse': float(np.sqrt(np.mean(errors ** 2))) if len(errors) else float('nan'),
+            'mae': float(np.mean(np.abs(errors))) if len(errors) else float('nan'),
+            'prediction_coverage': float(predicted.mean()) if len(predicted) else 0.0,
+            f'precision@{n}': float((hits[has_relevant] / n).mean()) if has_relevant.any() else 0.0,
+            f'recall@{n}': float((hits[has_relevant] / relevant_counts[has_relevant]).mean())
+            if has_relevant.any() else 0.0,
+            'catalog_coverage': len(np.unique(np.concatenate(rec_cols))) / n_movies if rec_cols else 0.0,
+            'fallback_rate': n_fallback / max(len(test_users), 1),
+            'test_users': len(test_users),
+        })
+    return results
+
+
+def evaluate_fold(movies, ratings, fold, options):
+    """
+    评估一个时间折: 在训练集上为每组构建参数（精度、邻居表大小）构建一次相似度，
+    再评估所有在线参数组合
+
+    推荐器的构建参数全部显式指定（不受 SIMILARITY_* 环境变量影响），不使用本地文件和Redis缓存；
+    结果中记录推荐器实际使用的精度与计算模式
+
+    返回:
+        list: 指标字典（附带fold及构建参数）
+    """
+    train, test = temporal_split(ratings, options['test_ratio'], fold, options['min_train'])
+    _, user_movie_ratings, movie_info = preprocess_data(movies, train, sparse=True)
+    configs = list(itertools.product(options['k'], options['min_similarity']))
+
+    rows = []
+    for precision, neighbor_k in itertools.product(options['precision'], options['neighbor_k']):
+        # 评估不使用任何缓存，推荐过程中的提示信息不输出
+        with contextlib.redirect_stdout(io.StringIO()):
+            recommender = UserCFRecommender(user_movie_ratings, movie_info, neighbor_k=neighbor_k or None,
+                                            cache_dir=None, similarity_precision=precision,
+                                            similarity_mode='eager', neighbor_source='exact')
+            recommender.redis_client = None
+            recommender.calculate_similarity()
+            scores = score_recommendations(recommender, test, configs, options['n'],
+                                           options['relevance_threshold'])
+        for row in scores:
+            rows.append({'fold': fold, 'precision': recommender.similarity_precision,
+                         'similarity_mode': recommender.similarity_mode,
+                         'neighbor_source': recommender.neighbor_source, 'neighbor_k': neighbor_k, **row})
+    return rows
+
+
+def evaluate(movies, ratings, folds=1, jobs=1, **options):
+    """
+    评估全部时间折（jobs > 1 时各折在独立进程中并行评估）
+
+    返回:
+        DataFrame: 每折每组参数一行指标
+    """
+    options = {
+        'test_ratio': 0.2, 'min_train': 2, 'n': 10, 'relevance_threshold': 7.0,
+        'k': [5], 'min_similarity': [0.1], 'precision': ['float64'], 'neighbor_k': [50],
+        **options,
+    }
+    if jobs > 1 and folds > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, folds)) as executor:
+            fold_rows = list(executor.map(evaluate_fold, itertools.repeat(movies), itertools.repeat(ratings),
+                                          range(folds), itertools.repeat(options)))
+    else:
+        fold_rows = [evaluate_fold(movies, ratings, fold, options) for fold in range(folds)]
+    return pd.DataFrame([row for rows in fold_rows for row in rows])
+
+
+def print_report(results, n):
+    """按参数组合汇总各折的平均指标"""
+    params = ['precision', 'similarity_mode', 'neighbor_source', 'neighbor_k', 'k', 'min_similarity']
+    metrics = ['rmse', 'mae', 'prediction_coverage', f'precision@{n}', f'recall@{n}',
+               'catalog_coverage', 'fallback_rate']
+    summary = results.groupby(params, sort=False)[metrics].mean().reset_index()
+    n_folds = results['fold'].nunique()
+    print(f"离线评估结果（{n_folds}折平均，每折测试用户数 {int(results['test_users'].mean())}）")
+    with pd.option_context('display.width', 200, 'display.max_columns', None,
+                           'display.float_format', '{:.4f}'.format):
+        print(summary.to_string(index=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推荐系统离线评估")
+    parser.add_argument('--k', type=int, nargs='+', default=[5], help="相似用户数量")
+    parser.add_argument('--min-similarity', type=float, nargs='+', default=[0.1], help="最小相似度阈值")
+    parser.add_argument('--precision', nargs='+', default=['float64'], help="相似度存储精度")
+    parser.add_argument('--neighbor-k', type=int, nargs='+', default=[50], help="TopK邻居表大小（0表示完整矩阵）")
+    parser.add_argument('--n', type=int, default=10, help="推荐列表长度（precision@N / recall@N）")
+    parser.add_argument('--test-ratio', type=float, default=0.2, help="每个用户测试窗口占其评分数的比例")
+    parser.add_argument('--relevance-threshold', type=float, default=7.0, help="视为相关的最低测试评分")
+    parser.add_argument('--folds', type=int, default=1, help="时间折数")
+    parser.add_argument('--jobs', type=int, default=1, help="并行进程数")
+    parser.add_argument('--synthetic-users', type=int, default=0,
+                        help="使用指定用户数的合成数据集（0表示读取data目录的数据）")
+    parser.add_argument('--output', default=None, help="各折明细结果CSV路径")
+    args = parser.parse_args()
+
+    if args.synthetic_users:
+        from benchmarks.synthetic import make_dataset
+        movies, ratings = make_dataset(args.synthetic_users)
+    else:
+        movies, ratings = load_data()
+        if movies is None or ratings is None:
+            print("无法加载数据，请确保已运行scraper.py爬取数据")
+            return
+
+    results = evaluate(movies, ratings, folds=args.folds, jobs=args.jobs, test_ratio=args.test_ratio,
+                       n=args.n, relevance_threshold=args.relevance_threshold, k=args.k,
+                       min_similarity=args.min_similarity, precision=args.precision,
+                       neighbor_k=args.neighbor_k)
+    print_report(results, args.n)
+    if args.output:
+        results.to_csv(args.output, index=False)
+        print(f"\n明细结果已写入 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+gunicorn配置
+运行: gunicorn -c gunicorn.conf.py app:app
+
+预加载模式（默认开启）: 主进程导入应用、加载数据并等待模型预热完成后再fork worker，
+评分矩阵、相似度/邻居表和ALS因子都是本地缓存文件的只读内存映射，worker之间共享同一份页缓存；
+fork前冻结GC（gc.freeze），worker中的垃圾回收不会遍历并改写继承来的对象，避免写时复制。
+增加worker数量几乎不增加模型内存
+"""
+
+import gc
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', 4))
+threads = int(os.getenv('GUNICORN_THREADS', 1))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+
+
+def when_ready(server):
+    """fork worker之前在主进程中等待模型预热完成（超时后由各worker自行初始化）"""
+    if not server.cfg.preload_app:
+        return
+    import app
+    timeout = float(os.getenv('WARM_UP_FORK_TIMEOUT', 300))
+    if not app.wait_for_warm_up(timeout):
+        server.log.warning(f"模型预热 {timeout:g} 秒内未完成，由各worker自行初始化")
+    elif app.model_status['recommender'] == 'failed' or app.model_status['similar_movies'] == 'failed':
+        server.log.warning(f"模型预热失败（{app.model_status['error']}），由各worker自行初始化")
+    else:
+        server.log.info("模型预热完成，开始启动worker")
+
+
+def pre_fork(server, worker):
+    # 之前创建的对象移入永久代，worker中的GC不再扫描它们
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        import app
+        app.after_fork()
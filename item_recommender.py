@@ -0,0 +1,214 @@
+"""
+基于物品的协同过滤推荐系统实现
+预先计算每部电影的TopK相似电影表（调整余弦相似度），
+在线推荐只需遍历用户评过的电影，代价与用户的评分数成正比，与用户总数无关
+"""
+
+import os
+
+import numpy as np
+
+from data_loader import RatingMatrix
+from local_cache import LocalArrayCache
+from recommender import DEFAULT_CACHE_DIR, _setting
+from serving import ServingMixin
+from similarity import center_ratings, build_neighbor_index, block_rows_for_budget
+
+
+class ItemCFRecommender(ServingMixin):
+    def __init__(self, user_movie_ratings, movie_info, neighbor_k=50, max_memory_mb=None, block_size=None,
+                 cache_dir=DEFAULT_CACHE_DIR):
+        """
+        初始化基于物品的推荐系统
+
+        显式传入的参数优先；为None的参数读取对应的环境变量（括号中），未设置时使用默认值
+
+        参数:
+            user_movie_ratings (DataFrame | RatingMatrix): 用户-电影评分矩阵（行:用户, 列:电影）
+            movie_info (DataFrame): 电影元数据信息
+            neighbor_k (int): 每部电影保留的相似电影数量
+            max_memory_mb (float): 分块计算相似度时的工作内存预算（MB；SIMILARITY_MAX_MEMORY_MB，默认256）
+            block_size (int): 每块的电影数（None表示按内存预算自动确定）
+            cache_dir (str): 本地内存映射缓存目录（None表示不使用本地缓存；
+                使用默认目录时可由 SIMILARITY_CACHE_DIR 替换）
+
+        属性:
+            neighbor_ids: 每部电影的TopK相似电影列位置（int32, M×K，按相似度降序）
+            neighbor_sims: 对应的相似度（float32, M×K）
+        """
+        if not isinstance(user_movie_ratings, RatingMatrix):
+            user_movie_ratings = RatingMatrix.from_dataframe(user_movie_ratings)
+        self.user_movie_ratings = user_movie_ratings
+        self.movie_info = movie_info
+        self.neighbor_k = neighbor_k
+        self.max_memory_mb = float(_setting(max_memory_mb, 'SIMILARITY_MAX_MEMORY_MB', 256))
+        self.block_size = block_size
+        self.neighbor_ids = None
+        self.neighbor_sims = None
+        self._fingerprint = None
+
+        self.local_cache = None
+        if cache_dir == DEFAULT_CACHE_DIR:
+            cache_dir = os.getenv('SIMILARITY_CACHE_DIR', cache_dir)
+        if cache_dir:
+            try:
+                self.local_cache = LocalArrayCache(cache_dir)
+            except OSError as e:
+                print(f"警告: 无法创建本地缓存目录 {cache_dir}: {e}")
+
+    def _local_cache_names(self):
+        """相似电影表的本地缓存前缀及名称（按评分数据指纹区分）"""
+        if self._fingerprint is None:
+            self._fingerprint = self.user_movie_ratings.fingerprint()
+        prefix = f"item_top{self.neighbor_k}_"
+        return prefix, [f"{prefix}{self._fingerprint}_ids", f"{prefix}{self._fingerprint}_sims"]
+
+    def calculate_similarity(self, force_recompute=False):
+        """
+        计算每部电影的TopK相似电影表（优先使用本地缓存）
+
+        相似度为调整余弦相似度：评分先按用户均值中心化，再计算电影列向量之间的余弦，
+        消除不同用户打分尺度的差异
+        """
+        if self.local_cache is not None and not force_recompute:
+            _, names = self._local_cache_names()
+            arrays = [self.local_cache.load(name) for name in names]
+            if all(array is not None for array in arrays):
+                print("[本地缓存] 从内存映射文件加载相似电影表")
+                self.neighbor_ids, self.neighbor_sims = arrays
+                return
+
+        # 缓存名称按构建所用的评分快照确定（构建期间评分变化时结果不会保存到新数据的指纹下）
+        matrix = self.user_movie_ratings.matrix
+        self._fingerprint = None
+        prefix, names = self._local_cache_names()
+        centered, _ = center_ratings(matrix)
+        items = centered.T.tocsr()
+        norms = np.sqrt(np.asarray(items.multiply(items).sum(axis=1)).ravel())
+        block_size = self.block_size or block_rows_for_budget(items.shape[0], self.max_memory_mb)
+
+        print(f"分块构建电影TopK相似表 (K={self.neighbor_k}, 每块{block_size}部)...")
+        self.neighbor_ids, self.neighbor_sims = build_neighbor_index(items, norms, self.neighbor_k, block_size)
+
+        if self.local_cache is not None:
+            try:
+                self.local_cache.save(names[0], self.neighbor_ids)
+                self.local_cache.save(names[1], self.neighbor_sims)
+                self.local_cache.remove(prefix, keep=names)
+            except OSError as e:
+                print(f"[本地缓存] 写入失败: {e}")
+                return
+            # 改用只读内存映射，同机的worker进程共享同一份页缓存
+            ids, sims = (self.local_cache.load(name) for name in names)
+            if ids is not None and sims is not None:
+                self.neighbor_ids, self.neighbor_sims = ids, sims
+
+    def _ensure_similarity(self):
+        """确保相似电影表已计算"""
+        if self.neighbor_ids is None:
+            self.calculate_similarity()
+
+    def warm_up(self):
+        """预热: 构建（或从本地缓存加载）相似电影表"""
+        self._ensure_similarity()
+        super().warm_up()
+
+    def apply_rating(self, user_id, movie_id, rating):
+        """
+        写入（新增或修改）一条评分
+
+        推荐时直接读取用户最新的评分，立即生效；相似电影表反映的是整体评分分布，
+        单条评分影响很小，下次重建时更新
+        """
+        self.user_movie_ratings.set_rating(user_id, movie_id, rating)
+        self._fingerprint = None
+
+    def remove_rating(self, user_id, movie_id):
+        """删除一条评分（评分不存在时忽略）"""
+        self.user_movie_ratings.remove_rating(user_id, movie_id)
+        self._fingerprint = None
+
+    def recommend_items(self, user_id, k=20, n=10, min_similarity=0.1):
+        """
+        生成个性化电影推荐
+
+        参数:
+            user_id: 目标用户ID
+            k: 每部已评分电影使用的相似电影数量（默认20，不超过neighbor_k）
+            n: 返回的推荐电影数量（默认10）
+            min_similarity: 最小相似度阈值（默认0.1）
+
+        返回:
+            list: 推荐电影列表，按预测评分排序（个性化候选不足n个时用热门电影补齐）
+        """
+        self._ensure_similarity()
+
+        try:
+            ratings = self.user_movie_ratings
+            user_idx = ratings.user_loc(user_id)
+            rated_cols, rated_values = ratings.user_row(user_idx)
+
+            # 相似表构建之后才新增的电影没有相似电影
+            known = rated_cols < len(self.neighbor_ids)
+            neighbors = self.neighbor_ids[rated_cols[known], :k]
+            sims = self.neighbor_sims[rated_cols[known], :k].astype(np.float64)
+            valid = sims >= min_similarity
+
+            # 候选电影的预测评分 = 用户对其相似电影评分的加权平均
+            cols = neighbors[valid]
+            weights = sims[valid]
+            values = np.broadcast_to(rated_values[known, None], sims.shape)[valid]
+            candidate_movies, inverse = np.unique(cols, return_inverse=True)
+            weighted_sum = np.bincount(inverse, weights * values, len(candidate_movies))
+            weight_sum = np.bincount(inverse, weights, len(candidate_movies))
+            pred_ratings = np.divide(
+                weighted_sum,
+                weight_sum,
+                out=np.zeros_like(weighted_sum),
+                where=(weight_sum != 0)
+            )
+
+            unrated = ~np.isin(candidate_movies, rated_cols, assume_unique=True)
+            top_cols, top_scores = self._top_n(candidate_movies[unrated], pred_ratings[unrated], n)
+            recommendations = self._format_recommendations(top_cols, top_scores)
+
+            if len(recommendations) < n:
+                print(f"警告: 相似电影不足({len(recommendations)}部)，使用热门电影补充")
+                exclude = np.concatenate((rated_cols, top_cols))
+                recommendations += self._get_fallback_recommendations(n - len(recommendations), exclude)
+            return recommendations
+
+        except KeyError:
+            print(f"错误: 用户ID {user_id} 不存在，返回热门电影")
+            return self._get_fallback_recommendations(n)
+        except Exception as e:
+            print(f"推荐过程中出错: {e}")
+            return self._get_fallback_recommendations(n)
+
+    def similar_items(self, movie_id, n=10):
+        """
+        获取与指定电影最相似的电影
+
+        参数:
+            movie_id: 电影ID
+            n: 返回数量（不超过neighbor_k）
+
+        返回:
+            list: 相似电影信息（含 similarity 字段），按相似度降序；电影无评分数据时返回空列表
+        """
+        self._ensure_similarity()
+        ratings = self.user_movie_ratings
+        if movie_id not in ratings.movie_index:
+            return []
+        col = ratings.movie_index.get_loc(movie_id)
+        if col >= len(self.neighbor_ids):
+            return []
+
+        self._ensure_serving_layout()
+        sims = self.neighbor_sims[col, :n]
+        cols = self.neighbor_ids[col, :n][sims > 0]  # 只返回正相关的电影
+        return [{
+            'movie_id': ratings.movie_ids[c],
+            'similarity': round(float(sim), 4),
+            **self._movie_records[c]
+        } for c, sim in zip(cols, sims[sims > 0])]
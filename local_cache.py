@@ -0,0 +1,81 @@
+"""
+本地文件缓存模块
+将数组保存为 .npy 文件，加载时以只读内存映射方式打开，
+同一台机器上的多个worker进程共享同一份页缓存
+"""
+
+import os
+
+import numpy as np
+
+
+class LocalArrayCache:
+    def __init__(self, cache_dir):
+        """
+        初始化本地数组缓存
+
+        参数:
+            cache_dir (str): 缓存文件目录（不存在时自动创建）
+        """
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, name):
+        """缓存项对应的文件路径"""
+        return os.path.join(self.cache_dir, f"{name}.npy")
+
+    def load(self, name):
+        """
+        以只读内存映射方式加载缓存项
+
+        返回:
+            np.memmap | None: 缓存不存在或文件损坏时返回None
+        """
+        path = self.path(name)
+        if not os.path.exists(path):
+            return None
+        try:
+            return np.load(path, mmap_mode='r')
+        except (OSError, ValueError) as e:
+            print(f"[本地缓存] 读取 {path} 失败: {e}")
+            return None
+
+    def save(self, name, array):
+        """写入缓存项（先写临时文件再原子替换，读者不会看到半写的文件）"""
+        tmp_path = self._tmp_path(name)
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.asarray(array))
+        os.replace(tmp_path, self.path(name))
+
+    def create(self, name, shape, dtype):
+        """
+        创建一个可写的内存映射临时文件，供计算结果直接流式写入
+
+        返回:
+            np.memmap: 可写数组，写完后调用 commit(name, array) 发布
+        """
+        return np.lib.format.open_memmap(self._tmp_path(name), mode='w+', dtype=dtype, shape=shape)
+
+    def commit(self, name, array):
+        """发布 create() 创建的文件，返回只读内存映射"""
+        array.flush()
+        os.replace(array.filename, self.path(name))
+        return self.load(name)
+
+    def remove(self, prefix, keep=()):
+        """删除名称以prefix开头的缓存项（keep中的除外）"""
+        keep_files = {f"{name}.npy" for name in keep}
+        for filename in os.listdir(self.cache_dir):
+            if filename.startswith(prefix) and filename.endswith('.npy') and filename not in keep_files:
+                try:
+                    os.remove(os.path.join(self.cache_dir, filename))
+                except OSError:
+                    pass
+
+    def lock_path(self, name):
+        """构建锁文件路径（与缓存项同目录，同一台机器上的worker进程共用）"""
+        return os.path.join(self.cache_dir, f"{name}.lock")
+
+    def _tmp_path(self, name):
+        # 带进程号，避免多个worker同时写同一个临时文件
+        return os.path.join(self.cache_dir, f"{name}.npy.{os.getpid()}.tmp")
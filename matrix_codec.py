@@ -0,0 +1,124 @@
+"""
+相似度矩阵二进制序列化模块
+缓存格式: 固定头部(魔数、版本、压缩编码、dtype、形状) + 原始数组缓冲区
+读取时通过 np.frombuffer 直接映射缓冲区，无需逐元素解析
+"""
+
+import json
+import struct
+import zlib
+
+import numpy as np
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # 可选依赖
+    lz4_frame = None
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖
+    zstandard = None
+
+MAGIC = b'UCFM'
+FORMAT_VERSION = 1
+
+# 头部: 魔数(4s) 版本(B) 编码(B) 维数(B) dtype(8s)，随后为每一维的长度(Q)
+_HEADER = struct.Struct('<4sBBB8s')
+_DIM = struct.Struct('<Q')
+
+_CODEC_IDS = {'none': 0, 'zlib': 1, 'lz4': 2, 'zstd': 3}
+_CODEC_NAMES = {v: k for k, v in _CODEC_IDS.items()}
+
+
+def available_codecs():
+    """返回当前环境可用的压缩编码"""
+    codecs = ['none', 'zlib']
+    if lz4_frame is not None:
+        codecs.append('lz4')
+    if zstandard is not None:
+        codecs.append('zstd')
+    return codecs
+
+
+def default_codec():
+    """默认编码：优先使用速度更快的zstd/lz4，否则退回zlib"""
+    for codec in ('zstd', 'lz4'):
+        if codec in available_codecs():
+            return codec
+    return 'zlib'
+
+
+def _compress(payload, codec):
+    if codec == 'none':
+        return payload
+    if codec == 'zlib':
+        return zlib.compress(payload, 1)
+    if codec == 'lz4':
+        return lz4_frame.compress(payload)
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(payload)
+    raise ValueError(f"不支持的压缩编码: {codec}")
+
+
+def _decompress(payload, codec):
+    if codec == 'none':
+        return payload
+    if codec == 'zlib':
+        return zlib.decompress(payload)
+    if codec == 'lz4':
+        return lz4_frame.decompress(payload)
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(payload)
+    raise ValueError(f"不支持的压缩编码: {codec}")
+
+
+def encode_array(array, codec=None):
+    """
+    将NumPy数组编码为二进制缓存格式
+
+    参数:
+        array (ndarray): 待编码的数组
+        codec (str): 压缩编码（none/zlib/lz4/zstd，None表示默认编码）
+
+    返回:
+        bytes: 头部 + （压缩后的）原始缓冲区
+    """
+    codec = codec or default_codec()
+    if codec not in available_codecs():
+        raise ValueError(f"压缩编码不可用: {codec}")
+
+    array = np.ascontiguousarray(array)
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, _CODEC_IDS[codec], array.ndim,
+                          array.dtype.str.encode('ascii'))
+    dims = b''.join(_DIM.pack(dim) for dim in array.shape)
+    # 按字节视图传给压缩器（不复制；空数组无法用memoryview.cast转换）
+    return header + dims + _compress(memoryview(array.reshape(-1).view(np.uint8)), codec)
+
+
+def decode_array(data):
+    """
+    解码二进制缓存格式为NumPy数组
+
+    未压缩时返回的数组直接引用data的缓冲区（只读）；
+    兼容旧版的 zlib + JSON 格式。
+    """
+    if not data.startswith(MAGIC):
+        return _decode_legacy(data)
+
+    magic, version, codec_id, ndim, dtype = _HEADER.unpack_from(data, 0)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"不支持的缓存格式版本: {version}")
+
+    offset = _HEADER.size
+    shape = tuple(_DIM.unpack_from(data, offset + i * _DIM.size)[0] for i in range(ndim))
+    offset += ndim * _DIM.size
+
+    payload = _decompress(memoryview(data)[offset:], _CODEC_NAMES[codec_id])
+    dtype = np.dtype(dtype.rstrip(b'\0').decode('ascii'))
+    return np.frombuffer(payload, dtype=dtype).reshape(shape)
+
+
+def _decode_legacy(data):
+    """解码旧版缓存（zlib压缩的JSON列表）"""
+    return np.array(json.loads(zlib.decompress(data).decode('utf-8')))
@@ -5,111 +5,382 @@
 
 import numpy as np
 import pandas as pd
-import redis
+import scipy.sparse as sp
+import hashlib
 import json
 import zlib
-from sklearn.metrics.pairwise import cosine_similarity
-from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from collections import OrderedDict
 import os
+import threading
 
+from ann_index import build_approximate_neighbor_index
+from data_loader import RatingMatrix, splice_csr_row
+from local_cache import LocalArrayCache
+from matrix_codec import encode_array, decode_array
+from redis_pool import get_redis_client, redis_available
+from build_lock import RedisLease, FileLock, single_flight
+from serving import ServingMixin
+from similarity import center_ratings, build_neighbor_index, iter_similarity_blocks, block_rows_for_budget, \
+    top_k_from_block, quantize_similarity, quantize_block, dequantize_similarity, resolve_n_jobs, \
+    SIMILARITY_DTYPES, INT8_SCALE
 
-class UserCFRecommender:
-    def __init__(self, user_movie_ratings, movie_info, redis_host='localhost', redis_port=6379, redis_db=0):
+
+DEFAULT_CACHE_DIR = 'data/cache'
+
+
+def _setting(value, env_name, default):
+    """构造参数（非None时）优先，其次为环境变量，最后为默认值"""
+    if value is not None:
+        return value
+    return os.getenv(env_name, default)
+
+
+def _require_parquet_engine():
+    """检查pandas写Parquet所需的引擎（pyarrow 或 fastparquet，均为可选依赖）"""
+    for module in ('pyarrow', 'fastparquet'):
+        try:
+            __import__(module)
+            return
+        except ImportError:
+            continue
+    raise ImportError("导出 .parquet 需要安装 pyarrow 或 fastparquet（pip install pyarrow），或改用 .csv 文件")
+
+
+class UserCFRecommender(ServingMixin):
+    def __init__(self, user_movie_ratings, movie_info, redis_host='localhost', redis_port=6379, redis_db=0,
+                 neighbor_k=None, max_memory_mb=None, block_size=None, similarity_path=None,
+                 cache_codec=None, cache_dir=DEFAULT_CACHE_DIR, neighbor_source=None, ann_nprobe=None,
+                 similarity_precision=None, similarity_mode=None, row_cache_mb=None,
+                 background_build=None, n_jobs=None):
         """
         初始化推荐系统（带Redis缓存支持）
 
+        显式传入的参数优先；为None的参数读取对应的环境变量（括号中），未设置时使用默认值
+
         参数:
-            user_movie_ratings (DataFrame): 用户-电影评分矩阵（行:用户, 列:电影）
+            user_movie_ratings (DataFrame | RatingMatrix): 用户-电影评分矩阵（行:用户, 列:电影）
             movie_info (DataFrame): 电影元数据信息
             redis_host (str): Redis服务器地址
             redis_port (int): Redis端口
             redis_db (int): Redis数据库编号
+            neighbor_k (int): 仅保留每个用户的TopK邻居（None表示保留完整相似度矩阵）
+            max_memory_mb (float): 分块计算相似度时的工作内存预算（MB，不含结果本身；
+                SIMILARITY_MAX_MEMORY_MB，默认256）
+            block_size (int): 每块的用户行数（None表示按内存预算自动确定）
+            similarity_path (str): 完整相似度矩阵的内存映射文件路径（None表示保存在内存中）
+            cache_codec (str): 缓存压缩编码 none/zlib/lz4/zstd（SIMILARITY_CACHE_CODEC，未设置时自动选择）
+            cache_dir (str): 本地内存映射缓存目录（None表示不使用本地缓存；
+                使用默认目录时可由 SIMILARITY_CACHE_DIR 替换）
+            neighbor_source (str): TopK邻居表的构建方式 exact（精确，默认）/ ivf（近似最近邻索引）
+                （SIMILARITY_NEIGHBOR_SOURCE）
+            ann_nprobe (int): ivf模式下每个用户搜索的簇数（越大召回率越高、越慢；SIMILARITY_ANN_NPROBE，默认16）
+            similarity_precision (str): 完整相似度矩阵及其缓存的存储精度
+                float64（默认）/ float32 / float16 / int8（固定比例量化）（SIMILARITY_PRECISION）
+            similarity_mode (str): eager（默认，首次推荐时构建全部用户的相似度）/
+                lazy（只按需计算请求用户的一行相似度，不阻塞在全量构建上）（SIMILARITY_MODE）
+            row_cache_mb (float): lazy模式下相似度行LRU缓存的内存上限（MB；SIMILARITY_ROW_CACHE_MB，默认64）
+            background_build (bool): lazy模式下是否在后台线程构建完整相似度（完成后改用完整结构）
+                （SIMILARITY_BACKGROUND_BUILD，默认否）
+            n_jobs (int): 全量构建的并行进程数（1为单进程，0或负数表示全部CPU核心；SIMILARITY_N_JOBS，默认1）
 
         属性:
-            user_movie_ratings: 处理后的评分矩阵（未评分项设为NaN）
+            user_movie_ratings: CSR稀疏评分矩阵（RatingMatrix，只存储已评分项）
             movie_info: 电影信息数据集
-            user_similarity: 用户相似度矩阵
-            redis_client: Redis连接客户端
-            cache_key: 相似度矩阵缓存键名
+            user_similarity: 用户相似度矩阵（TopK邻居模式下为None）
+            neighbor_ids: 每个用户的TopK邻居位置（int32, N×K，按相似度降序）
+            neighbor_sims: 对应的邻居相似度（float32, N×K）
+            redis_client: Redis客户端（进程内共享连接池，带熔断器）
+            local_cache: 本地 .npy 文件缓存（按评分数据指纹区分，优先于Redis使用）
+            cache_key: 相似度矩阵缓存键前缀（按评分数据指纹和参数分代）
             chunk_size: 分块存储时的块大小
         """
-        # 数据初始化
-        self.user_movie_ratings = user_movie_ratings.replace(0, np.nan)
+        # 数据初始化（统一转换为CSR稀疏评分矩阵，未评分项不占存储）
+        if not isinstance(user_movie_ratings, RatingMatrix):
+            user_movie_ratings = RatingMatrix.from_dataframe(user_movie_ratings)
+        self.user_movie_ratings = user_movie_ratings
         self.movie_info = movie_info
         self.user_similarity = None
 
-        # Redis配置
-        self.redis_client = redis.Redis(
-            host=os.getenv('REDIS_HOST', redis_host),
-            port=int(os.getenv('REDIS_PORT', redis_port)),
-            password=os.getenv('REDIS_PASSWORD', None),
-            db=redis_db,
-            decode_responses=False,  # 原始字节模式，便于压缩
-            socket_timeout=10,
-            retry_on_timeout=True
-        )
-        self.cache_key = "user_sim_matrix"
-        self.chunk_size = 1000  # 分块大小（用户数超过此值时自动分块存储）
+        # TopK邻居模式：内存占用 O(N·K)，替代 O(N²) 的完整矩阵
+        self.neighbor_k = neighbor_k
 
-        # 连接测试
-        try:
-            self.redis_client.ping()
-        except redis.ConnectionError:
-            print("警告: 无法连接Redis服务器，将禁用缓存功能")
-            self.redis_client = None
+        # 分块计算配置：按行分块，工作内存受max_memory_mb约束
+        self.max_memory_mb = float(_setting(max_memory_mb, 'SIMILARITY_MAX_MEMORY_MB', 256))
+        self.block_size = block_size
+        self.n_jobs = resolve_n_jobs(_setting(n_jobs, 'SIMILARITY_N_JOBS', 1))
+        self.similarity_path = similarity_path
+        self.similarity_precision = _setting(similarity_precision, 'SIMILARITY_PRECISION', 'float64').lower()
+        if self.similarity_precision not in SIMILARITY_DTYPES:
+            raise ValueError(f"不支持的相似度存储精度: {self.similarity_precision}")
+        self.neighbor_ids = None
+        self.neighbor_sims = None
+
+        # 近似邻居（opt-in）：用户数很大时以IVF索引代替精确的全量两两计算
+        self.neighbor_source = _setting(neighbor_source, 'SIMILARITY_NEIGHBOR_SOURCE', 'exact').lower()
+        self.ann_nprobe = int(_setting(ann_nprobe, 'SIMILARITY_ANN_NPROBE', 16))
+
+        # 增量更新状态：中心化评分矩阵及每个用户的范数（首次需要时计算）
+        self._centered = None
+        self._norms = None
+
+        # 按需模式：预先计算中心化评分和范数，推荐时只计算目标用户的一行相似度（O(评分总数)）
+        self.similarity_mode = _setting(similarity_mode, 'SIMILARITY_MODE', 'eager').lower()
+        if self.similarity_mode not in ('eager', 'lazy'):
+            raise ValueError(f"不支持的相似度计算模式: {self.similarity_mode}")
+        self.row_cache_mb = float(_setting(row_cache_mb, 'SIMILARITY_ROW_CACHE_MB', 64))
+        self._row_cache = OrderedDict()  # 用户位置 -> 相似度行（存储精度同完整矩阵）
+        self._lazy_lock = threading.RLock()
+        self._unbuilt_changes = 0  # 完整结构不存在时发生的评分变更次数（后台构建据此判断结果是否过期）
+        self._similarity_ready = False
+        self._build_thread = None
+        if self.similarity_mode == 'lazy':
+            self._centered, self._norms = center_ratings(self.user_movie_ratings.matrix)
+
+        # Redis配置（进程内共享连接池，毫秒级超时，不可用时熔断跳过）
+        self.redis_client = get_redis_client(redis_host, redis_port, redis_db)
+        self.cache_key = "user_sim_matrix"  # 键前缀: {cache_key}:{结构}:{代号}:*，代指针为 {cache_key}:{结构}:current
+        self.cache_ttl = 86400  # 24小时TTL
+        # 构建锁：租约时长（持有期间自动续约）及其他进程等待构建结果的最长时间（秒）
+        self.build_lease = float(os.getenv('SIMILARITY_BUILD_LEASE', 60))
+        self.build_wait_timeout = float(os.getenv('SIMILARITY_BUILD_WAIT', 600))
+        self.chunk_size = 1000  # Redis中每个分块的最大行数
+        self.cache_codec = _setting(cache_codec, 'SIMILARITY_CACHE_CODEC', None)
+        self.fetch_batch = 4  # 每次MGET取回的分块数
+        self.load_workers = min(8, os.cpu_count() or 1)  # 并行解码分块的线程数
+
+        # 本地文件缓存（Redis不可用时避免每次重新计算）
+        self.local_cache = None
+        self._fingerprint = None
+        if cache_dir == DEFAULT_CACHE_DIR:
+            cache_dir = os.getenv('SIMILARITY_CACHE_DIR', cache_dir)
+        if cache_dir:
+            try:
+                self.local_cache = LocalArrayCache(cache_dir)
+            except OSError as e:
+                print(f"警告: 无法创建本地缓存目录 {cache_dir}: {e}")
+
+        background_build = str(_setting(background_build, 'SIMILARITY_BACKGROUND_BUILD', False)).lower()
+        if self.similarity_mode == 'lazy' and background_build in ('1', 'true', 'yes'):
+            self.start_background_build()
 
     def _serialize_matrix(self, matrix):
-        """序列化相似度矩阵（使用压缩优化）"""
-        return zlib.compress(json.dumps(matrix.tolist()).encode('utf-8'))
+        """序列化相似度矩阵（二进制头部 + 原始缓冲区，可选压缩）"""
+        return encode_array(matrix, self.cache_codec)
 
     def _deserialize_matrix(self, data):
-        """反序列化相似度矩阵"""
-        return np.array(json.loads(zlib.decompress(data).decode('utf-8')))
-
-    def _store_matrix_chunks(self, matrix):
-        """
-        分块存储大型相似度矩阵
-        适用于用户量>1万的场景
-        """
-        n_users = len(matrix)
-        for i in range(0, n_users, self.chunk_size):
-            chunk = matrix[i:i + self.chunk_size, :]
-            chunk_key = f"{self.cache_key}:chunk_{i // self.chunk_size}"
-            self.redis_client.setex(
-                chunk_key,
-                86400,  # 24小时TTL
-                self._serialize_matrix(chunk)
-            )
-        # 存储元数据
+        """反序列化相似度矩阵（np.frombuffer直接读取缓冲区）"""
+        return decode_array(data)
+
+    def _store_matrix_chunk(self, index, chunk, fingerprint=None):
+        """
+        存储相似度矩阵的一个分块（行块），fingerprint为构建所用评分数据的指纹
+
+        返回:
+            int: 分块数据的CRC32校验和（写入元数据，加载时校验）
+        """
+        data = self._serialize_matrix(chunk)
+        self.redis_client.setex(f"{self._redis_namespace(fingerprint)}:chunk_{index}", self.cache_ttl, data)
+        return zlib.crc32(data)
+
+    def _store_matrix_meta(self, shape, chunk_size, checksums, dtype, fingerprint=None):
+        """
+        存储分块元数据并发布当前代
+        元数据在所有分块写完后才写入，随后切换代指针，其他进程只会看到完整的一代
+        """
         meta = {
-            'n_chunks': (n_users // self.chunk_size) + 1,
-            'shape': matrix.shape,
-            'chunk_size': self.chunk_size
+            'n_chunks': len(checksums),
+            'shape': list(shape),
+            'chunk_size': chunk_size,
+            'dtype': np.dtype(dtype).str,
+            # 存储精度及量化比例（int8时 相似度 = 存储值 / scale）
+            'precision': np.dtype(dtype).name,
+            'scale': INT8_SCALE if np.dtype(dtype) == np.int8 else 1.0,
+            'checksums': checksums
         }
-        self.redis_client.setex(
-            f"{self.cache_key}:meta",
-            86400,
-            json.dumps(meta)
-        )
+        self.redis_client.setex(f"{self._redis_namespace(fingerprint)}:meta", self.cache_ttl, json.dumps(meta))
+        self._publish_generation(fingerprint)
+
+    def _load_matrix_chunks(self, fingerprint=None):
+        """
+        加载分块存储的相似度矩阵
+
+        分块按批次通过MGET取回（每批一次往返），解压与解码在线程池中并行完成，
+        结果直接写入预分配的目标数组。分块缺失、校验失败或形状不符时抛出ValueError，
+        由调用方回退到重新计算，不会留下未填充的零值。
+        """
+        namespace = self._redis_namespace(fingerprint)
+        meta = self.redis_client.get(f"{namespace}:meta")
+        if meta is None:
+            raise ValueError("分块元数据缺失")
+        meta = json.loads(meta)
+        if 'checksums' not in meta:
+            raise ValueError("分块元数据缺少校验信息（旧版缓存）")
+
+        shape = tuple(meta['shape'])
+        chunk_size = meta['chunk_size']
+        n_chunks = meta['n_chunks']
+        if n_chunks != -(-shape[0] // chunk_size) or len(meta['checksums']) != n_chunks:
+            raise ValueError("分块元数据不一致")
 
-    def _load_matrix_chunks(self):
-        """加载分块存储的相似度矩阵"""
-        meta = json.loads(self.redis_client.get(f"{self.cache_key}:meta"))
-        matrix = np.zeros(meta['shape'])
+        matrix = np.empty(shape, dtype=np.dtype(meta.get('dtype', '<f8')))
 
-        for i in range(meta['n_chunks']):
-            chunk_key = f"{self.cache_key}:chunk_{i}"
-            chunk_data = self.redis_client.get(chunk_key)
-            if chunk_data:
-                start = i * meta['chunk_size']
-                end = min((i + 1) * meta['chunk_size'], meta['shape'][0])
-                matrix[start:end, :] = self._deserialize_matrix(chunk_data)
+        def decode_chunk(index, data):
+            if data is None:
+                raise ValueError(f"分块{index}缺失")
+            if zlib.crc32(data) != meta['checksums'][index]:
+                raise ValueError(f"分块{index}校验失败")
+            start = index * chunk_size
+            end = min(start + chunk_size, shape[0])
+            chunk = self._deserialize_matrix(data)
+            if chunk.shape != (end - start,) + shape[1:]:
+                raise ValueError(f"分块{index}形状不符: {chunk.shape}")
+            matrix[start:end] = chunk
+
+        keys = [f"{namespace}:chunk_{i}" for i in range(n_chunks)]
+        with ThreadPoolExecutor(max_workers=self.load_workers) as pool:
+            futures = []
+            for batch_start in range(0, n_chunks, self.fetch_batch):
+                batch = self.redis_client.mget(keys[batch_start:batch_start + self.fetch_batch])
+                futures.extend(pool.submit(decode_chunk, batch_start + i, data)
+                               for i, data in enumerate(batch))
+            for future in futures:
+                future.result()
 
         return matrix
 
+    def _block_rows(self):
+        """每块计算的用户行数（未显式指定时按内存预算计算，多进程时由各进程均分预算）"""
+        if self.block_size:
+            return self.block_size
+        return block_rows_for_budget(self.user_movie_ratings.shape[0], self.max_memory_mb / self.n_jobs)
+
+    def _neighbor_tag(self):
+        """TopK邻居表的标识（近似邻居表附带索引参数，与精确结果分开缓存）"""
+        if self.neighbor_source == 'ivf':
+            return f"ivf{self.ann_nprobe}_top{self.neighbor_k}"
+        return f"top{self.neighbor_k}"
+
+    def _redis_variant(self):
+        """缓存的数据结构（TopK邻居表附带其参数，完整矩阵附带存储精度）"""
+        if self.neighbor_k:
+            return self._neighbor_tag()
+        return f"full_{self.similarity_precision}"
+
+    def _redis_generation(self, fingerprint=None):
+        """
+        缓存代号：评分数据指纹与算法参数的哈希（任一变化即对应新的一代）
+
+        fingerprint为None时使用当前评分数据的指纹；构建结果须传入构建开始时的指纹，
+        构建期间评分发生变化时，结果仍发布在它实际对应的那一代
+        """
+        params = f"pearson:{self._redis_variant()}:{fingerprint or self.data_fingerprint()}"
+        return hashlib.blake2b(params.encode('utf-8'), digest_size=8).hexdigest()
+
+    def _redis_pointer_key(self):
+        """代指针的键名（值为当前已发布的代号）"""
+        return f"{self.cache_key}:{self._redis_variant()}:current"
+
+    def _redis_namespace(self, fingerprint=None):
+        """评分数据（默认为当前数据）与参数对应的一代缓存的键前缀"""
+        return f"{self.cache_key}:{self._redis_variant()}:{self._redis_generation(fingerprint)}"
+
+    def _publish_generation(self, fingerprint=None):
+        """
+        切换代指针到当前代（所有数据键写完后调用，一条SET完成发布）
+
+        旧代的键不再被引用，随TTL自然过期
+        """
+        self.redis_client.setex(self._redis_pointer_key(), self.cache_ttl, self._redis_generation(fingerprint))
+
+    def _published_generation(self, fingerprint=None):
+        """Redis中已发布的代是否就是评分数据（默认为当前数据）与参数对应的代"""
+        current = self.redis_client.get(self._redis_pointer_key())
+        return current is not None and current.decode('utf-8') == self._redis_generation(fingerprint)
+
+    def _store_neighbor_index(self, fingerprint=None):
+        """存储TopK邻居表（数据量为 N·K，无需分块）并发布其评分数据对应的一代"""
+        namespace = self._redis_namespace(fingerprint)
+        self.redis_client.setex(f"{namespace}:ids", self.cache_ttl, self._serialize_matrix(self.neighbor_ids))
+        self.redis_client.setex(f"{namespace}:sims", self.cache_ttl, self._serialize_matrix(self.neighbor_sims))
+        self._publish_generation(fingerprint)
+
+    def _load_neighbor_index(self, fingerprint=None):
+        """加载TopK邻居表，缓存不存在时返回False"""
+        namespace = self._redis_namespace(fingerprint)
+        ids_data, sims_data = self.redis_client.mget([f"{namespace}:ids", f"{namespace}:sims"])
+        if not ids_data or not sims_data:
+            return False
+        self.neighbor_ids = self._deserialize_matrix(ids_data).astype(np.int32, copy=False)
+        self.neighbor_sims = self._deserialize_matrix(sims_data).astype(np.float32, copy=False)
+        return True
+
+    def data_fingerprint(self):
+        """评分数据指纹（首次调用时计算）"""
+        if self._fingerprint is None:
+            self._fingerprint = self.user_movie_ratings.fingerprint()
+        return self._fingerprint
+
+    def _local_cache_names(self, fingerprint=None):
+        """
+        当前模式下本地缓存项的名称（fingerprint为None时按当前评分数据的指纹）
+
+        返回:
+            prefix (str): 同类缓存项的公共前缀（用于清理旧指纹的文件）
+            names (list): 缓存项名称（完整矩阵一项，TopK邻居表两项）
+        """
+        fingerprint = fingerprint or self.data_fingerprint()
+        if self.neighbor_k:
+            prefix = f"user_{self._neighbor_tag()}_"
+            return prefix, [f"{prefix}{fingerprint}_ids", f"{prefix}{fingerprint}_sims"]
+        return "user_sim_", [f"user_sim_{self.similarity_precision}_{fingerprint}"]
+
+    def _load_local_cache(self, fingerprint=None):
+        """从本地文件以只读内存映射加载相似度数据，不存在时返回False"""
+        if self.local_cache is None:
+            return False
+        _, names = self._local_cache_names(fingerprint)
+        arrays = [self.local_cache.load(name) for name in names]
+        if any(array is None for array in arrays):
+            return False
+        if self.neighbor_k:
+            self.neighbor_ids, self.neighbor_sims = arrays
+        else:
+            self.user_similarity = arrays[0]
+        return True
+
+    def _save_local_cache(self, fingerprint=None):
+        """
+        把当前相似度数据写入本地文件（按计算它所用评分数据的指纹命名，默认为当前评分数据），
+        并删除旧指纹的文件
+
+        写入后改用文件的只读内存映射（堆上的副本随之释放，同机的worker进程共享同一份页缓存）
+        """
+        if self.local_cache is None:
+            return
+        fingerprint = fingerprint or self.data_fingerprint()
+        prefix, names = self._local_cache_names(fingerprint)
+        arrays = [self.neighbor_ids, self.neighbor_sims] if self.neighbor_k else [self.user_similarity]
+        try:
+            for name, array in zip(names, arrays):
+                self.local_cache.save(name, array)
+            self.local_cache.remove(prefix, keep=names)
+        except OSError as e:
+            print(f"[本地缓存] 写入失败: {e}")
+            return
+        with self._lazy_lock:
+            # 写入期间有评分增量更新（指纹被重置）时内存中的数据已比文件新，保留内存中的数据
+            if self._fingerprint == fingerprint:
+                self._load_local_cache(fingerprint)
+
     def calculate_similarity(self, force_recompute=False):
         """
-        计算用户相似度矩阵（带Redis缓存支持）
+        计算用户相似度矩阵（带本地文件和Redis两级缓存）
+        设置了neighbor_k时只分块构建TopK邻居表，不生成完整矩阵
+
+        加载顺序: 本地内存映射文件 -> Redis -> 重新计算；
+        需要重新计算时多个worker进程只由获得构建锁的一个进程计算并发布，其他进程等待后加载
 
         参数:
             force_recompute (bool): 是否强制重新计算（忽略缓存）
@@ -117,76 +388,425 @@ class UserCFRecommender:
         # 如果强制重新计算，先清除缓存
         if force_recompute:
             self.clear_cache()
+            self._build_similarity()
+            return
 
-        # 尝试从Redis加载缓存
-        if self.redis_client and not force_recompute:
+        if self._load_cached_similarity():
+            return
+        single_flight(self._build_lock(), self._load_cached_similarity, self._build_similarity,
+                      self.build_wait_timeout)
+
+    def _load_cached_similarity(self):
+        """依次尝试本地文件和Redis中已发布的缓存，加载成功时返回True"""
+        fingerprint = self.data_fingerprint()
+        # 优先从本地文件加载（只读映射，多个worker共享页缓存）
+        if self._load_local_cache(fingerprint):
+            print("[本地缓存] 从内存映射文件加载相似度数据")
+            return True
+
+        # 尝试从Redis加载缓存（只加载与当前评分数据和参数对应、且已发布的一代）
+        if redis_available(self.redis_client):
             try:
-                # 检查分块存储模式
-                if self.redis_client.exists(f"{self.cache_key}:meta"):
+                published = self._published_generation(fingerprint)
+                # TopK邻居模式
+                if published and self.neighbor_k:
+                    if self._load_neighbor_index(fingerprint):
+                        print("[Redis] 从缓存加载TopK邻居表")
+                        self._save_local_cache(fingerprint)
+                        return True
+                # 完整矩阵（分块存储）
+                elif published:
                     print("[Redis] 从分块缓存加载相似度矩阵...")
-                    self.user_similarity = self._load_matrix_chunks()
-                    return
-
-                # 检查整体存储模式
-                cached_data = self.redis_client.get(self.cache_key)
-                if cached_data:
-                    print("[Redis] 从缓存加载相似度矩阵")
-                    self.user_similarity = self._deserialize_matrix(cached_data)
-                    return
+                    self.user_similarity = self._with_precision(self._load_matrix_chunks(fingerprint))
+                    self._save_local_cache(fingerprint)
+                    return True
             except Exception as e:
                 print(f"[Redis] 缓存加载失败: {e}, 将重新计算")
+        return False
 
-        # 无缓存或加载失败时重新计算
-        print("计算用户相似度矩阵...")
-        norm_ratings = self.user_movie_ratings.sub(self.user_movie_ratings.mean(axis=1), axis=0)
-        filled = norm_ratings.fillna(0)
+    def _build_lock(self):
+        """
+        相似度构建锁: Redis可用时为带租约的Redis锁（所有机器的worker互斥），
+        否则为本地缓存目录中的文件锁（同一台机器的worker互斥），都不可用时为None
+        """
+        if redis_available(self.redis_client):
+            return RedisLease(self.redis_client, f"{self._redis_namespace()}:lock", self.build_lease)
+        if self.local_cache is not None:
+            return FileLock(self.local_cache.lock_path(f"user_{self._redis_variant()}"))
+        return None
 
-        # 计算皮尔逊相关系数
-        numerator = filled @ filled.T
-        denominator = np.sqrt((filled ** 2).sum(axis=1).values[:, None] @
-                              (filled ** 2).sum(axis=1).values[None, :])
+    def _build_similarity(self):
+        """
+        重新计算相似度（或TopK邻居表），写入本地文件缓存并发布到Redis
 
-        denominator[denominator == 0] = np.inf
-        self.user_similarity = numerator / denominator
+        评分矩阵与其指纹在同一把锁下取出：构建期间发生的评分变更不会让结果被保存到新数据的指纹下
+        """
+        with self._lazy_lock:
+            matrix = self.user_movie_ratings.matrix
+            fingerprint = self.data_fingerprint()
+        centered, norms = center_ratings(matrix)
+        if self.similarity_mode == 'eager':
+            # lazy模式下中心化数据由增量更新维护，不能被构建开始时的快照覆盖
+            self._centered, self._norms = centered, norms
 
-        # 确保是NumPy数组（修复关键错误）
-        if isinstance(self.user_similarity, pd.DataFrame):
-            self.user_similarity = self.user_similarity.values
+        if self.neighbor_k:
+            if self.neighbor_source == 'ivf':
+                print(f"用IVF索引近似构建用户TopK邻居表 (K={self.neighbor_k}, nprobe={self.ann_nprobe})...")
+                self.neighbor_ids, self.neighbor_sims = build_approximate_neighbor_index(
+                    centered, norms, self.neighbor_k, nprobe=self.ann_nprobe)
+            else:
+                print(f"分块构建用户TopK邻居表 (K={self.neighbor_k})...")
+                self.neighbor_ids, self.neighbor_sims = build_neighbor_index(
+                    centered, norms, self.neighbor_k, self._block_rows(), self.n_jobs)
+            # 先写本地文件再发布到Redis：同机等待的进程一旦看到Redis中的发布即可直接映射本地文件
+            self._save_local_cache(fingerprint)
+            if redis_available(self.redis_client):
+                try:
+                    print("[Redis] 存储TopK邻居表到缓存...")
+                    self._store_neighbor_index(fingerprint)
+                except Exception as e:
+                    print(f"[Redis] 缓存存储失败: {e}")
+            return
 
-        # 将对角线设为零（排除自相似度）
-        np.fill_diagonal(self.user_similarity, 0)
+        # 完整矩阵在计算过程中分块写入Redis
+        self.user_similarity = self._compute_full_similarity(centered, norms, fingerprint)
 
-        # 存储到Redis
-        if self.redis_client:
-            try:
-                n_users = len(self.user_similarity)
+    def _with_precision(self, similarity):
+        """缓存中的矩阵与配置的存储精度不同时（例如修改了配置），转换为配置的精度"""
+        if similarity.dtype == SIMILARITY_DTYPES[self.similarity_precision]:
+            return similarity
+        return quantize_similarity(dequantize_similarity(similarity), self.similarity_precision)
 
-                # 大型矩阵使用分块存储
-                if n_users > self.chunk_size:
-                    print(f"[Redis] 分块存储相似度矩阵 ({n_users}用户)...")
-                    self._store_matrix_chunks(self.user_similarity)
-                else:
-                    # 小型矩阵整体存储
-                    print("[Redis] 存储相似度矩阵到缓存...")
-                    self.redis_client.setex(
-                        self.cache_key,
-                        86400,  # 24小时TTL
-                        self._serialize_matrix(self.user_similarity)
-                    )
+    def _compute_full_similarity(self, centered, norms, fingerprint):
+        """
+        按行块计算完整的皮尔逊相似度矩阵
+
+        每个行块算完后立即写入目标位置（内存数组、指定的内存映射文件或本地缓存文件），
+        Redis可用时每个行块同时作为一个分块写入Redis（全部写完后发布这一代），
+        因此计算过程中只存在一个行块大小的临时数据。
+        """
+        n_users = centered.shape[0]
+        block_rows = self._block_rows()
+        dtype = SIMILARITY_DTYPES[self.similarity_precision]
+        stream_to_redis = redis_available(self.redis_client)
+        if stream_to_redis:
+            # Redis分块与计算行块一一对应，单个分块不超过chunk_size行
+            block_rows = min(block_rows, self.chunk_size)
+
+        local_name = None
+        if self.similarity_path:
+            similarity = np.lib.format.open_memmap(
+                self.similarity_path, mode='w+', dtype=dtype, shape=(n_users, n_users))
+        elif self.local_cache is not None:
+            # 直接写入本地缓存的临时文件，算完后原子发布
+            prefix, (local_name,) = self._local_cache_names(fingerprint)
+            similarity = self.local_cache.create(local_name, (n_users, n_users), dtype)
+        else:
+            similarity = np.empty((n_users, n_users), dtype=dtype)
+
+        print(f"分块计算用户相似度矩阵 (每块{block_rows}行, {self.n_jobs}个进程)...")
+        if stream_to_redis:
+            print(f"[Redis] 分块存储相似度矩阵 ({n_users}用户)...")
+        checksums = []
+        blocks = iter_similarity_blocks(centered, norms, block_rows, self.n_jobs,
+                                        partial(quantize_block, precision=self.similarity_precision))
+        for start, end, block in blocks:
+            similarity[start:end] = block
+            if stream_to_redis:
+                try:
+                    checksums.append(self._store_matrix_chunk(len(checksums), block, fingerprint))
+                except Exception as e:
+                    print(f"[Redis] 缓存存储失败: {e}")
+                    stream_to_redis = False
+
+        if local_name is not None:
+            similarity = self.local_cache.commit(local_name, similarity)
+            self.local_cache.remove(prefix, keep=[local_name])
+        elif isinstance(similarity, np.memmap):
+            similarity.flush()
+
+        # 本地文件发布后再发布Redis中的这一代（同机等待的进程优先映射本地文件）
+        if stream_to_redis:
+            try:
+                self._store_matrix_meta((n_users, n_users), block_rows, checksums, similarity.dtype, fingerprint)
             except Exception as e:
                 print(f"[Redis] 缓存存储失败: {e}")
+        return similarity
+
+    def _select_neighbors(self, user_idx, k, min_similarity):
+        """
+        选取目标用户的TopK相似用户
+
+        返回:
+            n_valid (int): 相似度不低于阈值的用户数
+            neighbors (ndarray): 选中的相似用户位置（最多k个）
+            weights (ndarray): 对应相似度
+        """
+        if not self._similarity_built():
+            # 按需模式且完整结构尚未就绪：只计算（或从行缓存取出）该用户的一行相似度
+            sim_scores = dequantize_similarity(self._lazy_similarity_row(user_idx))
+        elif self.neighbor_ids is not None:
+            # 邻居表已按相似度降序排列，直接截取满足阈值的前缀
+            sims = self.neighbor_sims[user_idx].astype(np.float64)
+            n_valid = int(np.count_nonzero(sims >= min_similarity))
+            top = min(k, n_valid)
+            return n_valid, self.neighbor_ids[user_idx, :top], sims[:top]
+        else:
+            sim_scores = dequantize_similarity(self.user_similarity[user_idx])
+        valid_users = np.where(
+            (sim_scores >= min_similarity) &
+            (np.arange(len(sim_scores)) != user_idx)
+        )[0]
+        top_k_users = valid_users[np.argsort(sim_scores[valid_users])[-k:]]
+        return len(valid_users), top_k_users, sim_scores[top_k_users]
+
+    def _similarity_built(self):
+        """完整相似度矩阵或TopK邻居表是否可用（lazy模式下需等后台构建确认未过期）"""
+        if self.user_similarity is None and self.neighbor_ids is None:
+            return False
+        return self.similarity_mode == 'eager' or self._similarity_ready
+
+    def _lazy_similarity_row(self, user_idx):
+        """
+        按需计算某用户的一行相似度，结果放入LRU行缓存
+
+        缓存行数由row_cache_mb和用户数决定；行的精度与完整结构一致（完整矩阵按存储精度，邻居表为float32）
+        """
+        with self._lazy_lock:
+            row = self._row_cache.get(user_idx)
+            if row is not None:
+                self._row_cache.move_to_end(user_idx)
+                return row
+            row = quantize_similarity(self._similarity_row(user_idx), self._row_precision())
+            self._row_cache[user_idx] = row
+            max_rows = max(1, int(self.row_cache_mb * 1024 * 1024 // max(row.nbytes, 1)))
+            while len(self._row_cache) > max_rows:
+                self._row_cache.popitem(last=False)
+            return row
+
+    def _row_precision(self):
+        return 'float32' if self.neighbor_k else self.similarity_precision
+
+    def _update_row_cache(self, user_idx, sim_row, new_user):
+        """某用户评分变化后修正行缓存：替换该用户自己的行，并更新其他缓存行中该用户对应的列"""
+        sim_row = quantize_similarity(sim_row, self._row_precision())
+        for row_idx, row in self._row_cache.items():
+            if new_user:
+                row = np.append(row, sim_row[row_idx])
+                self._row_cache[row_idx] = row
+            else:
+                row[user_idx] = sim_row[row_idx]
+        self._row_cache[user_idx] = sim_row
+
+    def warm_up(self):
+        """
+        预热推荐所需的结构（应用启动后在后台线程调用）
+
+        eager模式下构建（或从缓存加载）完整相似度；lazy模式下按需计算即可服务，
+        完整结构是否后台构建由background_build决定
+        """
+        if self.similarity_mode == 'eager':
+            self._build_until_current()
+        super().warm_up()
+
+    def start_background_build(self):
+        """在后台线程构建完整相似度（或TopK邻居表），期间推荐请求继续使用按需计算的行"""
+        if self._build_thread is not None and self._build_thread.is_alive():
+            return
+        self._build_thread = threading.Thread(target=self._background_build, name='similarity-build', daemon=True)
+        self._build_thread.start()
+
+    def _background_build(self):
+        try:
+            self._build_until_current()
+            print("后台相似度构建完成")
+        except Exception as e:
+            print(f"后台构建相似度失败: {e}，继续使用按需计算")
+
+    def _build_until_current(self):
+        """
+        构建完整相似度，可与评分增量更新并发执行
+
+        构建期间若有评分变更未应用到新结构上（变更发生时结构尚不存在），丢弃结果重新构建
+        """
+        while True:
+            with self._lazy_lock:
+                version = self._unbuilt_changes
+            try:
+                self.calculate_similarity()
+            except Exception:
+                with self._lazy_lock:
+                    self.user_similarity = self.neighbor_ids = self.neighbor_sims = None
+                raise
+            with self._lazy_lock:
+                if version == self._unbuilt_changes:
+                    self._similarity_ready = True
+                    return
+                self.user_similarity = self.neighbor_ids = self.neighbor_sims = None
+            print("构建期间评分发生变化，重新构建相似度")
+
+    def apply_rating(self, user_id, movie_id, rating):
+        """
+        增量写入（新增或修改）一条评分
+
+        只重新计算该用户与所有用户的相似度（一行一列或相关邻居表），
+        代价为 O(评分总数)，无需重建整个相似度矩阵
+        """
+        with self._lazy_lock:
+            user_idx, new_user = self.user_movie_ratings.set_rating(user_id, movie_id, rating)
+            self._apply_user_delta_locked(user_idx, new_user)
+
+    def remove_rating(self, user_id, movie_id):
+        """增量删除一条评分（评分不存在时忽略）"""
+        with self._lazy_lock:
+            user_idx = self.user_movie_ratings.remove_rating(user_id, movie_id)
+            if user_idx is not None:
+                self._apply_user_delta_locked(user_idx, False)
+
+    def dependent_users(self, user_id):
+        """
+        推荐结果可能受该用户评分变化影响的用户ID
+
+        TopK邻居模式下为邻居表中包含该用户的用户，完整矩阵模式下为与其正相关的用户
+        （推荐只使用正相似度的邻居），以及该用户自己；需在评分变化前后各调用一次取并集
+        """
+        ratings = self.user_movie_ratings
+        if user_id not in ratings.user_index:
+            return [user_id]
+        user_idx = ratings.user_loc(user_id)
+        if not self._similarity_built():
+            if self._centered is None:
+                return [user_id]
+            # lazy模式：按该用户的相似度行判断（TopK邻居模式下为保守的超集）
+            rows = np.flatnonzero(self._similarity_row(user_idx) > 0)
+        elif self.neighbor_ids is not None:
+            rows = np.flatnonzero((self.neighbor_ids == user_idx).any(axis=1))
+        else:
+            rows = np.flatnonzero(np.asarray(self.user_similarity[user_idx]) > 0)
+        return [user_id] + ratings.user_ids[rows].tolist()
+
+    def _apply_user_delta_locked(self, user_idx, new_user):
+        """
+        某用户的评分行变化后，更新中心化数据、范数以及相似度
+
+        调用方持有_lazy_lock，且评分写入与本方法在同一次加锁内完成（构建据此取得一致的评分快照和指纹）
+        """
+        # 评分数据已变化，旧指纹对应的缓存不再适用
+        self._fingerprint = None
+        ratings = self.user_movie_ratings
+
+        if self.user_similarity is None and self.neighbor_ids is None and self.similarity_mode == 'eager':
+            # 相似度尚未构建，下次计算时会基于最新评分完成（正在进行的构建结果已过期）
+            self._centered = self._norms = None
+            self._unbuilt_changes += 1
+            return
+
+        if self._centered is None:
+            self._centered, self._norms = center_ratings(ratings.matrix)
+        else:
+            # 该用户的均值变化，只需重新中心化这一行
+            cols, values = ratings.user_row(user_idx)
+            centered_values = values - values.mean() if len(values) else values
+            self._centered = splice_csr_row(self._centered, user_idx, cols, centered_values,
+                                            ratings.shape[1])
+            if new_user:
+                self._norms = np.append(self._norms, 0.0)
+            self._norms[user_idx] = np.sqrt(np.dot(centered_values, centered_values))
+
+        sim_row = self._similarity_row(user_idx)
+        if self.neighbor_ids is not None:
+            self._update_neighbor_lists(user_idx, sim_row, new_user)
+        elif self.user_similarity is not None:
+            self._update_similarity_matrix(user_idx, sim_row, new_user)
+        else:
+            # 只更新了按需状态，正在进行的后台构建结果已过期
+            self._unbuilt_changes += 1
+        if self.similarity_mode == 'lazy':
+            self._update_row_cache(user_idx, sim_row, new_user)
+
+    def _similarity_row(self, user_idx):
+        """计算某用户与所有用户的皮尔逊相似度（一次稀疏矩阵-向量乘法）"""
+        centered_user = np.zeros(self._centered.shape[1])
+        start, end = self._centered.indptr[user_idx], self._centered.indptr[user_idx + 1]
+        centered_user[self._centered.indices[start:end]] = self._centered.data[start:end]
+
+        dots = self._centered @ centered_user
+        denominator = self._norms * self._norms[user_idx]
+        sim_row = np.divide(dots, denominator, out=np.zeros_like(dots), where=denominator != 0)
+        sim_row[user_idx] = 0
+        return sim_row
+
+    def _update_similarity_matrix(self, user_idx, sim_row, new_user):
+        """更新完整相似度矩阵中该用户的行和列"""
+        similarity = self.user_similarity
+        if new_user:
+            similarity = np.pad(similarity, ((0, 1), (0, 1)))
+        elif not similarity.flags.writeable:
+            # 从只读缓存映射加载的矩阵，先复制一份可写的
+            similarity = np.array(similarity)
+        sim_row = quantize_similarity(sim_row, self.similarity_precision)
+        similarity[user_idx, :] = sim_row
+        similarity[:, user_idx] = sim_row
+        self.user_similarity = similarity
+
+    def _update_neighbor_lists(self, user_idx, sim_row, new_user):
+        """
+        更新TopK邻居表：重建该用户自己的邻居表，并修正其他用户表中与该用户有关的项
+
+        若该用户在某人表中的相似度降到原第K名以下，表外可能存在更相似的用户，
+        这些行单独精确重算，保证结果与全量构建一致
+        """
+        ids, sims = self.neighbor_ids, self.neighbor_sims
+        if new_user:
+            ids = np.vstack([ids, np.zeros((1, ids.shape[1]), dtype=ids.dtype)])
+            sims = np.vstack([sims, np.zeros((1, sims.shape[1]), dtype=sims.dtype)])
+        elif not ids.flags.writeable or not sims.flags.writeable:
+            ids, sims = np.array(ids), np.array(sims)
+        k = ids.shape[1]
+
+        # 该用户自己的邻居表
+        ids[user_idx], sims[user_idx] = top_k_from_block(sim_row[None, :], user_idx, k)
+
+        others = np.ones(len(ids), dtype=bool)
+        others[user_idx] = False
+        in_list = (ids == user_idx) & others[:, None]
+        rows_in = np.nonzero(in_list.any(axis=1))[0]
+        old_last = sims[:, -1].astype(np.float64)
+
+        # 已在表中：更新相似度
+        sims[in_list] = sim_row[rows_in]
+        refresh = rows_in[sim_row[rows_in] < old_last[rows_in]]
+
+        # 不在表中但超过表中最后一名：替换最后一名
+        entered = np.nonzero(others & ~in_list.any(axis=1) & (sim_row > old_last))[0]
+        ids[entered, -1] = user_idx
+        sims[entered, -1] = sim_row[entered]
+
+        touched = np.union1d(rows_in, entered)
+        order = np.argsort(-sims[touched], axis=1, kind='stable')
+        ids[touched] = np.take_along_axis(ids[touched], order, axis=1)
+        sims[touched] = np.take_along_axis(sims[touched], order, axis=1)
+
+        for row in refresh:
+            ids[row], sims[row] = top_k_from_block(self._similarity_row(row)[None, :], row, k)
+
+        self.neighbor_ids, self.neighbor_sims = ids, sims
+
     def clear_cache(self):
-        """清除Redis中的相似度矩阵缓存"""
-        if self.redis_client:
-            # 删除所有相关键
-            keys = self.redis_client.keys(f"{self.cache_key}*")
-            if keys:
-                self.redis_client.delete(*keys)
-                print("[Redis] 已清除相似度矩阵缓存")
+        """清除本地文件和Redis中的相似度矩阵缓存"""
+        if self.local_cache is not None:
+            self.local_cache.remove("user_")
+        if redis_available(self.redis_client):
+            try:
+                # 只删除代指针（O(1)），已发布的数据键不再被引用，随TTL过期
+                if self.redis_client.delete(self._redis_pointer_key()):
+                    print("[Redis] 已清除相似度矩阵缓存")
+            except Exception as e:
+                print(f"[Redis] 清除缓存失败: {e}")
 
     def recommend_items(self, user_id, k=5, n=10, min_similarity=0.1):
         """
-        生成个性化电影推荐（带缓存优化）
+        生成个性化电影推荐（带缓存优化，lazy模式下只计算该用户的一行相似度）
 
         参数:
             user_id: 目标用户ID
@@ -197,40 +817,29 @@ class UserCFRecommender:
         返回:
             list: 推荐电影列表，按预测评分排序
         """
-        # 确保相似度矩阵已计算
-        if self.user_similarity is None:
-            self.calculate_similarity()
+        if self.similarity_mode == 'eager':
+            self._ensure_similarity()
 
         try:
-            user_idx = self.user_movie_ratings.index.get_loc(user_id)
-            user_rated = ~self.user_movie_ratings.iloc[user_idx].isna()
+            ratings = self.user_movie_ratings
+            user_idx = ratings.user_loc(user_id)
+            rated_cols = ratings.user_row(user_idx)[0]
 
-            # 获取有效相似用户（相似度>阈值且非自身）
-            sim_scores = self.user_similarity[user_idx]
-            valid_users = np.where(
-                (sim_scores >= min_similarity) &
-                (np.arange(len(sim_scores)) != user_idx)
-            )[0]
+            # 获取有效相似用户（相似度>阈值且非自身），选取TopK
+            n_valid, top_k_users, weights = self._select_neighbors(user_idx, k, min_similarity)
 
             # 如果没有足够相似用户，使用全局热门电影
-            if len(valid_users) < k:
-                print(f"警告: 相似用户不足({len(valid_users)}个)，使用热门电影补充")
-                return self._get_fallback_recommendations(n, user_rated)
-
-            # 选取TopK相似用户
-            top_k_users = valid_users[np.argsort(sim_scores[valid_users])[-k:]]
+            # （TopK邻居模式下最多只有neighbor_k个候选，k超出时按neighbor_k计）
+            if n_valid < min(k, self.neighbor_k or k):
+                print(f"警告: 相似用户不足({n_valid}个)，使用热门电影补充")
+                return self._get_fallback_recommendations(n, rated_cols)
 
-            # 计算加权预测评分
-            weighted_sum = np.zeros(len(self.user_movie_ratings.columns))
-            weight_sum = np.zeros(len(self.user_movie_ratings.columns))
-
-            for sim_user_idx in top_k_users:
-                sim_score = sim_scores[sim_user_idx]
-                other_ratings = self.user_movie_ratings.iloc[sim_user_idx].values
-                mask = ~np.isnan(other_ratings)
-
-                weighted_sum[mask] += sim_score * other_ratings[mask]
-                weight_sum[mask] += sim_score
+            # 一次取出K个邻居的全部评分，只在邻居评过的电影上计算加权预测评分
+            cols, values, lengths = ratings.gather_rows(top_k_users)
+            neighbor_weights = np.repeat(weights, lengths)
+            candidate_movies, inverse = np.unique(cols, return_inverse=True)
+            weighted_sum = np.bincount(inverse, neighbor_weights * values, len(candidate_movies))
+            weight_sum = np.bincount(inverse, neighbor_weights, len(candidate_movies))
 
             # 计算最终预测评分
             pred_ratings = np.divide(
@@ -241,11 +850,10 @@ class UserCFRecommender:
             )
 
             # 排除已评分电影并获取TopN推荐
-            unrated_mask = ~user_rated
-            candidate_movies = np.where(unrated_mask)[0]
-            top_n_idx = np.argsort(pred_ratings[candidate_movies])[-n:][::-1]
+            unrated = ~np.isin(candidate_movies, rated_cols, assume_unique=True)
+            top_cols, top_scores = self._top_n(candidate_movies[unrated], pred_ratings[unrated], n, rated_cols)
 
-            return self._format_recommendations(candidate_movies, top_n_idx, pred_ratings)
+            return self._format_recommendations(top_cols, top_scores)
 
         except KeyError:
             print(f"错误: 用户ID {user_id} 不存在，返回热门电影")
@@ -254,44 +862,249 @@ class UserCFRecommender:
             print(f"推荐过程中出错: {e}")
             return self._get_fallback_recommendations(n)
 
-    def _format_recommendations(self, candidate_movies, top_n_idx, pred_ratings):
-        """格式化推荐结果"""
-        recommendations = []
-        for idx in top_n_idx:
-            movie_id = self.user_movie_ratings.columns[candidate_movies[idx]]
-            movie_data = self.movie_info.loc[movie_id].to_dict()
-            recommendations.append({
-                'movie_id': movie_id,
-                'predicted_rating': round(pred_ratings[candidate_movies[idx]], 2),
-                **movie_data
-            })
-        return recommendations
+    def _ensure_similarity(self):
+        """
+        确保相似度矩阵（或TopK邻居表）已计算（lazy模式下先等待进行中的后台构建）
+
+        与后台构建相同，构建期间有评分变更未应用到新结构上时重新构建，不会把过期的结构标记为就绪
+        """
+        if self._build_thread is not None:
+            self._build_thread.join()
+        if not self._similarity_built():
+            self._build_until_current()
 
-    def _get_fallback_recommendations(self, n, exclude_rated=None):
+    def recommend_batch(self, user_ids=None, k=5, n=10, min_similarity=0.1):
         """
-        获取后备推荐（当相似用户不足时使用）
+        批量生成推荐（按用户块进行矩阵运算，适用于离线任务）
 
         参数:
-            n: 推荐数量
-            exclude_rated: 需要排除的已评分电影掩码
+            user_ids: 目标用户ID序列（None表示全部用户）
+            k, n, min_similarity: 含义同 recommend_items
+
+        生成:
+            (user_id, recommendations): 与 recommend_items 返回格式一致
+        """
+        for user_id, user_idx, top_cols, top_scores in self._iter_batch_scores(user_ids, k, n, min_similarity):
+            if top_cols is not None:
+                yield user_id, self._format_recommendations(top_cols, top_scores)
+            else:
+                yield user_id, self._batch_fallback(user_idx, n)
+
+    def export_recommendations(self, path, user_ids=None, k=5, n=10, min_similarity=0.1):
+        """
+        批量生成推荐并写入文件（按扩展名选择 .csv 或 .parquet）
+
+        输出列: user_id, rank, movie_id, predicted_rating
+        .parquet 需要可选依赖 pyarrow 或 fastparquet（未安装时在计算推荐之前抛出ImportError）
 
         返回:
-            list: 按IMDb评分降序的热门电影
+            int: 写入的推荐条数
         """
-        if exclude_rated is not None:
-            unrated_movies = self.user_movie_ratings.columns[~exclude_rated]
-            movies = self.movie_info.loc[unrated_movies]
+        parquet = str(path).endswith('.parquet')
+        if parquet:
+            _require_parquet_engine()
+        movie_ids = self.user_movie_ratings.movie_ids
+        columns = {'user_id': [], 'rank': [], 'movie_id': [], 'predicted_rating': []}
+        for user_id, user_idx, top_cols, top_scores in self._iter_batch_scores(user_ids, k, n, min_similarity):
+            if top_cols is not None:
+                rec_ids, rec_scores = movie_ids[top_cols], top_scores.round(2)
+            else:
+                fallback = self._batch_fallback(user_idx, n)
+                rec_ids = [rec['movie_id'] for rec in fallback]
+                rec_scores = [rec['predicted_rating'] for rec in fallback]
+            columns['user_id'].extend([user_id] * len(rec_ids))
+            columns['rank'].extend(range(1, len(rec_ids) + 1))
+            columns['movie_id'].extend(rec_ids)
+            columns['predicted_rating'].extend(rec_scores)
+
+        result = pd.DataFrame(columns)
+        if parquet:
+            result.to_parquet(path, index=False)
         else:
-            movies = self.movie_info
-
-        top_movies = movies.sort_values('imdb_rating', ascending=False).head(n)
-        return [{
-            'movie_id': idx,
-            'predicted_rating': round(row['imdb_rating'], 2),
-            **row.to_dict()
-        } for idx, row in top_movies.iterrows()]
-
-    def __del__(self):
-        """析构时关闭Redis连接"""
-        if hasattr(self, 'redis_client') and self.redis_client:
-            self.redis_client.close()
\ No newline at end of file
+            result.to_csv(path, index=False)
+        return len(result)
+
+    def _batch_fallback(self, user_idx, n):
+        """批量推荐中相似用户不足或用户不存在时的后备推荐"""
+        if user_idx < 0:
+            return self._get_fallback_recommendations(n)
+        return self._get_fallback_recommendations(n, self.user_movie_ratings.user_row(user_idx)[0])
+
+    def _select_neighbors_batch(self, rows, k, min_similarity):
+        """
+        为一批用户选取TopK相似用户
+
+        返回:
+            n_valid (ndarray): 每个用户相似度不低于阈值的候选数
+            neighbors (ndarray): 形状 (B, k) 的相似用户位置
+            weights (ndarray): 对应相似度（未达阈值的位置为0，不参与加权）
+        """
+        if self.neighbor_ids is not None:
+            top = min(k, self.neighbor_ids.shape[1])
+            sims = np.asarray(self.neighbor_sims[rows], dtype=np.float64)
+            valid = sims >= min_similarity
+            weights = np.where(valid[:, :top], sims[:, :top], 0.0)
+            # 近似邻居表的补位项（位置-1，相似度-inf）不会达到阈值，位置改为0（权重为0）以构建权重矩阵
+            neighbors = np.where(valid[:, :top], self.neighbor_ids[rows, :top], 0)
+            return valid.sum(axis=1), neighbors, weights
+
+        sims = dequantize_similarity(self.user_similarity[rows])  # 花式索引已复制，可原地修改
+        sims[np.arange(len(rows)), rows] = -np.inf  # 排除自身
+        valid = sims >= min_similarity
+        sims[~valid] = -np.inf
+
+        top = max(1, min(k, sims.shape[1] - 1))
+        neighbors = np.argpartition(-sims, top - 1, axis=1)[:, :top]
+        weights = np.take_along_axis(sims, neighbors, axis=1)
+        weights[~np.isfinite(weights)] = 0.0
+        return valid.sum(axis=1), neighbors, weights
+
+    def _iter_batch_scores(self, user_ids, k, n, min_similarity):
+        """
+        按用户块计算预测评分并选出TopN
+
+        每块内: 邻居选择得到稀疏权重矩阵 W (B×N)，预测评分为
+        (W @ R) / (W @ 已评分指示矩阵)。预测评分只在邻居评过的电影上非零，
+        因此全程保持稀疏，排除已评分电影后按 (用户, -评分) 排序取每行前N个
+
+        生成:
+            (user_id, user_idx, top_cols, top_scores): top_cols为None表示需使用后备推荐，
+            user_idx为-1表示用户不存在
+        """
+        self._ensure_similarity()
+        ratings = self.user_movie_ratings
+        n_users, n_movies = ratings.shape
+        user_ids = ratings.user_ids if user_ids is None else np.asarray(user_ids)
+        positions = ratings.user_index.get_indexer(user_ids)
+
+        rated_indicator = ratings.matrix.copy()
+        rated_indicator.data[:] = 1.0
+        required = min(k, self.neighbor_k or k)
+        top_n = min(n, n_movies)
+        block_rows = block_rows_for_budget(max(n_users, n_movies), self.max_memory_mb)
+
+        for start in range(0, len(user_ids), block_rows):
+            block_ids = user_ids[start:start + block_rows]
+            block_pos = positions[start:start + block_rows]
+            known = block_pos[block_pos >= 0]
+            n_valid, neighbors, weights = self._select_neighbors_batch(known, k, min_similarity)
+
+            # 相似用户不足的用户走后备推荐，不参与矩阵运算
+            scored = n_valid >= required
+            rows, neighbors, weights = known[scored], neighbors[scored], weights[scored]
+            top_cols, top_scores = self._batch_top_n(rows, neighbors, weights, rated_indicator, top_n)
+
+            scored_iter = iter(zip(top_cols, top_scores))
+            known_iter = iter(scored)
+            for user_id, user_idx in zip(block_ids, block_pos):
+                if user_idx < 0:
+                    yield user_id, -1, None, None
+                elif next(known_iter):
+                    yield (user_id, user_idx, *next(scored_iter))
+                else:
+                    yield user_id, user_idx, None, None
+
+    def _weight_matrix(self, neighbors, weights):
+        """邻居选择结果转换为稀疏权重矩阵 W (B×N)，第b行为第b个用户对各邻居的相似度权重"""
+        n_rows, top = neighbors.shape
+        return sp.csr_matrix(
+            (weights.ravel(), neighbors.ravel(), np.arange(0, n_rows * top + 1, top)),
+            shape=(n_rows, self.user_movie_ratings.shape[0])
+        )
+
+    def predict_ratings(self, user_ids, movie_ids, k=5, min_similarity=0.1):
+        """
+        批量预测 (用户, 电影) 对的评分（离线评估用，按用户块进行矩阵运算）
+
+        加权方式与 recommend_items 一致；用户或电影不存在、相似用户不足（推荐时走后备路径）、
+        或选中的邻居都没有评过该电影时结果为NaN
+
+        参数:
+            user_ids, movie_ids: 等长的用户ID与电影ID序列
+            k, min_similarity: 含义同 recommend_items
+
+        返回:
+            ndarray: 预测评分
+        """
+        self._ensure_similarity()
+        ratings = self.user_movie_ratings
+        rows = ratings.user_index.get_indexer(np.asarray(user_ids))
+        cols = ratings.movie_index.get_indexer(np.asarray(movie_ids))
+        predictions = np.full(len(rows), np.nan)
+        known = np.flatnonzero((rows >= 0) & (cols >= 0))
+        if len(known) == 0:
+            return predictions
+
+        rated_indicator = ratings.matrix.copy()
+        rated_indicator.data[:] = 1.0
+        required = min(k, self.neighbor_k or k)
+        unique_rows, inverse = np.unique(rows[known], return_inverse=True)
+        block_rows = block_rows_for_budget(max(ratings.shape), self.max_memory_mb)
+
+        for start in range(0, len(unique_rows), block_rows):
+            block = unique_rows[start:start + block_rows]
+            n_valid, neighbors, weights = self._select_neighbors_batch(block, k, min_similarity)
+            weights = np.where((n_valid >= required)[:, None], weights, 0.0)
+            weight_matrix = self._weight_matrix(neighbors, weights)
+
+            in_block = (inverse >= start) & (inverse < start + len(block))
+            local_rows, pair_cols = inverse[in_block] - start, cols[known[in_block]]
+            weighted_sum = np.asarray((weight_matrix @ ratings.matrix)[local_rows, pair_cols]).ravel()
+            weight_sum = np.asarray((weight_matrix @ rated_indicator)[local_rows, pair_cols]).ravel()
+            predictions[known[in_block]] = np.divide(
+                weighted_sum, weight_sum, out=np.full(len(weight_sum), np.nan), where=(weight_sum != 0))
+        return predictions
+
+    def _batch_top_n(self, rows, neighbors, weights, rated_indicator, top_n):
+        """
+        计算一块用户的TopN推荐（稀疏实现）
+
+        返回:
+            top_cols (list): 每个用户推荐电影的列位置（按预测评分降序）
+            top_scores (list): 对应的预测评分
+        """
+        if len(rows) == 0:
+            return [], []
+        ratings = self.user_movie_ratings
+        n_users, n_movies = ratings.shape
+        n_rows = len(rows)
+        weight_matrix = self._weight_matrix(neighbors, weights)
+
+        weight_sum = weight_matrix @ rated_indicator
+        inv_weight_sum = weight_sum.copy()
+        inv_weight_sum.data = np.divide(1.0, weight_sum.data, out=np.zeros_like(weight_sum.data),
+                                        where=(weight_sum.data != 0))
+        pred = (weight_matrix @ ratings.matrix).multiply(inv_weight_sum).tocsr()
+
+        # 排除已评分电影
+        rated = rated_indicator[rows]
+        pred = pred - pred.multiply(rated)
+        pred.eliminate_zeros()
+
+        # 每行候选只有邻居评过的电影，放入 (B × 最大候选数) 的小矩阵后用 argpartition 取TopN
+        counts = np.diff(pred.indptr)
+        width = max(int(counts.max()), top_n)
+        offsets = np.arange(pred.nnz) - np.repeat(pred.indptr[:-1], counts)
+        row_of = np.repeat(np.arange(n_rows), counts)
+        cand_scores = np.full((n_rows, width), -np.inf)
+        cand_scores[row_of, offsets] = pred.data
+        cand_cols = np.zeros((n_rows, width), dtype=pred.indices.dtype)
+        cand_cols[row_of, offsets] = pred.indices
+
+        top = np.argpartition(-cand_scores, top_n - 1, axis=1)[:, :top_n]
+        top_scores = np.take_along_axis(cand_scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        top_cols = np.take_along_axis(cand_cols, top, axis=1)
+
+        results_cols, results_scores = [], []
+        for row in range(n_rows):
+            cols, scores = top_cols[row], top_scores[row]
+            if counts[row] < top_n:
+                # 候选不足N个时与 recommend_items 一致，用预测评分为0的未评分电影补齐
+                rated_cols = rated.indices[rated.indptr[row]:rated.indptr[row + 1]]
+                cols, scores = self._pad_top_n(cols[:counts[row]], scores[:counts[row]], top_n, rated_cols)
+            results_cols.append(cols)
+            results_scores.append(scores)
+        return results_cols, results_scores
@@ -0,0 +1,235 @@
+"""
+Redis共享连接模块
+每个Redis地址在进程内只创建一个连接池和一个客户端（所有推荐器与结果缓存共用），
+连接/读写超时以毫秒计且不重试；连续失败达到阈值时熔断，熔断期间直接跳过Redis，
+冷却时间过后由后台线程探测，恢复后自动重新启用。客户端记录命中、未命中、超时和熔断跳过次数。
+fork出的子进程（如gunicorn worker）中自动重建锁和探测状态，不继承父进程中后台线程留下的状态
+"""
+
+import os
+import threading
+import time
+
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+# 读命令：按返回值统计缓存命中/未命中
+_READ_COMMANDS = ('get', 'hget', 'mget', 'exists')
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class RedisUnavailable(redis.ConnectionError):
+    """熔断器打开期间调用Redis命令时抛出（不发起网络请求）"""
+
+
+def redis_available(client):
+    """客户端存在且未熔断（也接受没有熔断器的普通客户端）"""
+    return client is not None and getattr(client, 'available', True)
+
+
+def get_redis_client(host='localhost', port=6379, db=0, password=None):
+    """
+    获取进程内共享的Redis客户端（同一地址只创建一次连接池，首次创建时做一次连接测试）
+
+    环境变量 REDIS_HOST / REDIS_PORT / REDIS_PASSWORD 优先于参数
+
+    返回:
+        ResilientRedis: 带熔断器的客户端
+    """
+    host = os.getenv('REDIS_HOST', host)
+    port = int(os.getenv('REDIS_PORT', port))
+    password = os.getenv('REDIS_PASSWORD', password)
+    key = (host, port, db, password)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = ResilientRedis(host, port, db, password)
+            client.probe()
+    return client
+
+
+class ResilientRedis:
+    def __init__(self, host='localhost', port=6379, db=0, password=None, connect_timeout_ms=200,
+                 socket_timeout_ms=1000, max_connections=32, failure_threshold=3, cooldown=5.0):
+        """
+        初始化带熔断器的Redis客户端（一般通过 get_redis_client 获取共享实例）
+
+        参数:
+            host / port / db / password: Redis连接参数
+            connect_timeout_ms (float): 建立连接的超时（毫秒）
+            socket_timeout_ms (float): 单条命令读写的超时（毫秒）
+            max_connections (int): 连接池的最大连接数
+            failure_threshold (int): 连续失败多少次后熔断
+            cooldown (float): 熔断后多少秒再探测Redis是否恢复
+
+        属性:
+            client: 底层 redis.Redis 客户端（原始字节模式，便于压缩）
+            stats: 命中/未命中/超时/错误/熔断跳过/熔断次数
+        """
+        connect_timeout = float(os.getenv('REDIS_CONNECT_TIMEOUT_MS', connect_timeout_ms)) / 1000
+        socket_timeout = float(os.getenv('REDIS_SOCKET_TIMEOUT_MS', socket_timeout_ms)) / 1000
+        self.pool = redis.ConnectionPool(
+            host=host, port=port, db=db, password=password,
+            max_connections=int(os.getenv('REDIS_MAX_CONNECTIONS', max_connections)),
+            socket_connect_timeout=connect_timeout,
+            socket_timeout=socket_timeout,
+            retry=Retry(NoBackoff(), 0),  # 失败立即返回，由熔断器决定何时再试
+        )
+        self.client = redis.Redis(connection_pool=self.pool, decode_responses=False)
+        self.address = f"{host}:{port}/{db}"
+        self.failure_threshold = int(os.getenv('REDIS_BREAKER_FAILURES', failure_threshold))
+        self.cooldown = float(os.getenv('REDIS_BREAKER_COOLDOWN', cooldown))
+
+        self._lock = threading.Lock()
+        self._failures = 0  # 连续失败次数
+        self._open_until = None  # 熔断打开时为下次探测的时间
+        self._probing = False
+        self.stats = {'hits': 0, 'misses': 0, 'timeouts': 0, 'errors': 0, 'breaker_open': 0, 'breaker_trips': 0}
+
+    @property
+    def available(self):
+        """熔断器是否闭合（打开且冷却时间已过时在后台发起一次探测）"""
+        with self._lock:
+            if self._open_until is None:
+                return True
+            if time.monotonic() >= self._open_until and not self._probing:
+                self._probing = True
+                threading.Thread(target=self._background_probe, name='redis-probe', daemon=True).start()
+            return False
+
+    def probe(self):
+        """发送一次PING，成功时闭合熔断器，失败时打开熔断器"""
+        try:
+            self.client.ping()
+        except Exception as e:
+            with self._lock:
+                self.stats['timeouts' if isinstance(e, redis.TimeoutError) else 'errors'] += 1
+            self._trip(e)
+            return False
+        self._record_success()
+        return True
+
+    def _reset_after_fork(self):
+        """
+        fork后在子进程中调用：父进程的探测线程不会被复制到子进程，
+        继承来的锁可能处于持有状态、探测标记也不会再被清除，因此全部重建；
+        熔断器打开时在下次检查时立即重新探测。连接池在子进程中首次使用时由 redis-py 按pid重建
+        """
+        self._lock = threading.Lock()
+        self._probing = False
+        if self._open_until is not None:
+            self._open_until = time.monotonic()
+
+    def _background_probe(self):
+        try:
+            if self.probe():
+                print(f"[Redis] {self.address} 已恢复，重新启用缓存")
+        finally:
+            with self._lock:
+                self._probing = False
+
+    def _trip(self, error):
+        """打开熔断器（冷却时间后再探测）"""
+        with self._lock:
+            newly_open = self._open_until is None
+            self._open_until = time.monotonic() + self.cooldown
+            self._failures = 0
+            if newly_open:
+                self.stats['breaker_trips'] += 1
+        if newly_open:
+            print(f"警告: 无法连接Redis服务器 {self.address}（{error}），{self.cooldown:g}秒内跳过缓存")
+
+    def _record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._open_until = None
+
+    def _record_failure(self, error):
+        with self._lock:
+            key = 'timeouts' if isinstance(error, redis.TimeoutError) else 'errors'
+            self.stats[key] += 1
+            self._failures += 1
+            trip = self._failures >= self.failure_threshold
+        if trip:
+            self._trip(error)
+
+    def _record_read(self, name, result):
+        if name == 'mget':
+            found = sum(value is not None for value in result)
+            hits, misses = found, len(result) - found
+        else:
+            hits = 1 if result else 0
+            misses = 1 - hits
+        with self._lock:
+            self.stats['hits'] += hits
+            self.stats['misses'] += misses
+
+    def call(self, name, func, *args, **kwargs):
+        """经过熔断器执行一条命令（熔断时抛出 RedisUnavailable）"""
+        if not self.available:
+            with self._lock:
+                self.stats['breaker_open'] += 1
+            raise RedisUnavailable(f"Redis {self.address} 熔断中")
+        try:
+            result = func(*args, **kwargs)
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            self._record_failure(e)
+            raise
+        self._record_success()
+        if name in _READ_COMMANDS:
+            self._record_read(name, result)
+        return result
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+
+        def command(*args, **kwargs):
+            return self.call(name, attr, *args, **kwargs)
+        return command
+
+    def pipeline(self, transaction=True):
+        """管道中的命令只在本地排队，execute时才经过熔断器"""
+        return _ResilientPipeline(self, self.client.pipeline(transaction=transaction))
+
+    def get_stats(self):
+        """计数器快照及熔断器状态"""
+        available = self.available
+        with self._lock:
+            return {**self.stats, 'state': 'closed' if available else 'open'}
+
+    def close(self):
+        """共享客户端由进程内所有推荐器共用，不随单个推荐器关闭"""
+
+
+class _ResilientPipeline:
+    def __init__(self, owner, pipeline):
+        self._owner = owner
+        self._pipeline = pipeline
+
+    def __getattr__(self, name):
+        return getattr(self._pipeline, name)
+
+    def execute(self):
+        return self._owner.call('execute', self._pipeline.execute)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._pipeline.reset()
+
+
+def _after_fork_in_child():
+    global _clients_lock
+    _clients_lock = threading.Lock()
+    for client in _clients.values():
+        client._reset_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):  # Windows没有fork
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,216 @@
+"""
+推荐结果缓存
+两级缓存：进程内LRU（条目数和TTL双重上限，命中为微秒级）+ Redis共享层（多进程共用），
+键为 (数据版本, 评分版本, 用户ID, k, n, min_similarity)（参数为None表示推荐引擎的默认值）；
+评分增删只失效受影响用户的结果并切换评分版本（Redis中的结果只在评分相同的进程之间共享），
+电影增删改（数据重新加载）时切换数据版本
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from redis_pool import redis_available
+
+
+def compute_data_version(user_movie_ratings, movie_info, engine=""):
+    """
+    数据版本号：推荐引擎名 + 评分矩阵指纹 + 电影信息内容哈希
+
+    使用同一引擎且数据文件内容相同的进程得到相同版本，可以共享Redis中的推荐结果
+    """
+    movie_hash = pd.util.hash_pandas_object(movie_info, index=True).to_numpy()
+    digest = hashlib.blake2b(movie_hash.tobytes(), digest_size=4).hexdigest()
+    return f"{engine}-{user_movie_ratings.fingerprint()[:16]}-{digest}"
+
+
+def _to_builtin(value):
+    """JSON序列化NumPy标量"""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"无法序列化的类型: {type(value)}")
+
+
+class RecommendationCache:
+    def __init__(self, redis_client=None, max_entries=1024, ttl=300, redis_ttl=3600, key_prefix="rec"):
+        """
+        初始化推荐结果缓存
+
+        参数:
+            redis_client: Redis客户端（None表示只使用进程内缓存）
+            max_entries (int): 进程内缓存的最大条目数（超出时淘汰最久未使用的）
+            ttl (float): 进程内缓存条目的有效期（秒），也是其他进程评分变更的最大可见延迟
+            redis_ttl (int): Redis中结果的有效期（秒）
+            key_prefix (str): Redis键前缀
+        """
+        self.redis_client = redis_client
+        self.max_entries = int(os.getenv('RESULT_CACHE_SIZE', max_entries))
+        self.ttl = float(os.getenv('RESULT_CACHE_TTL', ttl))
+        self.redis_ttl = int(os.getenv('RESULT_CACHE_REDIS_TTL', redis_ttl))
+        self.key_prefix = key_prefix
+        self.data_version = None
+        # 评分版本：本进程应用过的评分变更的链式哈希（应用了相同变更序列的进程得到相同版本）
+        self.rating_version = None
+
+        self._entries = OrderedDict()  # (用户ID, k, n, min_similarity) -> (过期时间, 推荐结果)
+        self._user_keys = {}  # 用户ID -> 该用户在进程内缓存中的键集合
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def set_data_version(self, version):
+        """切换数据版本（数据重新加载后调用），旧版本的进程内结果全部丢弃"""
+        with self._lock:
+            if version != self.data_version:
+                self.data_version = version
+                self.rating_version = None
+                self._entries.clear()
+                self._user_keys.clear()
+
+    def version(self):
+        """当前的缓存版本（数据版本 + 评分版本）"""
+        if self.rating_version is None:
+            return self.data_version
+        return f"{self.data_version}.{self.rating_version}"
+
+    def _advance_rating_version(self, change):
+        with self._lock:
+            digest = hashlib.blake2b(f"{self.rating_version}|{change}".encode('utf-8'), digest_size=8)
+            self.rating_version = digest.hexdigest()
+
+    @contextmanager
+    def rating_change(self, user_id, movie_id, rating=None):
+        """
+        包裹推荐引擎应用一条评分变更的过程（rating为None表示删除）
+
+        进入和退出时各切换一次评分版本：Redis中其他进程（尚未应用该变更）按旧评分写入的结果
+        不会被本进程读到，本进程按新评分算出的结果也不会被其他进程读到；
+        计算开始后版本发生变化的结果可能基于变更前的评分，不写入缓存（见 set）
+        """
+        self._advance_rating_version(f"{user_id}|{movie_id}|{rating}")
+        try:
+            yield
+        finally:
+            self._advance_rating_version("applied")
+
+    def _redis_key(self, user_id, version=None):
+        return f"{self.key_prefix}:{version or self.version()}:{user_id}"
+
+    def get(self, user_id, k, n, min_similarity):
+        """
+        查询缓存的推荐结果
+
+        返回:
+            list or None: 推荐结果（未命中时返回None）
+        """
+        key = (user_id, k, n, min_similarity)
+        version = self.version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._discard(key)
+
+        if redis_available(self.redis_client):
+            try:
+                data = self.redis_client.hget(self._redis_key(user_id, version), f"{k}:{n}:{min_similarity}")
+            except Exception as e:
+                print(f"[Redis] 读取推荐结果缓存失败: {str(e)}")
+                data = None
+            if data is not None:
+                recommendations = json.loads(data)
+                self._store_local(key, recommendations, version)
+                self.redis_hits += 1
+                return recommendations
+
+        self.misses += 1
+        return None
+
+    def set(self, user_id, k, n, min_similarity, recommendations, version=None):
+        """
+        写入推荐结果（进程内缓存与Redis）
+
+        参数:
+            version (str): 开始计算时的缓存版本（None表示当前版本）；
+                与当前版本不同时（计算期间评分或数据发生变化）结果可能已过期，不写入
+        """
+        version = version or self.version()
+        if not self._store_local((user_id, k, n, min_similarity), recommendations, version):
+            return
+        if not redis_available(self.redis_client):
+            return
+        try:
+            key = self._redis_key(user_id, version)
+            pipe = self.redis_client.pipeline()
+            pipe.hset(key, f"{k}:{n}:{min_similarity}", json.dumps(recommendations, default=_to_builtin))
+            pipe.expire(key, self.redis_ttl)
+            pipe.execute()
+        except Exception as e:
+            print(f"[Redis] 写入推荐结果缓存失败: {str(e)}")
+
+    def get_or_compute(self, user_id, compute, k, n, min_similarity):
+        """命中时直接返回缓存结果，否则调用 compute() 生成并写入缓存"""
+        version = self.version()
+        recommendations = self.get(user_id, k, n, min_similarity)
+        if recommendations is None:
+            recommendations = compute()
+            self.set(user_id, k, n, min_similarity, recommendations, version)
+        return recommendations
+
+    def _store_local(self, key, recommendations, version=None):
+        """写入进程内缓存，版本已变化时不写入并返回False"""
+        with self._lock:
+            if version is not None and version != self.version():
+                return False
+            self._entries[key] = (time.monotonic() + self.ttl, recommendations)
+            self._entries.move_to_end(key)
+            self._user_keys.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+        return True
+
+    def _discard(self, key):
+        """删除一个进程内缓存条目（调用方持有锁）"""
+        self._entries.pop(key, None)
+        keys = self._user_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[key[0]]
+
+    def get_stats(self):
+        """命中/未命中计数及进程内缓存条目数"""
+        with self._lock:
+            return {'hits': self.hits, 'redis_hits': self.redis_hits, 'misses': self.misses,
+                    'entries': len(self._entries)}
+
+    def invalidate_users(self, user_ids):
+        """
+        失效指定用户的推荐结果（评分增删后调用，每个用户在Redis中只有一个键）
+
+        Redis中只删除当前版本下的键，其他版本的结果不会再被本进程读到，随TTL过期
+        """
+        user_ids = list(set(user_ids))
+        with self._lock:
+            for user_id in user_ids:
+                for key in self._user_keys.pop(user_id, ()):
+                    self._entries.pop(key, None)
+
+        if not redis_available(self.redis_client):
+            return
+        try:
+            for start in range(0, len(user_ids), 1000):
+                self.redis_client.delete(*(self._redis_key(user_id) for user_id in user_ids[start:start + 1000]))
+        except Exception as e:
+            print(f"[Redis] 删除推荐结果缓存失败: {str(e)}")
@@ -0,0 +1,126 @@
+"""
+在线推荐公共逻辑
+各推荐引擎共用的TopN选取、结果格式化及热门电影后备推荐，
+依赖子类提供 user_movie_ratings (RatingMatrix) 与 movie_info (以电影ID为索引的DataFrame)
+"""
+
+import numpy as np
+
+
+class ServingMixin:
+    # 在线推荐的预计算结构（首次推荐时构建，见 _ensure_serving_layout）
+    _movie_records = None
+    _popular_cols = None
+    _popular_movies = None
+
+    def _top_n(self, cols, scores, n, rated_cols=None):
+        """
+        从候选电影中取预测评分最高的n个（argpartition，按评分降序）
+
+        rated_cols不为None时，候选不足n个的部分用预测评分为0的未评分电影补齐
+        """
+        if len(cols) > n:
+            top = np.argpartition(-scores, n - 1)[:n]
+            cols, scores = cols[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        if rated_cols is None:
+            return cols[order], scores[order]
+        return self._pad_top_n(cols[order], scores[order], n, rated_cols)
+
+    def _pad_top_n(self, cols, scores, n, rated_cols):
+        """候选不足n个时，用预测评分为0的其他未评分电影补齐（与稠密实现的结果一致）"""
+        n_movies = self.user_movie_ratings.shape[1]
+        if len(cols) >= min(n, n_movies):
+            return cols, scores
+        taken = np.zeros(n_movies, dtype=bool)
+        taken[cols] = True
+        taken[rated_cols] = True
+        padding = np.flatnonzero(~taken)[::-1][:n - len(cols)]
+        return np.concatenate((cols, padding)), np.concatenate((scores, np.zeros(len(padding))))
+
+    def warm_up(self):
+        """
+        预热在线推荐所需的结构（应用启动后在后台线程调用，完成前应使用 fallback_for_user）
+
+        默认只构建推荐结果格式化与后备推荐的预计算结构；各引擎在此基础上构建或加载模型
+        """
+        self._ensure_serving_layout()
+
+    def fallback_for_user(self, user_id, n=10):
+        """某用户的热门电影后备推荐（排除其已评分的电影，不依赖相似度或模型）"""
+        ratings = self.user_movie_ratings
+        if user_id not in ratings.user_index:
+            return self._get_fallback_recommendations(n)
+        return self._get_fallback_recommendations(n, ratings.user_row(ratings.user_loc(user_id))[0])
+
+    def dependent_users(self, user_id):
+        """
+        推荐结果可能受该用户评分变化影响的用户ID（用于推荐结果缓存的失效）
+
+        默认只有该用户自己；相似度随评分增量更新的引擎需要覆盖此方法
+        """
+        return [user_id]
+
+    def _format_recommendations(self, movie_cols, scores):
+        """格式化推荐结果（movie_cols为电影列位置，scores为对应预测评分）"""
+        self._ensure_serving_layout()
+        movie_ids = self.user_movie_ratings.movie_ids
+        return [{
+            'movie_id': movie_ids[col],
+            'predicted_rating': round(score, 2),
+            **self._movie_records[col]
+        } for col, score in zip(movie_cols, scores)]
+
+    def _get_fallback_recommendations(self, n, rated_cols=None):
+        """
+        获取后备推荐（没有足够的个性化推荐候选时使用）
+
+        参数:
+            n: 推荐数量
+            rated_cols: 需要排除的已评分电影列位置（None表示不排除，从全部电影中选取）
+
+        返回:
+            list: 按IMDb评分降序的热门电影
+        """
+        self._ensure_serving_layout()
+        if rated_cols is None:
+            return [{
+                'movie_id': movie_id,
+                'predicted_rating': round(record['imdb_rating'], 2),
+                **record
+            } for movie_id, record in self._popular_movies[:n]]
+
+        # 已评分电影最多len(rated_cols)个，只需检查热门顺序中的前 n+len(rated_cols) 个
+        head = self._popular_cols[:n + len(rated_cols)]
+        cols = head[~np.isin(head, rated_cols)][:n]
+        movie_ids = self.user_movie_ratings.movie_ids
+        return [{
+            'movie_id': movie_ids[col],
+            'predicted_rating': round(self._movie_records[col]['imdb_rating'], 2),
+            **self._movie_records[col]
+        } for col in cols]
+
+    def _ensure_serving_layout(self):
+        """
+        构建在线推荐使用的预计算结构（电影集合变化后重建）
+
+        _movie_records: 按评分矩阵列位置索引的电影信息字典
+        _popular_cols: 评分矩阵中的电影按IMDb评分降序排列的列位置
+        _popular_movies: 全部电影按IMDb评分降序排列的 (电影ID, 信息字典)
+        """
+        movie_ids = self.user_movie_ratings.movie_ids
+        if self._movie_records is not None and len(self._movie_records) == len(movie_ids):
+            return
+
+        info_records = self.movie_info.to_dict('records')
+        positions = self.movie_info.index.get_indexer(movie_ids)
+        self._movie_records = [info_records[pos] if pos >= 0 else {} for pos in positions]
+
+        # 只有电影信息中存在的电影参与热门排序
+        imdb_ratings = self.movie_info['imdb_rating'].to_numpy(dtype=np.float64)
+        known_cols = np.flatnonzero(positions >= 0)
+        self._popular_cols = known_cols[np.argsort(-imdb_ratings[positions[known_cols]], kind='stable')]
+
+        order = np.argsort(-imdb_ratings, kind='stable')
+        popular_ids = self.movie_info.index.to_numpy()[order].tolist()
+        self._popular_movies = list(zip(popular_ids, (info_records[pos] for pos in order)))
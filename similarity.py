@@ -0,0 +1,264 @@
+"""
+用户相似度计算模块
+在中心化的稀疏评分矩阵上分块计算皮尔逊相似度，并提取每个用户的TopK邻居；
+n_jobs > 1 时中心化矩阵放入共享内存，由进程池并行计算各行块（结果与单进程逐位一致）
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+import scipy.sparse as sp
+
+# 计算一个相似度块时，每个块元素大约需要的临时数组份数
+# （稀疏乘积结果、稠密块、TopK选取时的副本及排序下标）
+_BLOCK_WORK_COPIES = 4
+
+# 相似度矩阵的存储精度（取值在[-1, 1]内，只用于邻居排序和评分加权）
+SIMILARITY_DTYPES = {
+    'float64': np.float64,
+    'float32': np.float32,
+    'float16': np.float16,
+    'int8': np.int8,
+}
+# int8量化的固定比例: 存储值 = round(相似度 × 127)，最大误差 1/254
+INT8_SCALE = 127.0
+
+
+def block_rows_for_budget(n_users, max_memory_mb):
+    """
+    根据内存预算计算每块的用户行数
+
+    参数:
+        n_users (int): 用户数（即每行相似度的列数）
+        max_memory_mb (float): 分块计算允许使用的工作内存上限（MB）
+
+    返回:
+        int: 每块行数（至少为1）
+    """
+    row_bytes = max(n_users, 1) * np.dtype(np.float64).itemsize * _BLOCK_WORK_COPIES
+    return int(max(1, min(n_users, max_memory_mb * 1024 * 1024 // row_bytes)))
+
+
+def quantize_similarity(values, precision):
+    """
+    把相似度转换为指定的存储精度
+
+    参数:
+        values (ndarray): float64相似度
+        precision (str): float64/float32/float16/int8
+
+    返回:
+        ndarray: 存储用数组（int8时为按INT8_SCALE量化后的整数）
+    """
+    dtype = SIMILARITY_DTYPES[precision]
+    if dtype is np.int8:
+        return np.rint(np.clip(values, -1.0, 1.0) * INT8_SCALE).astype(np.int8)
+    return np.asarray(values).astype(dtype, copy=False)
+
+
+def quantize_block(block, start, precision):
+    """iter_similarity_blocks 的reduce函数: 在计算进程中把相似度块转换为存储精度"""
+    return quantize_similarity(block, precision)
+
+
+def dequantize_similarity(values):
+    """把存储的相似度还原为float64（按数组dtype识别int8量化）"""
+    values = np.asarray(values)
+    if values.dtype == np.int8:
+        return values.astype(np.float64) / INT8_SCALE
+    return values.astype(np.float64, copy=False)
+
+
+def center_ratings(ratings):
+    """
+    对评分矩阵按用户均值中心化（仅作用于已评分项，保持稀疏结构）
+
+    参数:
+        ratings (csr_matrix): 用户-电影评分矩阵
+
+    返回:
+        centered (csr_matrix): 中心化后的评分矩阵
+        norms (ndarray): 每个用户中心化评分向量的L2范数
+    """
+    counts = np.diff(ratings.indptr)
+    sums = np.asarray(ratings.sum(axis=1)).ravel()
+    means = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+
+    centered = ratings.copy()
+    centered.data -= np.repeat(means, counts)
+    norms = np.sqrt(np.asarray(centered.multiply(centered).sum(axis=1)).ravel())
+    return centered, norms
+
+
+def resolve_n_jobs(n_jobs):
+    """并行进程数（None或1表示单进程，0或负数表示使用全部CPU核心）"""
+    if n_jobs is None:
+        return 1
+    n_jobs = int(n_jobs)
+    if n_jobs <= 0:
+        return os.cpu_count() or 1
+    return n_jobs
+
+
+def _similarity_block(centered, centered_t, safe_norms, start, end):
+    """计算 [start, end) 行的相似度块（对角线置零），单进程与多进程共用"""
+    block = (centered[start:end] @ centered_t).toarray()
+    block /= safe_norms[start:end, None]
+    block /= safe_norms[None, :]
+    # 排除自相似度
+    rows = np.arange(end - start)
+    block[rows, start + rows] = 0
+    return block
+
+
+def iter_similarity_blocks(centered, norms, block_size, n_jobs=1, reduce=None):
+    """
+    按行分块计算用户相似度，每次只生成 block_size × N 的稠密块
+
+    参数:
+        centered (csr_matrix): 中心化评分矩阵
+        norms (ndarray): 用户范数
+        block_size (int): 每块的用户行数
+        n_jobs (int): 并行进程数（见 resolve_n_jobs）
+        reduce (callable): 对每个块的后处理 reduce(block, start)，多进程时在子进程中执行
+            （如TopK选取或量化，只把缩减后的结果传回主进程）；需可被pickle
+
+    生成:
+        (start, end, block): 块的起止行号及相似度块（对角线已置零；指定reduce时为其返回值），
+            按行号顺序产生
+    """
+    n_users = centered.shape[0]
+    centered_t = centered.T.tocsr()
+    safe_norms = np.where(norms == 0, np.inf, norms)
+    n_jobs = min(resolve_n_jobs(n_jobs), -(-n_users // block_size))
+
+    if n_jobs > 1:
+        yield from _iter_blocks_parallel(centered, centered_t, safe_norms, block_size, n_jobs, reduce)
+        return
+
+    for start in range(0, n_users, block_size):
+        end = min(start + block_size, n_users)
+        block = _similarity_block(centered, centered_t, safe_norms, start, end)
+        yield start, end, block if reduce is None else reduce(block, start)
+
+
+# 子进程中附加的共享内存及由其重建的矩阵（进程池初始化时设置）
+_worker_state = {}
+
+
+def _attach_shared(name):
+    """在子进程中附加共享内存块（由主进程负责释放）"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python 3.13以前没有track参数；子进程与主进程共用同一个资源跟踪器，重复登记不影响释放
+        return shared_memory.SharedMemory(name=name)
+
+
+def _init_block_worker(layout):
+    """进程池初始化: 附加共享内存中的数组并重建CSR矩阵（不复制数据）"""
+    arrays = {}
+    for key, (name, shape, dtype) in layout['arrays'].items():
+        shm = _attach_shared(name)
+        _worker_state.setdefault('segments', []).append(shm)
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _worker_state['centered'] = sp.csr_matrix(
+        (arrays['data'], arrays['indices'], arrays['indptr']), shape=layout['shape'], copy=False)
+    _worker_state['centered_t'] = sp.csr_matrix(
+        (arrays['t_data'], arrays['t_indices'], arrays['t_indptr']), shape=layout['shape'][::-1], copy=False)
+    _worker_state['safe_norms'] = arrays['safe_norms']
+
+
+def _block_task(start, end, reduce):
+    block = _similarity_block(_worker_state['centered'], _worker_state['centered_t'],
+                              _worker_state['safe_norms'], start, end)
+    return start, end, block if reduce is None else reduce(block, start)
+
+
+def _iter_blocks_parallel(centered, centered_t, safe_norms, block_size, n_jobs, reduce):
+    """
+    多进程分块计算: 中心化矩阵（及其转置）的CSR数组放入共享内存，各进程只读访问，
+    任务按行块分发，结果按行号顺序返回；同时在途的块不超过2×n_jobs个，控制主进程内存
+    """
+    sources = {
+        'data': centered.data, 'indices': centered.indices, 'indptr': centered.indptr,
+        't_data': centered_t.data, 't_indices': centered_t.indices, 't_indptr': centered_t.indptr,
+        'safe_norms': safe_norms,
+    }
+    segments = []
+    try:
+        layout = {'shape': centered.shape, 'arrays': {}}
+        for key, array in sources.items():
+            array = np.ascontiguousarray(array)
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            segments.append(shm)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+            layout['arrays'][key] = (shm.name, array.shape, array.dtype.str)
+
+        n_users = centered.shape[0]
+        bounds = [(start, min(start + block_size, n_users)) for start in range(0, n_users, block_size)]
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_block_worker,
+                                 initargs=(layout,)) as executor:
+            pending = []
+            for start, end in bounds:
+                pending.append(executor.submit(_block_task, start, end, reduce))
+                if len(pending) >= 2 * n_jobs:
+                    yield pending.pop(0).result()
+            for future in pending:
+                yield future.result()
+    finally:
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+
+
+def top_k_from_block(block, start, k):
+    """
+    从相似度块中提取每行的TopK邻居（按相似度降序）
+
+    参数:
+        block (ndarray): 相似度块（行:块内用户, 列:全部用户）
+        start (int): 块首行对应的全局用户位置
+        k (int): 保留的邻居数量（不能超过用户数-1）
+
+    返回:
+        ids (ndarray[int32]): 邻居用户位置
+        sims (ndarray[float32]): 对应相似度
+    """
+    rows = np.arange(block.shape[0])
+    candidates = block.copy()
+    candidates[rows, start + rows] = -np.inf  # 自身永远不作为邻居
+
+    top = np.argpartition(-candidates, k - 1, axis=1)[:, :k]
+    top_sims = np.take_along_axis(candidates, top, axis=1)
+    order = np.argsort(-top_sims, axis=1, kind='stable')
+
+    ids = np.take_along_axis(top, order, axis=1).astype(np.int32)
+    sims = np.take_along_axis(top_sims, order, axis=1).astype(np.float32)
+    return ids, sims
+
+
+def build_neighbor_index(centered, norms, k, block_size, n_jobs=1):
+    """
+    分块构建每个用户的TopK邻居表，全程不生成完整的 N × N 相似度矩阵
+
+    n_jobs > 1 时各行块的TopK选取在子进程中完成，只传回 block_size × k 的结果
+
+    返回:
+        ids (ndarray[int32]): 形状 (N, k) 的邻居用户位置，按相似度降序
+        sims (ndarray[float32]): 形状 (N, k) 的邻居相似度
+    """
+    n_users = centered.shape[0]
+    k = min(k, n_users - 1)
+    ids = np.zeros((n_users, k), dtype=np.int32)
+    sims = np.zeros((n_users, k), dtype=np.float32)
+    if k <= 0:
+        return ids, sims
+
+    blocks = iter_similarity_blocks(centered, norms, block_size, n_jobs, partial(top_k_from_block, k=k))
+    for start, end, (block_ids, block_sims) in blocks:
+        ids[start:end], sims[start:end] = block_ids, block_sims
+    return ids, sims
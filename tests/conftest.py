@@ -0,0 +1,8 @@
+"""
+测试公共配置: 项目根目录加入导入路径（模块均位于根目录）
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,87 @@
+"""
+Redis分块缓存加载测试
+分块以MGET批量取回并并行解码；某个分块损坏（CRC32校验失败）或缺失时不返回错误数据，回退到重新计算
+"""
+
+import numpy as np
+import pytest
+
+from benchmarks.fake_redis import FakeRedis
+from benchmarks.synthetic import make_dataset
+from data_loader import preprocess_data
+from recommender import UserCFRecommender
+
+
+def make_recommender(client, **kwargs):
+    movies, ratings = make_dataset(n_users=90, n_movies=50, density=0.15, seed=5)
+    _, user_movie_ratings, movie_info = preprocess_data(movies, ratings, sparse=True)
+    rec = UserCFRecommender(user_movie_ratings, movie_info, cache_dir=None, cache_codec='none', **kwargs)
+    rec.redis_client = client
+    rec.chunk_size = 20  # 多个分块，并跨越多个MGET批次
+    rec.fetch_batch = 2
+    return rec
+
+
+@pytest.fixture
+def published():
+    """已把完整相似度矩阵分块发布到Redis替身的推荐器"""
+    client = FakeRedis()
+    writer = make_recommender(client)
+    writer.calculate_similarity()
+    return client, writer
+
+
+def chunk_keys(client):
+    return sorted((key for key in client.store if ':chunk_' in key), key=lambda key: int(key.rsplit('_', 1)[1]))
+
+
+def count_builds(rec, monkeypatch):
+    builds = []
+    real_build = rec._build_similarity
+
+    def build():
+        builds.append(1)
+        real_build()
+
+    monkeypatch.setattr(rec, '_build_similarity', build)
+    return builds
+
+
+def test_load_from_chunks(published, monkeypatch):
+    client, writer = published
+    assert len(chunk_keys(client)) == 5
+    reader = make_recommender(client)
+    builds = count_builds(reader, monkeypatch)
+    reader.calculate_similarity()
+    assert not builds
+    np.testing.assert_array_equal(reader.user_similarity, writer.user_similarity)
+
+
+def test_corrupted_chunk_falls_back_to_recompute(published, monkeypatch):
+    client, writer = published
+    key = chunk_keys(client)[3]
+    data = bytearray(client.store[key])
+    data[-5] ^= 0xFF  # 未压缩的数据区中的一个字节，解码本身不会出错
+    client.store[key] = bytes(data)
+
+    reader = make_recommender(client)
+    with pytest.raises(ValueError, match="校验失败"):
+        reader._load_matrix_chunks()
+
+    builds = count_builds(reader, monkeypatch)
+    reader.calculate_similarity()
+    assert builds == [1]
+    np.testing.assert_array_equal(reader.user_similarity, writer.user_similarity)
+    # 重新计算后重新发布，损坏的分块被覆盖
+    assert client.store[key] != bytes(data)
+
+
+def test_missing_chunk_falls_back_to_recompute(published, monkeypatch):
+    client, writer = published
+    del client.store[chunk_keys(client)[1]]
+
+    reader = make_recommender(client)
+    builds = count_builds(reader, monkeypatch)
+    reader.calculate_similarity()
+    assert builds == [1]
+    np.testing.assert_array_equal(reader.user_similarity, writer.user_similarity)
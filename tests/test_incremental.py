@@ -0,0 +1,96 @@
+"""
+评分增量更新的一致性测试
+新增、修改、删除评分以及新用户、新电影，增量更新后的相似度与基于同样评分的全量构建一致
+（完整矩阵、TopK邻居表、lazy模式的相似度行缓存）
+"""
+
+import numpy as np
+
+from benchmarks.synthetic import make_dataset
+from data_loader import preprocess_data
+from recommender import UserCFRecommender
+
+NEW_USER = 999999
+NEW_MOVIE = 888888
+
+
+def make_recommender(user_movie_ratings, movie_info, **kwargs):
+    rec = UserCFRecommender(user_movie_ratings, movie_info, cache_dir=None, **kwargs)
+    rec.redis_client = None
+    return rec
+
+
+def build(**kwargs):
+    """每个测试使用独立的评分矩阵（增量更新会修改它）"""
+    movies, ratings = make_dataset(n_users=120, n_movies=60, density=0.15, seed=11)
+    _, user_movie_ratings, movie_info = preprocess_data(movies, ratings, sparse=True)
+    return ratings, make_recommender(user_movie_ratings, movie_info, **kwargs)
+
+
+def full_rebuild(rec, **kwargs):
+    fresh = make_recommender(rec.user_movie_ratings, rec.movie_info, **kwargs)
+    fresh.calculate_similarity()
+    return fresh
+
+
+def rating_changes(ratings):
+    """依次执行的评分变更: (说明, 用户ID, 电影ID, 评分)，评分为None表示删除"""
+    user_id = int(ratings['user_id'].iloc[0])
+    rated = ratings.loc[ratings['user_id'] == user_id, 'movie_id'].astype(int).tolist()
+    unrated = sorted(set(ratings['movie_id'].astype(int)) - set(rated))
+    other_user = int(ratings['user_id'].iloc[-1])
+    return [
+        ('新增评分', user_id, unrated[0], 9.0),
+        ('修改评分', user_id, rated[0], 1.0),
+        ('删除评分', user_id, rated[1], None),
+        ('新用户', NEW_USER, rated[2], 8.0),
+        ('新用户的第二条评分', NEW_USER, unrated[1], 3.0),
+        ('新电影', other_user, NEW_MOVIE, 7.0),
+        ('新电影的第二条评分', user_id, NEW_MOVIE, 2.0),
+    ]
+
+
+def apply_change(rec, user_id, movie_id, rating):
+    if rating is None:
+        rec.remove_rating(user_id, movie_id)
+    else:
+        rec.apply_rating(user_id, movie_id, rating)
+
+
+def test_full_matrix_matches_rebuild():
+    ratings, rec = build()
+    rec.calculate_similarity()
+    for label, user_id, movie_id, rating in rating_changes(ratings):
+        apply_change(rec, user_id, movie_id, rating)
+        expected = full_rebuild(rec).user_similarity
+        assert rec.user_similarity.shape == expected.shape, label
+        np.testing.assert_allclose(rec.user_similarity, expected, atol=1e-6, err_msg=label)
+
+
+def test_top_k_matches_rebuild():
+    ratings, rec = build(neighbor_k=10)
+    rec.calculate_similarity()
+    for label, user_id, movie_id, rating in rating_changes(ratings):
+        apply_change(rec, user_id, movie_id, rating)
+        expected = full_rebuild(rec, neighbor_k=10)
+        assert rec.neighbor_ids.shape == expected.neighbor_ids.shape, label
+        np.testing.assert_allclose(rec.neighbor_sims, expected.neighbor_sims, atol=1e-6, err_msg=label)
+        # 相似度相同的邻居顺序可能不同：检查表中每个邻居的相似度与完整矩阵一致
+        similarity = full_rebuild(rec).user_similarity
+        listed = np.take_along_axis(similarity, rec.neighbor_ids.astype(np.int64), axis=1)
+        np.testing.assert_allclose(listed, rec.neighbor_sims, atol=1e-6, err_msg=label)
+
+
+def test_lazy_row_cache_matches_rebuild():
+    ratings, rec = build(similarity_mode='lazy')
+    cached_users = range(0, 40, 3)
+    for user_idx in cached_users:
+        rec._lazy_similarity_row(user_idx)
+    for label, user_id, movie_id, rating in rating_changes(ratings):
+        apply_change(rec, user_id, movie_id, rating)
+        expected = full_rebuild(rec).user_similarity
+        changed_idx = rec.user_movie_ratings.user_loc(user_id)
+        for user_idx in [*cached_users, changed_idx]:
+            assert user_idx in rec._row_cache, label
+            np.testing.assert_allclose(rec._row_cache[user_idx], expected[user_idx], atol=1e-6,
+                                       err_msg=f"{label}: 用户位置{user_idx}")
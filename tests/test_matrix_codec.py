@@ -0,0 +1,75 @@
+"""
+二进制缓存格式测试
+每种可用的压缩编码与每种存储精度编码后再解码，头部记录的dtype、形状和数据完整还原
+"""
+
+import json
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from matrix_codec import MAGIC, available_codecs, decode_array, encode_array
+from similarity import SIMILARITY_DTYPES, quantize_similarity
+
+
+def similarity_block(shape, seed=0):
+    return np.random.default_rng(seed).uniform(-1.0, 1.0, shape)
+
+
+@pytest.mark.parametrize('precision', list(SIMILARITY_DTYPES))
+@pytest.mark.parametrize('codec', available_codecs())
+def test_round_trip(codec, precision):
+    array = quantize_similarity(similarity_block((37, 53)), precision)
+    data = encode_array(array, codec)
+    assert data.startswith(MAGIC)
+
+    decoded = decode_array(data)
+    assert decoded.dtype == array.dtype
+    assert decoded.shape == array.shape
+    np.testing.assert_array_equal(decoded, array)
+
+
+@pytest.mark.parametrize('codec', available_codecs())
+@pytest.mark.parametrize('shape', [(0, 5), (1,), (4, 3, 2)])
+def test_round_trip_shapes(codec, shape):
+    array = np.arange(int(np.prod(shape)), dtype=np.int32).reshape(shape)
+    decoded = decode_array(encode_array(array, codec))
+    assert decoded.dtype == np.int32 and decoded.shape == shape
+    np.testing.assert_array_equal(decoded, array)
+
+
+def test_non_contiguous_input():
+    array = similarity_block((20, 30))[:, ::3]
+    np.testing.assert_array_equal(decode_array(encode_array(array, 'zlib')), array)
+
+
+def test_uncompressed_decode_is_zero_copy_view():
+    array = similarity_block((10, 10))
+    data = encode_array(array, 'none')
+    decoded = decode_array(data)
+    assert not decoded.flags.writeable
+    assert np.shares_memory(decoded, np.frombuffer(data, dtype=np.uint8))
+
+
+def test_legacy_json_format():
+    legacy = zlib.compress(json.dumps([[1.0, 0.5], [0.5, 1.0]]).encode('utf-8'))
+    np.testing.assert_array_equal(decode_array(legacy), [[1.0, 0.5], [0.5, 1.0]])
+
+
+def test_unsupported_version_and_codec():
+    data = bytearray(encode_array(np.ones(3), 'zlib'))
+    data[len(MAGIC)] = 99  # 版本号
+    with pytest.raises(ValueError):
+        decode_array(bytes(data))
+    with pytest.raises(ValueError):
+        encode_array(np.ones(3), 'brotli')
+
+
+def test_header_layout():
+    data = encode_array(np.zeros((2, 3), dtype=np.float16), 'none')
+    magic, version, codec_id, ndim, dtype = struct.unpack_from('<4sBBB8s', data, 0)
+    assert (magic, codec_id, ndim) == (MAGIC, 0, 2)
+    assert dtype.rstrip(b'\0') == np.dtype(np.float16).str.encode('ascii')
+    assert struct.unpack_from('<QQ', data, struct.calcsize('<4sBBB8s')) == (2, 3)
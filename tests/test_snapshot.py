@@ -0,0 +1,84 @@
+"""
+列式快照测试
+文本列不经过pickle编码（含缺失值和非ASCII字符），数值/日期列原样还原；
+CSV文件的修改时间或大小变化后 load_table 重新解析并重建快照
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_loader import load_table, read_snapshot, write_snapshot
+
+
+def sample_frame():
+    return pd.DataFrame({
+        'movie_id': np.array([1, 2, 3, 4], dtype=np.int64),
+        'title': ['肖申克的救赎', None, 'Amélie', ''],
+        'genre': ['Drama', 'Comedy, Romance', np.nan, 'Ação 🎬'],
+        'rating': [9.3, np.nan, 8.3, 7.0],
+        'timestamp': pd.to_datetime(['2020-01-01', '2021-06-30', None, '1999-12-31']),
+    })
+
+
+def write_csv(path, frame):
+    frame.to_csv(path, index=False)
+
+
+def test_round_trip_text_and_missing_values(tmp_path):
+    frame = sample_frame()
+    csv_path = tmp_path / 'movies.csv'
+    write_csv(csv_path, frame)
+    snapshot_dir = str(tmp_path / 'snapshot')
+
+    write_snapshot(frame, snapshot_dir, {'mtime_ns': os.stat(csv_path).st_mtime_ns,
+                                         'size': os.stat(csv_path).st_size})
+    restored = read_snapshot(str(csv_path), snapshot_dir)
+    assert restored is not None
+    pd.testing.assert_frame_equal(restored, frame)
+    assert restored['title'].isna().tolist() == [False, True, False, False]
+    # 所有列文件都能以 allow_pickle=False 读取（文本列不是对象数组）
+    for filename in os.listdir(snapshot_dir):
+        if filename.endswith(('.npy', '.npz')):
+            np.load(os.path.join(snapshot_dir, filename), allow_pickle=False)
+
+
+def test_mixed_object_column_is_not_snapshotted(tmp_path):
+    frame = pd.DataFrame({'value': ['a', 1, None]})
+    with pytest.raises(ValueError):
+        write_snapshot(frame, str(tmp_path / 'snapshot'), {'mtime_ns': 1, 'size': 1})
+    assert not any(name.endswith(('.npy', '.npz')) for name in os.listdir(tmp_path / 'snapshot'))
+
+
+def test_load_table_uses_snapshot_until_csv_changes(tmp_path):
+    csv_path = str(tmp_path / 'movies.csv')
+    snapshot_dir = str(tmp_path / 'snapshot')
+    write_csv(csv_path, sample_frame().drop(columns='timestamp'))
+    prepared = []
+
+    def prepare(df):
+        prepared.append(len(df))
+        return df
+
+    first = load_table(csv_path, prepare, snapshot_dir)
+    second = load_table(csv_path, prepare, snapshot_dir)
+    assert prepared == [4]  # 第二次直接读取快照
+    pd.testing.assert_frame_equal(second, first)
+
+    # 只修改时间变化（内容与大小不变）也视为过期
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    load_table(csv_path, prepare, snapshot_dir)
+    assert prepared == [4, 4]
+
+    # 内容变化后读到新数据，旧版本的列文件被删除
+    old_files = set(os.listdir(snapshot_dir))
+    write_csv(csv_path, sample_frame().drop(columns='timestamp').iloc[:2])
+    third = load_table(csv_path, prepare, snapshot_dir)
+    assert prepared == [4, 4, 2]
+    assert len(third) == 2
+    pd.testing.assert_frame_equal(load_table(csv_path, prepare, snapshot_dir), third)
+    assert prepared == [4, 4, 2]
+    assert not (old_files - {'meta.json'}) & set(os.listdir(snapshot_dir))
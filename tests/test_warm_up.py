@@ -0,0 +1,136 @@
+"""
+预热期间评分变更的一致性测试
+TopK邻居表在后台构建时应用评分变更，构建结果不能以新数据的指纹保存或被当作最新结果使用；
+ALS模型训练期间的评分变更在模型发布时补做fold-in
+"""
+
+import threading
+
+import numpy as np
+
+import als_recommender as als_module
+import recommender as recommender_module
+from benchmarks.synthetic import make_dataset
+from data_loader import preprocess_data
+from als_recommender import ALSRecommender
+from recommender import UserCFRecommender
+
+
+def make_recommender(movies, ratings, cache_dir):
+    _, user_movie_ratings, movie_info = preprocess_data(movies, ratings, sparse=True)
+    rec = UserCFRecommender(user_movie_ratings, movie_info, neighbor_k=10, cache_dir=cache_dir)
+    rec.redis_client = None  # 只使用本地文件缓存
+    return rec
+
+
+def test_rating_changes_during_top_k_warm_up(tmp_path, monkeypatch):
+    movies, ratings = make_dataset(n_users=150, n_movies=80, density=0.1, seed=7)
+    rec = make_recommender(movies, ratings, str(tmp_path))
+
+    # 第一次构建在计算邻居表时暂停，等评分变更全部应用后再继续
+    started, release = threading.Event(), threading.Event()
+    real_build = recommender_module.build_neighbor_index
+    calls = []
+
+    def slow_build(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            started.set()
+            release.wait(10)
+        return real_build(*args, **kwargs)
+
+    monkeypatch.setattr(recommender_module, 'build_neighbor_index', slow_build)
+    warm_up = threading.Thread(target=rec.warm_up)
+    warm_up.start()
+    assert started.wait(10)
+
+    rng = np.random.default_rng(0)
+    user_ids = ratings['user_id'].unique()
+    movie_ids = ratings['movie_id'].unique()
+    for _ in range(15):
+        rec.apply_rating(int(rng.choice(user_ids)), int(rng.choice(movie_ids)), float(rng.integers(1, 11)))
+    release.set()
+    warm_up.join(30)
+    assert not warm_up.is_alive()
+    assert len(calls) == 2  # 过期的结果被丢弃并基于最新评分重新构建
+
+    # 与基于同样评分的全新构建一致
+    fresh = UserCFRecommender(rec.user_movie_ratings, rec.movie_info, neighbor_k=10, cache_dir=None)
+    fresh.redis_client = None
+    fresh.calculate_similarity()
+    assert rec._similarity_built()
+    np.testing.assert_allclose(rec.neighbor_sims, fresh.neighbor_sims, atol=1e-6)
+
+    # 本地缓存中当前指纹对应的文件也是最新结果（其他worker会直接加载它）
+    other = make_recommender(movies, ratings, str(tmp_path))
+    other.user_movie_ratings = rec.user_movie_ratings
+    assert other._load_local_cache()
+    np.testing.assert_allclose(other.neighbor_sims, fresh.neighbor_sims, atol=1e-6)
+
+
+def test_rating_changes_during_als_training(tmp_path, monkeypatch):
+    movies, ratings = make_dataset(n_users=150, n_movies=80, density=0.1, seed=7)
+    _, user_movie_ratings, movie_info = preprocess_data(movies, ratings, sparse=True)
+    model = ALSRecommender(user_movie_ratings, movie_info, factors=4, iterations=2, cache_dir=str(tmp_path))
+
+    # 训练在求解因子时暂停，期间写入评分（包括新用户和新电影）
+    started, release = threading.Event(), threading.Event()
+    real_solve = als_module._solve_side
+
+    def slow_solve(*args, **kwargs):
+        started.set()
+        release.wait(10)
+        return real_solve(*args, **kwargs)
+
+    monkeypatch.setattr(als_module, '_solve_side', slow_solve)
+    warm_up = threading.Thread(target=model.warm_up)
+    warm_up.start()
+    assert started.wait(10)
+
+    changed = [(int(ratings['user_id'].iloc[i]), int(ratings['movie_id'].iloc[i])) for i in range(0, 50, 10)]
+    for user_id, movie_id in changed:
+        model.apply_rating(user_id, movie_id, 10.0)
+    model.apply_rating(999999, 888888, 9.0)
+    release.set()
+    warm_up.join(30)
+    assert not warm_up.is_alive()
+
+    # 训练期间变化的用户在模型发布时全部补做了fold-in
+    assert not model._pending_users
+    assert model.user_factors.shape[0] == model.user_movie_ratings.shape[0]
+    assert model.item_factors.shape[0] == model.user_movie_ratings.shape[1]
+    ratings_matrix = model.user_movie_ratings
+    for user_id, _ in changed + [(999999, None)]:
+        user_idx = ratings_matrix.user_loc(user_id)
+        before = model.user_factors[user_idx].copy()
+        model._fold_in_user(user_idx)
+        np.testing.assert_allclose(model.user_factors[user_idx], before, atol=1e-5)
+
+
+def test_lazy_batch_build_includes_concurrent_rating_changes(monkeypatch):
+    movies, ratings = make_dataset(n_users=150, n_movies=80, density=0.1, seed=7)
+    _, user_movie_ratings, movie_info = preprocess_data(movies, ratings, sparse=True)
+    rec = UserCFRecommender(user_movie_ratings, movie_info, neighbor_k=10, cache_dir=None, similarity_mode='lazy')
+    rec.redis_client = None
+
+    # 批量接口触发的同步构建进行中时写入一条评分
+    real_build = recommender_module.build_neighbor_index
+    calls = []
+    user_id, movie_id = int(ratings['user_id'].iloc[0]), int(ratings['movie_id'].iloc[-1])
+
+    def build_with_change(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            rec.apply_rating(user_id, movie_id, 1.0)
+        return real_build(*args, **kwargs)
+
+    monkeypatch.setattr(recommender_module, 'build_neighbor_index', build_with_change)
+    batch = dict(rec.recommend_batch([user_id], k=5, n=10, min_similarity=0.0))
+    assert len(calls) == 2
+
+    fresh = UserCFRecommender(rec.user_movie_ratings, movie_info, neighbor_k=10, cache_dir=None)
+    fresh.redis_client = None
+    fresh.calculate_similarity()
+    np.testing.assert_allclose(rec.neighbor_sims, fresh.neighbor_sims, atol=1e-6)
+    expected = dict(fresh.recommend_batch([user_id], k=5, n=10, min_similarity=0.0))
+    assert [r['movie_id'] for r in batch[user_id]] == [r['movie_id'] for r in expected[user_id]]